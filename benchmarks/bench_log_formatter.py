@@ -0,0 +1,110 @@
+#
+#   Thiscovery API - THIS Institute’s citizen science platform
+#   Copyright (C) 2021 THIS Institute
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   A copy of the GNU Affero General Public License is available in the
+#   docs folder of this project.  It is also available www.gnu.org/licenses/
+#
+"""
+Compares the throughput (records per second) of the log formatters available to
+utilities.get_logger, for a small record and for a record carrying a DynamoDB-like
+item as extra.
+
+Usage (from the repository root):
+    python benchmarks/bench_log_formatter.py [--records N]
+"""
+
+import argparse
+import datetime
+import decimal
+import logging
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thiscovery_lib.utilities as utils  # noqa: E402
+
+
+def jsonlogger_formatter():
+    from pythonjsonlogger import jsonlogger
+
+    formatter = jsonlogger.JsonFormatter(
+        "%(asctime)s %(module)s %(funcName)s %(lineno)d %(name)-2s %(levelname)-8s %(message)s"
+    )
+    formatter.default_msec_format = "%s.%03d"
+    return formatter
+
+
+def fast_formatter_without_orjson():
+    formatter = utils.FastJsonFormatter()
+    formatter._dumps_fast = None
+    return formatter
+
+
+FORMATTERS = {
+    "jsonlogger.JsonFormatter": jsonlogger_formatter,
+    "FastJsonFormatter (orjson)": utils.FastJsonFormatter,
+    "FastJsonFormatter (json)": fast_formatter_without_orjson,
+}
+
+
+def make_record(**extra):
+    record = logging.LogRecord(
+        "thiscovery", logging.INFO, __file__, 1, "Dynamodb item", (), None
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+RECORDS = {
+    "small": make_record(correlation_id=str(uuid.uuid4())),
+    "item": make_record(
+        correlation_id=str(uuid.uuid4()),
+        item={
+            "id": str(uuid.uuid4()),
+            "created": datetime.datetime.now(datetime.timezone.utc),
+            "details": {
+                f"field_{i}": {"value": decimal.Decimal(i), "tags": ["a", "b", "c"]}
+                for i in range(20)
+            },
+        },
+    ),
+}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--records", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    print(f"{'formatter':30} {'record':>8} {'records/s':>12}")
+    for formatter_name, factory in FORMATTERS.items():
+        formatter = factory()
+        for record_name, record in RECORDS.items():
+            try:
+                seconds = timeit.timeit(
+                    lambda: formatter.format(record), number=args.records
+                )
+            except Exception as err:
+                print(f"{formatter_name:30} {record_name:>8} {repr(err):>12}")
+                continue
+            print(
+                f"{formatter_name:30} {record_name:>8} {args.records / seconds:>12,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#
+#   Thiscovery API - THIS Institute’s citizen science platform
+#   Copyright (C) 2021 THIS Institute
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   A copy of the GNU Affero General Public License is available in the
+#   docs folder of this project.  It is also available www.gnu.org/licenses/
+#
+"""
+Compares the time taken to redact several key paths of a large (multi-MB) lambda
+event with utilities.RedactionPlan, in place and copy-on-write, against deep
+copying the event and masking each path with a separate traversal.
+
+Usage (from the repository root):
+    python benchmarks/bench_redaction.py [--users N] [--repeat N]
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thiscovery_lib.utilities as utils  # noqa: E402
+
+PATHS = [
+    "headers.Authorization",
+    "body.email",
+    "body.users.*.email",
+    "body.users.*.first_name",
+    "body.users.*.last_name",
+    "body.users.*.tokens.*",
+]
+
+
+def make_event(users):
+    return {
+        "headers": {"Authorization": "Bearer token", "Accept": "application/json"},
+        "body": {
+            "email": "admin@thiscovery.org",
+            "users": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "email": f"user{i}@thiscovery.org",
+                    "first_name": "Ann",
+                    "last_name": "Example",
+                    "tokens": [str(uuid.uuid4()) for _ in range(3)],
+                    "projects": [{"id": str(uuid.uuid4()), "status": "active"}] * 3,
+                }
+                for i in range(users)
+            ],
+        },
+    }
+
+
+def mask_path(value, path):
+    """
+    Masks a single path (with wildcards) in its own traversal
+    """
+    if not path:
+        return
+    key, rest = path[0], path[1:]
+    if isinstance(value, dict):
+        keys = list(value) if key == "*" else [key] if key in value else []
+        for k in keys:
+            if rest:
+                mask_path(value[k], rest)
+            else:
+                value[k] = utils.RedactionPlan.MASK
+    elif isinstance(value, list) and key == "*":
+        for index in range(len(value)):
+            if rest:
+                mask_path(value[index], rest)
+            else:
+                value[index] = utils.RedactionPlan.MASK
+
+
+def deepcopy_and_mask_each_path(event):
+    event = copy.deepcopy(event)
+    for path in PATHS:
+        mask_path(event, path.split("."))
+    return event
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--users", type=int, default=10000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    event = make_event(args.users)
+    size_mb = len(json.dumps(event)) / 1e6
+    plan = utils.RedactionPlan(PATHS)
+    assert plan.apply(event, copy=True) == deepcopy_and_mask_each_path(event)
+
+    # in place redaction is timed on a fresh copy of the event, made in the setup
+    # of each run
+    fresh = dict()
+
+    def copy_event():
+        fresh["event"] = copy.deepcopy(event)
+
+    strategies = {
+        "deepcopy + one traversal per path": (
+            lambda: deepcopy_and_mask_each_path(event)
+        ),
+        "RedactionPlan (copy-on-write)": lambda: plan.apply(event, copy=True),
+        "RedactionPlan (in place)": lambda: plan.apply(fresh["event"]),
+    }
+    print(f"event of {size_mb:.1f} MB, {len(PATHS)} paths")
+    print(f"{'strategy':40} {'ms':>10}")
+    for name, strategy in strategies.items():
+        seconds = min(
+            timeit.repeat(strategy, setup=copy_event, number=1, repeat=args.repeat)
+        )
+        print(f"{name:40} {seconds * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
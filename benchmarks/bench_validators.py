@@ -0,0 +1,103 @@
+#
+#   Thiscovery API - THIS Institute’s citizen science platform
+#   Copyright (C) 2021 THIS Institute
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   A copy of the GNU Affero General Public License is available in the
+#   docs folder of this project.  It is also available www.gnu.org/licenses/
+#
+"""
+Measures the cost per value (in microseconds) of the validators in utilities, using
+their fast path and the original implementation they fall back to, as well as the
+cost of validating a whole column with validate_values.
+
+Usage (from the repository root):
+    python benchmarks/bench_validators.py [--values N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thiscovery_lib.utilities as utils  # noqa: E402
+
+
+def original_validate_uuid(s):
+    uuid.UUID(s, version=4)
+    if uuid.UUID(s).version != 4:
+        raise ValueError("uuid is not version 4")
+    return s
+
+
+def original_validate_utc_datetime(s):
+    from dateutil import parser
+
+    parser.isoparse(s)
+    return s
+
+
+def original_validate_url(s):
+    import validators
+
+    if not validators.url(s):
+        raise ValueError("invalid url")
+    return s
+
+
+VALUES = {
+    "uuid": lambda i: str(uuid.uuid4()),
+    "datetime": lambda i: f"2021-06-12 16:{i % 60:02d}:56.087895+00:00",
+    "url": lambda i: f"https://www.thiscovery.org/projects/{i}?source=email",
+}
+
+VALIDATORS = {
+    "uuid": (original_validate_uuid, utils.validate_uuid),
+    "datetime": (original_validate_utc_datetime, utils.validate_utc_datetime),
+    "url": (original_validate_url, utils.validate_url),
+}
+
+
+def microseconds_per_value(func, values):
+    seconds = timeit.timeit(lambda: func(values), number=1)
+    return seconds * 1e6 / len(values)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--values", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    print(f"{'value':10} {'original':>10} {'fast path':>10} {'validate_values':>16}")
+    for name, make_value in VALUES.items():
+        values = [make_value(i) for i in range(args.values)]
+        original, fast = VALIDATORS[name]
+        # warm up imports and caches
+        original(values[0])
+        fast(values[0])
+        original_cost = microseconds_per_value(
+            lambda vs: [original(v) for v in vs], values
+        )
+        fast_cost = microseconds_per_value(lambda vs: [fast(v) for v in vs], values)
+        batch_cost = microseconds_per_value(
+            lambda vs: utils.validate_values(vs, fast), values
+        )
+        print(
+            f"{name:10} {original_cost:>10.2f} {fast_cost:>10.2f} {batch_cost:>16.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#
+#   Thiscovery API - THIS Institute’s citizen science platform
+#   Copyright (C) 2021 THIS Institute
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   A copy of the GNU Affero General Public License is available in the
+#   docs folder of this project.  It is also available www.gnu.org/licenses/
+#
+"""
+Reports the cold import time of each thiscovery_lib module, as measured by
+python -X importtime in a fresh interpreter.
+
+Usage (from the repository root):
+    python benchmarks/import_time.py [--runs N] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "thiscovery_lib.utilities",
+    "thiscovery_lib.entity_base",
+    "thiscovery_lib.countries_utilities",
+    "thiscovery_lib.thiscovery_api_utilities",
+    "thiscovery_lib.core_api_utilities",
+    "thiscovery_lib.qualtrics",
+    "thiscovery_lib.sendgrid_utilities",
+    "thiscovery_lib.dynamodb_utilities",
+]
+
+
+def cumulative_import_us(module_name):
+    """
+    Returns:
+        Cumulative import time of module_name in microseconds, and the number of
+        modules imported as a result
+    """
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True,
+        text=True,
+        cwd=repo_root,
+        check=True,
+    )
+    lines = [x for x in result.stderr.splitlines() if x.startswith("import time:")]
+    for line in reversed(lines):
+        # line format is "import time: <self us> | <cumulative us> | <module name>"
+        fields = [x.strip() for x in line[len("import time:") :].split("|")]
+        if fields[2] == module_name:
+            return int(fields[1]), len(lines)
+    raise ValueError(f"{module_name} not found in -X importtime output")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    print(f"{'module':45} {'median ms':>10} {'modules loaded':>15}")
+    for module_name in args.modules:
+        timings = list()
+        for _ in range(args.runs):
+            cumulative_us, modules_loaded = cumulative_import_us(module_name)
+            timings.append(cumulative_us)
+        print(
+            f"{module_name:45} {statistics.median(timings) / 1000:>10.1f} {modules_loaded:>15}"
+        )
+
+
+if __name__ == "__main__":
+    main()
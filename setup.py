@@ -20,6 +20,10 @@ setuptools.setup(
         "validators",
         "sendgrid",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "logging": ["orjson"],
+    },
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/THIS-Labs/thiscovery-lib",
@@ -32,5 +36,5 @@ setuptools.setup(
         "License :: OSI Approved :: GNU Affero General Public License v3",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
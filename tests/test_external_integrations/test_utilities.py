@@ -17,8 +17,20 @@
 #
 import local.dev_config  # sets env variables TEST_ON_AWS and AWS_TEST_API
 import local.secrets  # sets env variables THISCOVERY_AFS25_PROFILE and THISCOVERY_AMP205_PROFILE
+import contextlib
+import copy
+import datetime
+import decimal
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
 import thiscovery_lib.utilities as utils
 from unittest import TestCase
+from unittest.mock import patch
 
 import thiscovery_dev_tools.testing_tools as test_utils
 
@@ -87,6 +99,70 @@ class TestValidateUtcDatetime(TestCase):
         dt = "this is not a datetime"
         self.assertRaises(DetailedValueError, validate_utc_datetime, dt)
 
+    def test_validate_utc_datetime_fail_offset_minutes(self):
+        from thiscovery_lib.utilities import validate_utc_datetime, DetailedValueError
+
+        for offset in ["+01:60", "+0160", "-01:60", "+00:99"]:
+            dt = f"2018-06-12T16:16:56{offset}"
+            self.assertRaises(DetailedValueError, validate_utc_datetime, dt)
+        self.assertEqual(
+            "2018-06-12T16:16:56+05:30",
+            validate_utc_datetime("2018-06-12T16:16:56+05:30"),
+        )
+
+
+class TestValidateUrl(TestCase):
+    def test_validate_url_ok(self):
+        for url in [
+            "https://www.thiscovery.org/",
+            "https://www.thiscovery.org/a/b?x=1#top",
+            "http://thiscovery.org:8000/path",
+        ]:
+            self.assertEqual(url, utils.validate_url(url))
+
+    def test_validate_url_fail(self):
+        for url in ["www.thiscovery.org", "https://", "this is not a url"]:
+            self.assertRaises(utils.DetailedValueError, utils.validate_url, url)
+
+    def test_fast_path_agrees_with_validators(self):
+        long_host = ".".join(["a" * 63] * 4) + ".org"  # 260 characters
+        for url in [f"https://{long_host}/", "https://www.thiscovery.org/?a)"]:
+            self.assertRaises(utils.DetailedValueError, utils.validate_url, url)
+
+
+class TestBatchValidation(TestCase):
+    def test_validate_values_ok(self):
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        self.assertEqual(ids, utils.validate_values(ids, utils.validate_uuid))
+
+    def test_validate_values_reports_all_failures(self):
+        ids = [str(uuid.uuid4()), "not a uuid", str(uuid.uuid1())]
+        with self.assertRaises(utils.DetailedValueError) as context:
+            utils.validate_values(ids, utils.validate_uuid)
+        invalid_values = context.exception.details["invalid_values"]
+        self.assertEqual([1, 2], [x["index"] for x in invalid_values])
+        self.assertEqual("invalid uuid", invalid_values[1]["message"])
+        self.assertEqual(ids[2], invalid_values[1]["uuid"])
+
+    def test_validate_records(self):
+        validators = {
+            "id": utils.validate_uuid,
+            "created": utils.validate_utc_datetime,
+        }
+        records = [
+            {"id": str(uuid.uuid4()), "created": "2018-06-12 16:16:56.087895+01"},
+            {"id": str(uuid.uuid4())},
+        ]
+        self.assertEqual(records, utils.validate_records(records, validators))
+        records.append({"id": "1", "created": "13:40:13"})
+        with self.assertRaises(utils.DetailedValueError) as context:
+            utils.validate_records(records, validators)
+        invalid_values = context.exception.details["invalid_values"]
+        self.assertEqual(
+            [(2, "id"), (2, "created")],
+            [(x["index"], x["field"]) for x in invalid_values],
+        )
+
 
 class TestMinimiseWhiteSpace(TestCase):
     def test_minimise_white_space_change(self):
@@ -147,6 +223,15 @@ class ApiErrorHandlerTestCase(test_utils.BaseTestCase):
         )
         self.assertEqual(HTTPStatus.BAD_REQUEST, result["statusCode"])
 
+    def test_circuit_open_error_handling(self):
+        result = raise_exception(
+            dict(),
+            utils.CircuitOpenError,
+            "circuit open error message",
+            self.details_dict,
+        )
+        self.assertEqual(HTTPStatus.SERVICE_UNAVAILABLE, result["statusCode"])
+
     def test_assertion_error_handling(self):
         result = raise_exception(
             dict(),
@@ -155,3 +240,1013 @@ class ApiErrorHandlerTestCase(test_utils.BaseTestCase):
             self.details_dict,
         )
         self.assertEqual(HTTPStatus.INTERNAL_SERVER_ERROR, result["statusCode"])
+
+
+class BaseClientCacheTestCase(test_utils.BaseTestCase):
+    def setUp(self):
+        utils.clear_client_cache()
+        utils.reset_client_cache_stats()
+
+    def test_client_reused(self):
+        client_1 = utils.BaseClient("sns")
+        client_2 = utils.BaseClient("sns")
+        self.assertIs(client_1.client, client_2.client)
+        stats = utils.get_client_cache_stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(1, stats["misses"])
+
+    def test_client_cache_opt_out(self):
+        client_1 = utils.BaseClient("sns")
+        client_2 = utils.BaseClient("sns", use_client_cache=False)
+        self.assertIsNot(client_1.client, client_2.client)
+
+    def test_clear_client_cache(self):
+        client_1 = utils.BaseClient("sns")
+        utils.clear_client_cache("sns")
+        client_2 = utils.BaseClient("sns")
+        self.assertIsNot(client_1.client, client_2.client)
+
+    def test_cache_hit_does_not_create_session(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def new_client():
+            client = utils.BaseClient("sns").client
+            return client, dict(utils._get_thread_sessions())
+
+        cached_client = utils.BaseClient("sns").client
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            client, sessions = executor.submit(new_client).result()
+        self.assertIs(cached_client, client)
+        self.assertEqual(dict(), sessions)
+
+    def test_config_keyed_by_options(self):
+        from botocore.config import Config
+
+        client_1 = utils.BaseClient("sns", config=Config(read_timeout=10))
+        client_2 = utils.BaseClient("sns", config=Config(read_timeout=10))
+        client_3 = utils.BaseClient("sns", config=Config(read_timeout=20))
+        self.assertIs(client_1.client, client_2.client)
+        self.assertIsNot(client_1.client, client_3.client)
+        self.assertEqual(2, utils.get_client_cache_stats()["size"])
+
+    def test_resources_of_finished_threads_evicted(self):
+        for _ in range(3):
+            thread = threading.Thread(
+                target=utils.BaseClient,
+                args=("dynamodb",),
+                kwargs={"client_type": "resource"},
+            )
+            thread.start()
+            thread.join()
+        stats = utils.get_client_cache_stats()
+        self.assertEqual(1, stats["size"])
+        self.assertEqual(2, stats["evictions"])
+
+
+class SessionManagementTestCase(test_utils.BaseTestCase):
+    def test_session_reused_within_thread(self):
+        self.assertIs(utils.get_session(), utils.get_session())
+
+    def test_threads_do_not_share_sessions(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        main_thread_session = utils.get_session()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            other_thread_session = executor.submit(utils.get_session).result()
+        self.assertIsNot(main_thread_session, other_thread_session)
+
+    def test_reset_sessions(self):
+        session = utils.get_session()
+        utils.reset_sessions()
+        self.assertIsNot(session, utils.get_session())
+
+
+class PrewarmTestCase(test_utils.BaseTestCase):
+    def test_prewarm_clients_and_secrets(self):
+        utils.clear_client_cache()
+        result = utils.prewarm(clients=["sns"], secrets=["aws-connection"])
+        self.assertIn("aws-api-key", result["secrets"]["aws-connection"])
+        self.assertEqual(["client:sns", "secrets"], list(result["timings"].keys()))
+        utils.reset_client_cache_stats()
+        utils.BaseClient("sns")
+        self.assertEqual(1, utils.get_client_cache_stats()["hits"])
+
+
+class SecretsCacheTestCase(test_utils.BaseTestCase):
+    def setUp(self):
+        utils.invalidate_secret_cache()
+        utils.SECRETS_CACHE.reset_stats()
+
+    def test_repeated_calls_served_from_cache(self):
+        secret_1 = utils.get_secret("aws-connection")
+        secret_2 = utils.get_secret("aws-connection")
+        self.assertEqual(secret_1, secret_2)
+        stats = utils.get_secrets_cache_stats()
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(1, stats["hits"])
+
+    def test_invalidate_secret_cache(self):
+        utils.get_secret("aws-connection")
+        utils.invalidate_secret_cache("aws-connection")
+        utils.get_secret("aws-connection")
+        self.assertEqual(2, utils.get_secrets_cache_stats()["misses"])
+
+    def test_stale_value_served_while_refreshing(self):
+        cache = utils.SecretsCache(ttl=0.01, stale_ttl=60)
+        values = iter([1, 2])
+        self.assertEqual(1, cache.get("key", lambda: next(values)))
+        time.sleep(0.02)
+        self.assertEqual(1, cache.get("key", lambda: next(values)))
+        self.assertEqual(1, cache.get_stats()["stale_hits"])
+
+    def test_cached_value_cannot_be_modified(self):
+        cache = utils.SecretsCache(ttl=60, stale_ttl=0)
+        cache.get("key", lambda: {"api-key": "secret"})["api-key"] = "changed"
+        self.assertEqual({"api-key": "secret"}, cache.get("key", lambda: None))
+        self.assertEqual({"api-key": "secret"}, cache.lookup("key")[1])
+
+    def test_key_locks_released(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        cache = utils.SecretsCache(ttl=60, stale_ttl=0)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda k: cache.get(k, lambda: k), range(20)))
+        self.assertEqual(dict(), cache._key_locks)
+
+    def test_get_secrets_batch(self):
+        secrets = utils.get_secrets(["aws-connection", "qualtrics-connection"])
+        self.assertIn("aws-api-key", secrets["aws-connection"])
+        self.assertIsNotNone(secrets["qualtrics-connection"])
+        utils.SECRETS_CACHE.reset_stats()
+        utils.get_secret("qualtrics-connection")
+        self.assertEqual(1, utils.get_secrets_cache_stats()["hits"])
+
+    def test_get_secrets_reports_missing_secret(self):
+        with self.assertRaises(utils.DetailedValueError) as context:
+            utils.get_secrets(
+                ["aws-connection", "this-secret-does-not-exist"], raise_on_error=True
+            )
+        self.assertIn("this-secret-does-not-exist", context.exception.details["errors"])
+
+    def test_get_secrets_reports_connection_error(self):
+        from botocore.exceptions import EndpointConnectionError
+
+        with patch.object(
+            utils.SecretsManager,
+            "batch_get_secret_value",
+            side_effect=EndpointConnectionError(endpoint_url="https://secretsmanager"),
+        ):
+            secrets = utils.get_secrets(["aws-connection"])
+            self.assertEqual({"aws-connection": None}, secrets)
+            with self.assertRaises(utils.DetailedValueError) as context:
+                utils.get_secrets(["aws-connection"], raise_on_error=True)
+        self.assertEqual(
+            "EndpointConnectionError",
+            context.exception.details["errors"]["aws-connection"]["error_code"],
+        )
+
+
+class HttpRetryPolicyTestCase(TestCase):
+    def test_idempotent_methods_only_by_default(self):
+        policy = utils.HttpRetryPolicy()
+        self.assertTrue(policy.allows_method("GET"))
+        self.assertFalse(policy.allows_method("POST"))
+        self.assertTrue(
+            utils.HttpRetryPolicy(retry_non_idempotent=True).allows_method("POST")
+        )
+
+    def test_retry_after_honoured(self):
+        policy = utils.HttpRetryPolicy()
+        self.assertEqual(3, policy.get_delay(attempt=1, retry_after="3"))
+        self.assertEqual(
+            0, policy.get_delay(attempt=1, retry_after="Wed, 21 Oct 2015 07:28:00 GMT")
+        )
+
+    def test_backoff_bounded(self):
+        policy = utils.HttpRetryPolicy(backoff_base=0.1, backoff_max=0.5)
+        for attempt in range(1, 10):
+            self.assertLessEqual(policy.get_delay(attempt), 0.5)
+
+    def test_total_time_bounded(self):
+        policy = utils.HttpRetryPolicy(max_attempts=10, max_total_seconds=1)
+        started_at = time.monotonic()
+        self.assertTrue(policy.can_retry(1, started_at, delay=0.5))
+        self.assertFalse(policy.can_retry(1, started_at, delay=2))
+        self.assertFalse(policy.can_retry(10, started_at, delay=0))
+
+
+class QueueLoggingTestCase(TestCase):
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = list()
+
+        def emit(self, record):
+            self.records.append(record)
+
+    def setUp(self):
+        self.logger = utils.get_logger()
+        self.handler = self.ListHandler()
+        self.logger.addHandler(self.handler)
+        utils.enable_queue_logging()
+
+    def tearDown(self):
+        utils.disable_queue_logging()
+        self.logger.removeHandler(self.handler)
+
+    def test_records_written_by_flush(self):
+        self.logger.info("Queued %s", "record", extra={"item": {"id": 1}})
+        utils.flush_logs()
+        self.assertEqual(1, len(self.handler.records))
+        record = self.handler.records[0]
+        self.assertEqual("Queued record", record.getMessage())
+        self.assertEqual({"id": 1}, record.item)
+        self.assertEqual(threading.current_thread().name, record.threadName)
+
+    def test_extra_copied_when_queued(self):
+        event = {"items": [1]}
+        self.logger.info("Queued", extra={"event": event})
+        event["items"].append(2)
+        event["other"] = True
+        utils.flush_logs()
+        self.assertEqual({"items": [1]}, self.handler.records[0].event)
+
+    def test_listener_survives_failing_handler(self):
+        class FailingHandler(logging.Handler):
+            def emit(self, record):
+                raise ValueError("Circular reference detected")
+
+        failing_handler = FailingHandler()
+        utils._log_listener.handlers += (failing_handler,)
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.logger.info("First")
+                self.assertTrue(utils.flush_logs(timeout=1))
+            utils._log_listener.handlers = utils._log_listener.handlers[:-1]
+            self.logger.info("Second")
+            self.assertTrue(utils.flush_logs(timeout=1))
+        finally:
+            utils._log_listener.handlers = tuple(
+                h for h in utils._log_listener.handlers if h is not failing_handler
+            )
+        self.assertEqual(
+            ["First", "Second"], [r.getMessage() for r in self.handler.records]
+        )
+
+    def test_flush_logs_timeout(self):
+        release = threading.Event()
+
+        class BlockingHandler(logging.Handler):
+            def emit(self, record):
+                release.wait()
+
+        blocking_handler = BlockingHandler()
+        utils._log_listener.handlers += (blocking_handler,)
+        try:
+            self.logger.info("Blocked")
+            self.assertFalse(utils.flush_logs(timeout=0.05))
+        finally:
+            release.set()
+            utils._log_listener.handlers = tuple(
+                h for h in utils._log_listener.handlers if h is not blocking_handler
+            )
+        self.assertTrue(utils.flush_logs(timeout=1))
+
+    def test_exc_info_kept_for_listener(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("Failed")
+        utils.flush_logs()
+        self.assertIs(ValueError, self.handler.records[0].exc_info[0])
+
+    def test_lambda_wrapper_flushes_logs(self):
+        @utils.lambda_wrapper
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK}
+
+        handler(dict(), None)
+        self.assertEqual(
+            ["Input event", utils.FUNCTION_RESULT_STR],
+            [r.getMessage() for r in self.handler.records],
+        )
+
+
+class FastJsonFormatterTestCase(TestCase):
+    @staticmethod
+    def make_record(**extra):
+        record = logging.LogRecord(
+            "thiscovery", logging.INFO, __file__, 1, "Hello %s", ("world",), None
+        )
+        record.__dict__.update(extra)
+        return record
+
+    def test_same_fields_as_jsonlogger(self):
+        from pythonjsonlogger import jsonlogger
+
+        reference_formatter = jsonlogger.JsonFormatter(
+            "%(asctime)s %(module)s %(funcName)s %(lineno)d %(name)-2s %(levelname)-8s %(message)s"
+        )
+        reference_formatter.default_msec_format = "%s.%03d"
+        record = self.make_record(item={"id": 1, "tags": ["a"]}, correlation_id="1")
+        self.assertEqual(
+            json.loads(reference_formatter.format(record)),
+            json.loads(utils.FastJsonFormatter().format(record)),
+        )
+
+    def test_special_types(self):
+        record = self.make_record(
+            amount=decimal.Decimal("1.5"),
+            count=decimal.Decimal("3"),
+            created_at=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc),
+            id=uuid.UUID(int=1),
+        )
+        log_data = json.loads(utils.FastJsonFormatter().format(record))
+        self.assertEqual(1.5, log_data["amount"])
+        self.assertEqual(3, log_data["count"])
+        self.assertEqual("2021-01-01T00:00:00+00:00", log_data["created_at"])
+        self.assertEqual("00000000-0000-0000-0000-000000000001", log_data["id"])
+
+    def test_falls_back_to_json(self):
+        record = self.make_record(big_number=2**70)
+        log_data = json.loads(utils.FastJsonFormatter().format(record))
+        self.assertEqual(2**70, log_data["big_number"])
+
+    def test_no_colour_when_not_a_tty(self):
+        stream = io.StringIO()
+        handler = utils.ColorHandler(stream=stream, colorize="auto")
+        handler.setFormatter(utils.FastJsonFormatter())
+        handler.emit(self.make_record())
+        self.assertEqual("Hello world", json.loads(stream.getvalue())["message"])
+
+    def test_lambda_log_result_parsing(self):
+        from thiscovery_lib.lambda_utilities import _parse_log_record
+
+        line = utils.FastJsonFormatter().format(self.make_record())
+        self.assertEqual("Hello world", _parse_log_record(line)["message"])
+        self.assertIsNone(_parse_log_record(str({"a": 1})))
+        self.assertIsNone(_parse_log_record('{"a": 1}'))
+        self.assertIsNone(
+            _parse_log_record(json.dumps({"_aws": {}, "levelname": "", "message": ""}))
+        )
+
+    def test_unformattable_record_does_not_raise(self):
+        item = dict()
+        item["self"] = item
+        stream = io.StringIO()
+        handler = utils.ColorHandler(stream=stream, colorize="auto")
+        handler.setFormatter(utils.FastJsonFormatter())
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            handler.emit(self.make_record(item=item))
+        self.assertEqual("", stream.getvalue())
+        self.assertIn("Logging error", stderr.getvalue())
+
+
+class LazyExtraTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("thiscovery.test_lazy_extra")
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+        self.calls = 0
+
+    def factory(self):
+        self.calls += 1
+        return {"item": {"id": 1}}
+
+    def test_not_evaluated_if_level_disabled(self):
+        self.logger.setLevel(logging.WARNING)
+        self.logger.info("dynamodb put", extra=utils.LazyExtra(self.factory))
+        self.assertEqual(0, self.calls)
+
+    def test_evaluated_once_if_level_enabled(self):
+        self.logger.setLevel(logging.DEBUG)
+        records = list()
+        self.logger.addFilter(lambda record: records.append(record) or True)
+        self.logger.info("dynamodb put", extra=utils.LazyExtra(self.factory))
+        self.assertEqual(1, self.calls)
+        self.assertEqual({"id": 1}, records[0].item)
+
+
+class LambdaWrapperLoggingTestCase(TestCase):
+    def setUp(self):
+        self.logger = utils.get_logger()
+        self.handler = QueueLoggingTestCase.ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def logged(self, attribute):
+        return [
+            getattr(r, attribute) for r in self.handler.records if hasattr(r, attribute)
+        ]
+
+    def test_truncation(self):
+        @utils.lambda_wrapper(max_list_length=2, max_field_bytes=100)
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK, "users": list(range(10))}
+
+        handler({"body": "x" * 1000}, None)
+        self.assertEqual(
+            {"statusCode": HTTPStatus.OK, "users": [0, 1, "... [8 more items]"]},
+            self.logged("result")[0],
+        )
+        event_log = self.logged("event")[0]
+        self.assertIsInstance(event_log, str)
+        self.assertTrue(event_log.endswith("bytes in total]"))
+
+    def test_log_only_on_error(self):
+        @utils.lambda_wrapper(log_only_on_error=True)
+        def handler(event, context):
+            return {"statusCode": event["status"]}
+
+        handler({"status": HTTPStatus.OK}, None)
+        self.assertEqual([], self.logged("event"))
+        self.assertEqual([], self.logged("result"))
+        self.assertEqual(1, len(self.logged("correlation_id")))
+
+        handler({"status": HTTPStatus.BAD_REQUEST}, None)
+        self.assertEqual(1, len(self.logged("event")))
+        self.assertEqual(
+            [{"statusCode": HTTPStatus.BAD_REQUEST}], self.logged("result")
+        )
+
+    def test_event_logged_on_exception(self):
+        @utils.lambda_wrapper(sample_rate=0)
+        def handler(event, context):
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            handler({"id": 1}, None)
+        self.assertEqual(1, self.logged("event")[0]["id"])
+
+    def test_sampling(self):
+        @utils.lambda_wrapper(sample_rate=0)
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK}
+
+        handler(dict(), None)
+        self.assertEqual([], self.logged("result"))
+        self.assertEqual(1, len(self.logged("correlation_id")))
+
+    def test_redaction(self):
+        @utils.lambda_wrapper(redact_paths=["body.email", "body.users.*.name"])
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK, "body": event["body"]}
+
+        event = {"body": {"email": "a@b.c", "users": [{"name": "Ann", "id": 1}]}}
+        handler(event, None)
+        self.assertEqual("a@b.c", event["body"]["email"])
+        expected_body = {"email": "*****", "users": [{"name": "*****", "id": 1}]}
+        self.assertEqual(expected_body, self.logged("event")[0]["body"])
+        self.assertEqual(expected_body, self.logged("result")[0]["body"])
+
+    def test_redaction_env_var(self):
+        @utils.lambda_wrapper
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK}
+
+        with patch.dict(os.environ, {"THISCOVERY_LOG_REDACT_PATHS": "token, id"}):
+            handler({"token": "secret", "id": 1, "name": "x"}, None)
+        event_log = self.logged("event")[0]
+        self.assertEqual("*****", event_log["token"])
+        self.assertEqual("*****", event_log["id"])
+        self.assertEqual("x", event_log["name"])
+
+
+class RedactionPlanTestCase(TestCase):
+    def setUp(self):
+        self.data = {
+            "body": {
+                "email": "a@b.c",
+                "users": [{"name": "Ann", "id": 1}, {"name": "Bob", "id": 2}],
+            },
+            "headers": {"Authorization": "token", "Accept": "*/*"},
+            "ids": [1, 2],
+        }
+        self.plan = utils.RedactionPlan(
+            ["body.email", "body.users.*.name", "headers.*", "missing.key"]
+        )
+
+    def test_apply(self):
+        redacted = self.plan.apply(self.data)
+        self.assertIs(self.data, redacted)
+        self.assertEqual("*****", redacted["body"]["email"])
+        self.assertEqual(
+            [{"name": "*****", "id": 1}, {"name": "*****", "id": 2}],
+            redacted["body"]["users"],
+        )
+        self.assertEqual(
+            {"Authorization": "*****", "Accept": "*****"}, redacted["headers"]
+        )
+
+    def test_copy_on_write(self):
+        original = copy.deepcopy(self.data)
+        redacted = self.plan.apply(self.data, copy=True)
+        self.assertEqual(original, self.data)
+        self.assertEqual("*****", redacted["body"]["email"])
+        # values without redacted fields are shared rather than copied
+        self.assertIs(self.data["ids"], redacted["ids"])
+
+    def test_wildcard_merged_with_explicit_keys(self):
+        plan = utils.RedactionPlan(["*.name", ("users", "0")])
+        data = {"users": {"name": "Ann", "0": "x", "1": "y"}, "x": {"name": "Bob"}}
+        self.assertEqual(
+            {
+                "users": {"name": "*****", "0": "*****", "1": "y"},
+                "x": {"name": "*****"},
+            },
+            plan.apply(data),
+        )
+
+
+class InvocationMetricsTestCase(TestCase):
+    def run_handler(self, handler):
+        stdout = io.StringIO()
+        with patch.dict(os.environ, {utils.METRICS_ENV_VAR: "true"}):
+            with contextlib.redirect_stdout(stdout):
+                try:
+                    handler(dict(), None)
+                except ValueError:
+                    pass
+        return json.loads(stdout.getvalue())
+
+    def test_emf_document(self):
+        @utils.lambda_wrapper
+        def handler(event, context):
+            utils.record_outbound_call(0.25)
+            return {"statusCode": HTTPStatus.OK}
+
+        document = self.run_handler(handler)
+        metric_names = [
+            m["Name"] for m in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+        ]
+        for name in ["Duration", "ColdStart", "OutboundCalls", "OutboundLatency"]:
+            self.assertIn(name, metric_names)
+        self.assertEqual(
+            [["Module", "Function"]],
+            document["_aws"]["CloudWatchMetrics"][0]["Dimensions"],
+        )
+        self.assertEqual("handler", document["Function"])
+        self.assertEqual(1, document["OutboundCalls"])
+        self.assertEqual(250, document["OutboundLatency"])
+        self.assertEqual(0, document["Errors"])
+
+    def test_qualtrics_requests_counted(self):
+        import requests
+        from unittest.mock import Mock
+        from thiscovery_lib.qualtrics import BaseClient as QualtricsClient
+
+        client = QualtricsClient("test-account", api_token="x")
+        ok_response = Mock(status_code=HTTPStatus.OK, ok=True)
+        ok_response.json.return_value = dict()
+
+        @utils.lambda_wrapper
+        def handler(event, context):
+            client.qualtrics_request("GET", client.base_url)
+            try:
+                client.qualtrics_request("GET", client.base_url)
+            except requests.ConnectionError:
+                pass
+            return {"statusCode": HTTPStatus.OK}
+
+        with patch(
+            "requests.request", side_effect=[ok_response, requests.ConnectionError()]
+        ):
+            document = self.run_handler(handler)
+        utils.reset_circuit_breakers()
+        self.assertEqual(2, document["OutboundCalls"])
+
+    def test_error_class(self):
+        @utils.lambda_wrapper
+        def failing_handler(event, context):
+            raise ValueError("boom")
+
+        @utils.lambda_wrapper
+        def bad_request_handler(event, context):
+            return {"statusCode": HTTPStatus.BAD_REQUEST}
+
+        self.assertEqual("ValueError", self.run_handler(failing_handler)["ErrorClass"])
+        self.assertEqual("HTTP400", self.run_handler(bad_request_handler)["ErrorClass"])
+
+    def test_disabled(self):
+        @utils.lambda_wrapper
+        def handler(event, context):
+            return {"statusCode": HTTPStatus.OK}
+
+        stdout = io.StringIO()
+        with patch.dict(os.environ, {utils.METRICS_ENV_VAR: "false"}):
+            with contextlib.redirect_stdout(stdout):
+                handler(dict(), None)
+        self.assertEqual("", stdout.getvalue())
+
+    def test_disabled_by_default_on_aws(self):
+        with patch.dict(os.environ, {"AWS_REGION": "eu-west-1"}):
+            os.environ.pop(utils.METRICS_ENV_VAR, None)
+            self.assertFalse(utils.metrics_enabled())
+
+
+class AwsCallStatsTestCase(TestCase):
+    def setUp(self):
+        utils.reset_aws_call_stats()
+
+    def test_histogram(self):
+        stats = utils.AwsCallStats()
+        stats.record_call("dynamodb", "GetItem", 3, error=False, retries=0)
+        stats.record_call("dynamodb", "GetItem", 40, error=True, retries=2)
+        stats.record_call("dynamodb", "GetItem", 20000, error=False, retries=0)
+        stats.record_throttle("dynamodb", "GetItem")
+        snapshot = stats.snapshot()["dynamodb.GetItem"]
+        self.assertEqual(3, snapshot["calls"])
+        self.assertEqual(1, snapshot["errors"])
+        self.assertEqual(2, snapshot["retries"])
+        self.assertEqual(1, snapshot["throttles"])
+        self.assertEqual(20000, snapshot["latency_ms_max"])
+        self.assertEqual(1, snapshot["latency_ms_histogram"]["<=5"])
+        self.assertEqual(1, snapshot["latency_ms_histogram"]["<=50"])
+        self.assertEqual(1, snapshot["latency_ms_histogram"][">10000"])
+
+    def test_client_calls_recorded(self):
+        from botocore.stub import Stubber
+
+        sns_client = utils.BaseClient("sns", use_client_cache=False).client
+        with Stubber(sns_client) as stubber:
+            stubber.add_response("list_topics", {"Topics": []})
+            stubber.add_client_error("list_topics", http_status_code=500)
+            sns_client.list_topics()
+            with self.assertRaises(Exception):
+                sns_client.list_topics()
+        stats = utils.get_aws_call_stats()["sns.ListTopics"]
+        self.assertEqual(2, stats["calls"])
+        self.assertEqual(1, stats["errors"])
+
+    def test_logged_by_lambda_wrapper(self):
+        logger = utils.get_logger()
+        handler = QueueLoggingTestCase.ListHandler()
+        logger.addHandler(handler)
+
+        @utils.lambda_wrapper(log_aws_call_stats=True)
+        def lambda_handler(event, context):
+            utils.AWS_CALL_STATS.record_call("sns", "Publish", 10, False, 0)
+            return {"statusCode": HTTPStatus.OK}
+
+        try:
+            lambda_handler(dict(), None)
+        finally:
+            logger.removeHandler(handler)
+        logged_stats = [
+            r.aws_call_stats for r in handler.records if hasattr(r, "aws_call_stats")
+        ]
+        self.assertEqual(1, logged_stats[0]["sns.Publish"]["calls"])
+
+
+class CorrelationIdContextTestCase(TestCase):
+    def test_context_manager(self):
+        self.assertIsNone(utils.get_current_correlation_id())
+        correlation_id = utils.new_correlation_id()
+        with utils.correlation_id_context(correlation_id):
+            self.assertEqual(str(correlation_id), utils.get_current_correlation_id())
+        self.assertIsNone(utils.get_current_correlation_id())
+
+    def test_set_by_lambda_wrapper_and_added_to_logs(self):
+        logger = utils.get_logger()
+        handler = QueueLoggingTestCase.ListHandler()
+        logger.addHandler(handler)
+
+        @utils.lambda_wrapper
+        def lambda_handler(event, context):
+            logger.info("inside handler")
+            return utils.get_current_correlation_id()
+
+        try:
+            result = lambda_handler({"headers": {"Correlation_Id": "abc"}}, None)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual("abc", result)
+        self.assertIsNone(utils.get_current_correlation_id())
+        record = [r for r in handler.records if r.getMessage() == "inside handler"][0]
+        self.assertEqual("abc", record.correlation_id)
+
+    def test_client_falls_back_to_context(self):
+        client = utils.BaseClient("sns", use_client_cache=False)
+        explicit_client = utils.BaseClient(
+            "sns", use_client_cache=False, correlation_id="explicit"
+        )
+        with utils.correlation_id_context("from context"):
+            self.assertEqual("from context", client.correlation_id)
+            self.assertEqual("explicit", explicit_client.correlation_id)
+        self.assertIsNone(client.correlation_id)
+
+    def test_propagated_to_executor_threads(self):
+        with utils.correlation_id_context("abc"):
+            with utils.ContextThreadPoolExecutor(max_workers=2) as executor:
+                results = list(
+                    executor.map(lambda _: utils.get_current_correlation_id(), range(4))
+                )
+        self.assertEqual(["abc"] * 4, results)
+
+
+class RateLimiterTestCase(TestCase):
+    def setUp(self):
+        utils.reset_rate_limiters()
+
+    def tearDown(self):
+        utils.reset_rate_limiters()
+
+    def test_burst_then_rate(self):
+        bucket = utils.TokenBucket(rate=50, burst=5)
+        started_at = time.monotonic()
+        waits = [bucket.acquire() for _ in range(10)]
+        # the 10th token is only available 5 tokens / 50 per second after the start
+        self.assertAlmostEqual(0.1, time.monotonic() - started_at, delta=0.02)
+        self.assertEqual([0.0] * 5, waits[:5])
+        self.assertTrue(all(w > 0 for w in waits[5:]))
+        stats = bucket.get_stats()
+        self.assertEqual(10, stats["acquired"])
+        self.assertEqual(5, stats["waited"])
+        self.assertAlmostEqual(0.02, stats["wait_seconds_max"], delta=0.005)
+
+    def test_shared_between_threads(self):
+        utils.set_rate_limit("ses", rate=100, burst=1)
+        started_at = time.monotonic()
+        threads = [
+            threading.Thread(target=lambda: [utils.rate_limit("ses") for _ in range(5)])
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.18)
+        self.assertEqual(20, utils.get_rate_limiter_stats()["ses"]["acquired"])
+
+    def test_async(self):
+        import asyncio
+
+        utils.set_rate_limit("sendgrid", rate=100, burst=1)
+
+        async def acquire_all():
+            return await asyncio.gather(
+                *[utils.rate_limit_async("sendgrid") for _ in range(5)]
+            )
+
+        waits = asyncio.run(acquire_all())
+        self.assertAlmostEqual(0.04, max(waits), delta=0.01)
+
+    def test_env_var_config(self):
+        rate_limits = {"ses": 14, "qualtrics": {"rate": 5, "burst": 10}}
+        with patch.dict(
+            os.environ, {utils.RATE_LIMITS_ENV_VAR: json.dumps(rate_limits)}
+        ):
+            self.assertIsNone(utils.get_rate_limiter("sendgrid"))
+            self.assertEqual(14, utils.get_rate_limiter("ses").rate)
+            cambridge = utils.get_rate_limiter("qualtrics:cambridge")
+            other = utils.get_rate_limiter("qualtrics:other")
+            self.assertIsNot(cambridge, other)
+            self.assertEqual((5, 10), (cambridge.rate, cambridge.burst))
+        with patch.dict(os.environ, {utils.RATE_LIMITS_ENV_VAR: "not json"}):
+            with self.assertRaises(utils.DetailedValueError):
+                utils.get_rate_limiter("ses")
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.breaker = utils.CircuitBreaker(
+            "api.example.org",
+            failure_rate_threshold=0.5,
+            minimum_calls=4,
+            window_seconds=60,
+            open_seconds=0.1,
+        )
+
+    def tearDown(self):
+        utils.reset_circuit_breakers()
+
+    def call(self, failed):
+        self.breaker.before_call()
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def test_opens_on_failure_rate(self):
+        for failed in [False, True, False]:
+            self.call(failed)
+        self.assertEqual("closed", self.breaker.get_state()["state"])
+        self.call(failed=True)
+        self.assertEqual("open", self.breaker.get_state()["state"])
+        with self.assertRaises(utils.CircuitOpenError) as context:
+            self.breaker.before_call()
+        self.assertEqual("api.example.org", context.exception.details["circuit"])
+        self.assertEqual(1, self.breaker.get_state()["rejected"])
+
+    def test_half_open(self):
+        for _ in range(4):
+            self.call(failed=True)
+        time.sleep(0.1)
+        self.assertEqual("half_open", self.breaker.get_state()["state"])
+        self.breaker.before_call()
+        # only one trial call at a time
+        with self.assertRaises(utils.CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual("open", self.breaker.get_state()["state"])
+        time.sleep(0.1)
+        self.call(failed=False)
+        self.assertEqual("closed", self.breaker.get_state()["state"])
+
+    def test_registry_and_metrics(self):
+        breaker = utils.get_circuit_breaker("api.example.org")
+        self.assertIs(breaker, utils.get_circuit_breaker("api.example.org"))
+        for _ in range(breaker.minimum_calls):
+            breaker.record_failure()
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            utils.emit_invocation_metrics("module", "func", 0.1, False, None, "id")
+        document = json.loads(stdout.getvalue())
+        self.assertEqual(1, document["OpenCircuits"])
+        self.assertEqual(["api.example.org"], document["OpenCircuitNames"])
+
+    def test_disabled(self):
+        with patch.dict(os.environ, {"THISCOVERY_CIRCUIT_BREAKER": "false"}):
+            self.assertIsNone(utils.get_circuit_breaker("api.example.org"))
+
+
+class DeadlineTestCase(TestCase):
+    class LambdaContext:
+        def __init__(self, remaining_ms):
+            self.remaining_ms = remaining_ms
+
+        def get_remaining_time_in_millis(self):
+            return self.remaining_ms
+
+    def test_http_timeout_defaults(self):
+        self.assertEqual(utils.DEFAULT_HTTP_TIMEOUT, utils.get_http_timeout())
+        self.assertEqual((2, 2), utils.get_http_timeout(2))
+        with patch.dict(os.environ, {"THISCOVERY_HTTP_READ_TIMEOUT": "10"}):
+            self.assertEqual(
+                (utils.DEFAULT_HTTP_TIMEOUT[0], 10), utils.get_http_timeout()
+            )
+
+    def test_http_timeout_shrinks_with_deadline(self):
+        with utils.deadline_context(1):
+            connect_timeout, read_timeout = utils.get_http_timeout((5, 30))
+            self.assertLessEqual(connect_timeout, 1)
+            self.assertLessEqual(read_timeout, 1)
+            # nested deadlines never extend the outer one
+            with utils.deadline_context(60):
+                self.assertLessEqual(utils.get_remaining_time(), 1)
+        self.assertIsNone(utils.get_remaining_time())
+        with utils.deadline_context(0):
+            with self.assertRaises(utils.DeadlineExceededError):
+                utils.get_http_timeout()
+
+    def test_no_retry_past_deadline(self):
+        policy = utils.HttpRetryPolicy(max_attempts=3)
+        with utils.deadline_context(0.5):
+            self.assertTrue(policy.can_retry(1, time.monotonic(), 0.1))
+            self.assertFalse(policy.can_retry(1, time.monotonic(), 1))
+
+    def test_set_by_lambda_wrapper(self):
+        @utils.lambda_wrapper
+        def handler(event, context):
+            return utils.get_remaining_time()
+
+        with patch.dict(os.environ, {"THISCOVERY_LAMBDA_DEADLINE_MARGIN": "0.5"}):
+            remaining = handler(dict(), self.LambdaContext(3000))
+        self.assertAlmostEqual(2.5, remaining, delta=0.1)
+        self.assertIsNone(utils.get_remaining_time())
+        with patch.dict(os.environ, {"THISCOVERY_LAMBDA_DEADLINE": "false"}):
+            self.assertIsNone(handler(dict(), self.LambdaContext(3000)))
+
+    def test_rate_limit_wait_bounded_by_deadline(self):
+        utils.set_rate_limit("thiscovery-api:thiscovery.invalid", rate=1)
+        try:
+            utils.get_rate_limiter("thiscovery-api:thiscovery.invalid").acquire()
+            started_at = time.monotonic()
+            with utils.deadline_context(0.5):
+                with self.assertRaises(utils.DeadlineExceededError):
+                    utils.aws_request(
+                        "GET", "v1/ping", "https://thiscovery.invalid/", aws_api_key="x"
+                    )
+            self.assertLess(time.monotonic() - started_at, 0.1)
+            stats = utils.get_rate_limiter_stats()["thiscovery-api:thiscovery.invalid"]
+            self.assertEqual((1, 1), (stats["acquired"], stats["rejected"]))
+        finally:
+            utils.reset_rate_limiters()
+
+    def test_api_error_handler_returns_gateway_timeout(self):
+        @utils.api_error_handler
+        def handler(event, context):
+            with utils.deadline_context(0):
+                utils.check_deadline("test")
+
+        result = handler({"correlation_id": "abc"}, None)
+        self.assertEqual(HTTPStatus.GATEWAY_TIMEOUT, result["statusCode"])
+
+    def test_boto_calls_fail_past_deadline(self):
+        from botocore.stub import Stubber
+
+        sns_client = utils.BaseClient("sns", use_client_cache=False).client
+        with Stubber(sns_client) as stubber:
+            stubber.add_response("list_topics", {"Topics": []})
+            with utils.deadline_context(0):
+                with self.assertRaises(utils.DeadlineExceededError) as context:
+                    sns_client.list_topics()
+            self.assertEqual("ListTopics", context.exception.details["operation"])
+            sns_client.list_topics()
+
+
+class ParallelMapTestCase(TestCase):
+    @staticmethod
+    def slow_square(x):
+        time.sleep(0.01 * (5 - x))
+        if x == 3:
+            raise ValueError("three")
+        return x * x
+
+    def test_ordered_results_and_context(self):
+        with utils.correlation_id_context("abc"):
+            result = utils.parallel_map(
+                lambda x: (x * x, utils.get_current_correlation_id()), range(5)
+            )
+        self.assertEqual([(x * x, "abc") for x in range(5)], result)
+
+    def test_concurrency_limit(self):
+        active = {"now": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def work(x):
+            with lock:
+                active["now"] += 1
+                active["peak"] = max(active["peak"], active["now"])
+            time.sleep(0.01)
+            with lock:
+                active["now"] -= 1
+            return x
+
+        self.assertEqual(list(range(20)), utils.parallel_map(work, range(20), 3))
+        self.assertEqual(3, active["peak"])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            utils.parallel_map(self.slow_square, range(5))
+        result = utils.parallel_map(
+            self.slow_square, range(5), ordered=False, return_exceptions=True
+        )
+        self.assertEqual(16, result[0])
+        self.assertIsInstance(result[1], ValueError)
+
+    def test_deadline(self):
+        utils.reset_parallel_map_stats()
+        with utils.deadline_context(0.15):
+            result = utils.parallel_map(
+                lambda x: time.sleep(0.1) or x,
+                range(6),
+                max_workers=2,
+                return_exceptions=True,
+            )
+        self.assertEqual([0, 1], result[:2])
+        for r in result[2:]:
+            self.assertIsInstance(r, utils.DeadlineExceededError)
+        stats = utils.get_parallel_map_stats()
+        self.assertEqual(
+            (6, 2, 4), (stats["items"], stats["completed"], stats["cancelled"])
+        )
+        with self.assertRaises(utils.DeadlineExceededError):
+            utils.parallel_map(lambda x: time.sleep(0.1), range(6), 2, timeout=0.15)
+
+    def test_progress_callback(self):
+        progress = list()
+        utils.parallel_map(
+            lambda x: x, range(3), progress_callback=lambda *p: progress.append(p)
+        )
+        self.assertEqual([(1, 3), (2, 3), (3, 3)], progress)
+
+    def test_async(self):
+        import asyncio
+
+        async def square(x):
+            await asyncio.sleep(0.01 * (5 - x))
+            return x * x, utils.get_current_correlation_id()
+
+        async def main():
+            with utils.correlation_id_context("abc"):
+                return await utils.parallel_map_async(square, range(5), 2)
+
+        self.assertEqual([(x * x, "abc") for x in range(5)], asyncio.run(main()))
+
+    def test_async_timeout(self):
+        import asyncio
+
+        async def slow(x):
+            await asyncio.sleep(0.1)
+            return x
+
+        result = asyncio.run(
+            utils.parallel_map_async(
+                slow, range(4), 2, timeout=0.15, return_exceptions=True
+            )
+        )
+        self.assertEqual([0, 1], result[:2])
+        self.assertIsInstance(result[3], utils.DeadlineExceededError)
@@ -18,6 +18,7 @@
 import local.dev_config  # sets env variables TEST_ON_AWS and AWS_TEST_API
 import local.secrets  # sets env variables THISCOVERY_AFS25_PROFILE and THISCOVERY_AMP205_PROFILE
 
+import asyncio
 import json
 import random
 import string
@@ -25,7 +26,7 @@ import thiscovery_dev_tools.testing_tools as test_utils
 
 from http import HTTPStatus
 from pprint import pprint
-from thiscovery_lib.core_api_utilities import CoreApiClient
+from thiscovery_lib.core_api_utilities import AsyncCoreApiClient, CoreApiClient
 from thiscovery_lib.utilities import get_environment_name
 
 
@@ -96,6 +97,15 @@ class TestCoreApiUtilities(test_utils.BaseTestCase):
         with self.assertRaises(AssertionError):
             self.core_client.get_user_by_email(email="non_existent@email.co.uk")
 
+    def test_get_users_by_email(self):
+        result = self.core_client.get_users_by_email(
+            ["delia@email.co.uk", "non_existent@email.co.uk", "eddie@email.co.uk"],
+            return_exceptions=True,
+        )
+        self.assertEqual("35224bd5-f8a8-41f6-8502-f96e12d6ddde", result[0]["id"])
+        self.assertIsInstance(result[1], AssertionError)
+        self.assertEqual("1cbe9aad-b29f-46b5-920e-b4c496d42515", result[2]["id"])
+
     def test_get_user_by_anon_project_specific_user_id_ok(self):
         result = self.core_client.get_user_by_anon_project_specific_user_id(
             anon_project_specific_user_id="1a03cb39-b669-44bb-a69e-98e6a521d758"
@@ -188,6 +198,72 @@ class TestCoreApiUtilities(test_utils.BaseTestCase):
         assert result["statusCode"] == HTTPStatus.CREATED
 
 
+class TestAsyncCoreApiUtilities(test_utils.BaseTestCase):
+    @staticmethod
+    def run_with_client(coroutine_function):
+        async def main():
+            async with AsyncCoreApiClient(
+                env_override=get_environment_name()
+            ) as client:
+                return await coroutine_function(client)
+
+        return asyncio.run(main())
+
+    def test_get_user_by_email_ok(self):
+        result = self.run_with_client(
+            lambda client: client.get_user_by_email(email="delia@email.co.uk")
+        )
+        self.assertEqual("35224bd5-f8a8-41f6-8502-f96e12d6ddde", result["id"])
+
+    def test_get_user_by_email_not_found(self):
+        with self.assertRaises(AssertionError):
+            self.run_with_client(
+                lambda client: client.get_user_by_email(
+                    email="non_existent@email.co.uk"
+                )
+            )
+
+    def test_get_users_by_email(self):
+        emails = ["delia@email.co.uk", "eddie@email.co.uk"] * 10
+        result = self.run_with_client(
+            lambda client: client.get_users_by_email(emails, max_workers=5)
+        )
+        self.assertEqual(
+            [
+                "35224bd5-f8a8-41f6-8502-f96e12d6ddde",
+                "1cbe9aad-b29f-46b5-920e-b4c496d42515",
+            ]
+            * 10,
+            [user["id"] for user in result],
+        )
+
+    def test_concurrent_lookups_ok(self):
+        emails = ["delia@email.co.uk", "eddie@email.co.uk"] * 10
+        result = self.run_with_client(
+            lambda client: asyncio.gather(
+                *[client.get_user_id_by_email(email=e) for e in emails]
+            )
+        )
+        self.assertEqual(
+            [
+                "35224bd5-f8a8-41f6-8502-f96e12d6ddde",
+                "1cbe9aad-b29f-46b5-920e-b4c496d42515",
+            ]
+            * 10,
+            result,
+        )
+
+    def test_get_user_task_from_anon_user_task_id_ok(self):
+        result = self.run_with_client(
+            lambda client: client.get_user_task_from_anon_user_task_id(
+                anon_user_task_id="3dce6e9c-9b20-4d7f-a266-9967553dbc16"
+            )
+        )
+        self.assertEqual(
+            "273b420e-09cb-419c-8b57-b393595dba78", result["project_task_id"]
+        )
+
+
 class TestCoreApiUtilitiesGroupEmailDespatch(test_utils.BaseTestCase):
     @classmethod
     def setUpClass(cls):
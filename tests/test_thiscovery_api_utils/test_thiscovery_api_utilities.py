@@ -0,0 +1,155 @@
+#
+#   Thiscovery API - THIS Institute’s citizen science platform
+#   Copyright (C) 2019 THIS Institute
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as
+#   published by the Free Software Foundation, either version 3 of the
+#   License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   A copy of the GNU Affero General Public License is available in the
+#   docs folder of this project.  It is also available www.gnu.org/licenses/
+#
+import local.dev_config  # sets env variables TEST_ON_AWS and AWS_TEST_API
+import local.secrets  # sets env variables THISCOVERY_AFS25_PROFILE and THISCOVERY_AMP205_PROFILE
+
+import asyncio
+import threading
+import time
+import thiscovery_dev_tools.testing_tools as test_utils
+from concurrent.futures import ThreadPoolExecutor
+
+import thiscovery_lib.thiscovery_api_utilities as tau
+
+
+class SingleFlightTestCase(test_utils.BaseTestCase):
+    def setUp(self):
+        self.single_flight = tau.SingleFlight()
+        self.executions = 0
+        self.lock = threading.Lock()
+
+    def slow_call(self):
+        with self.lock:
+            self.executions += 1
+        time.sleep(0.2)
+        return {"statusCode": 200, "body": "[]"}
+
+    def test_concurrent_calls_share_one_execution(self):
+        with ThreadPoolExecutor(10) as executor:
+            results = list(
+                executor.map(
+                    lambda _: self.single_flight.do("key", self.slow_call), range(10)
+                )
+            )
+        self.assertEqual(1, self.executions)
+        self.assertEqual([{"statusCode": 200, "body": "[]"}] * 10, results)
+        self.assertEqual({"calls": 10, "coalesced": 9}, self.single_flight.get_stats())
+
+    def test_sequential_calls_are_not_coalesced(self):
+        self.single_flight.do("key", self.slow_call)
+        self.single_flight.do("key", self.slow_call)
+        self.assertEqual(2, self.executions)
+
+    def test_different_keys_are_not_coalesced(self):
+        with ThreadPoolExecutor(2) as executor:
+            list(
+                executor.map(
+                    lambda k: self.single_flight.do(k, self.slow_call), ["a", "b"]
+                )
+            )
+        self.assertEqual(2, self.executions)
+
+    def test_errors_are_raised_to_all_callers(self):
+        def failing_call():
+            time.sleep(0.2)
+            raise ValueError("boom")
+
+        def call(_):
+            try:
+                self.single_flight.do("key", failing_call)
+            except ValueError as err:
+                return str(err)
+
+        with ThreadPoolExecutor(5) as executor:
+            self.assertEqual(["boom"] * 5, list(executor.map(call, range(5))))
+
+    def test_async_calls_share_one_execution(self):
+        async def slow_coroutine():
+            return self.slow_call()
+
+        async def main():
+            return await asyncio.gather(
+                *[self.single_flight.do_async("key", slow_coroutine) for _ in range(10)]
+            )
+
+        results = asyncio.run(main())
+        self.assertEqual(1, self.executions)
+        self.assertEqual(10, len(results))
+        self.assertEqual({"calls": 10, "coalesced": 9}, self.single_flight.get_stats())
+
+
+class ResponseCacheTestCase(test_utils.BaseTestCase):
+    base_url = "https://test-api.thiscovery.org/"
+
+    def setUp(self):
+        self.cache = tau.ResponseCache(max_entries=2)
+
+    def key(self, endpoint_url):
+        return tau._request_key("GET", endpoint_url, self.base_url, {"params": {}})
+
+    @staticmethod
+    def ok_response(body="[]", etag='"v1"'):
+        return {"statusCode": 200, "body": body, "headers": {"etag": etag}}
+
+    def test_fresh_entry_served_from_cache(self):
+        stored = self.cache.store(self.key("v1/project"), self.ok_response(), ttl=60)
+        self.assertEqual({"statusCode": 200, "body": "[]"}, stored)
+        self.assertEqual((stored, None), self.cache.lookup(self.key("v1/project")))
+        self.assertEqual(1, self.cache.get_stats()["hits"])
+
+    def test_expired_entry_revalidated_with_etag(self):
+        key = self.key("v1/project")
+        self.cache.store(key, self.ok_response(), ttl=0.1)
+        time.sleep(0.2)
+        self.assertEqual((None, '"v1"'), self.cache.lookup(key))
+        revalidated = self.cache.store(
+            key, {"statusCode": 304, "body": "", "headers": {}}, ttl=60
+        )
+        self.assertEqual({"statusCode": 200, "body": "[]"}, revalidated)
+        self.assertEqual(1, self.cache.get_stats()["revalidated"])
+        self.assertEqual(revalidated, self.cache.lookup(key)[0])
+
+    def test_error_responses_not_cached(self):
+        key = self.key("v1/project")
+        self.cache.store(key, {"statusCode": 502, "body": "", "headers": {}}, ttl=60)
+        self.assertEqual((None, None), self.cache.lookup(key))
+
+    def test_least_recently_used_entry_evicted(self):
+        for endpoint_url in ["v1/project", "v1/userlist"]:
+            self.cache.store(self.key(endpoint_url), self.ok_response(), ttl=60)
+        self.cache.lookup(self.key("v1/project"))
+        self.cache.store(self.key("v1/userproject"), self.ok_response(), ttl=60)
+        self.assertIsNone(self.cache.lookup(self.key("v1/userlist"))[0])
+        self.assertIsNotNone(self.cache.lookup(self.key("v1/project"))[0])
+        self.assertEqual(1, self.cache.get_stats()["evictions"])
+
+    def test_invalidate_base_url(self):
+        self.cache.store(self.key("v1/project"), self.ok_response(), ttl=60)
+        self.cache.invalidate("https://other-api.thiscovery.org/")
+        self.assertEqual(1, self.cache.get_stats()["size"])
+        self.cache.invalidate(self.base_url)
+        self.assertEqual(0, self.cache.get_stats()["size"])
+
+    def test_caching_is_opt_in(self):
+        from thiscovery_lib.core_api_utilities import CoreApiClient
+
+        client = CoreApiClient(env_override="test")
+        self.assertIsNone(client._cache_ttl("GET", "v1/project"))
+        client.cache_ttls = CoreApiClient.SUGGESTED_CACHE_TTLS
+        self.assertEqual(300, client._cache_ttl("GET", "v1/project"))
+        self.assertIsNone(client._cache_ttl("PUT", "v1/project"))
@@ -232,7 +232,8 @@ class CloudWatchLogsClient(utils.BaseClient):
             time.sleep(1)
             response = self.get_query_results(query_id=query_id)
             self.logger.debug(
-                "get_query_results response", extra={"response": response}
+                "get_query_results response",
+                extra=utils.LazyExtra(lambda: {"response": response}),
             )
 
         return response["results"]
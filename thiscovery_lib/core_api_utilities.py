@@ -24,29 +24,59 @@ import thiscovery_lib.utilities as utils
 
 
 class CoreApiClient(tau.ThiscoveryApiClient):
+    # TTLs (in seconds) suited to endpoints whose data changes rarely. Responses are
+    # not cached unless a caller opts in (e.g. client.cache_ttls =
+    # CoreApiClient.SUGGESTED_CACHE_TTLS), because writes made by other processes
+    # stay invisible until cached responses expire
+    SUGGESTED_CACHE_TTLS = {
+        "v1/project": 300,
+        "v1/userlist": 300,
+        "v1/userproject": 60,
+    }
+
     @tau.check_response(HTTPStatus.OK)
     def ping(self):
-        return utils.aws_get("v1/ping", self.base_url)
+        return self.aws_get("v1/ping", self.base_url)
 
     @tau.check_response(HTTPStatus.OK, HTTPStatus.NOT_FOUND)
     def get_user_by_user_id(self, user_id):
-        return utils.aws_get(
+        return self.aws_get(
             endpoint_url=f"v1/userv2/{user_id}", base_url=self.base_url
         )
 
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def get_user_by_email(self, email):
-        return utils.aws_get("v1/user", self.base_url, params={"email": email})
+        return self.aws_get("v1/user", self.base_url, params={"email": email})
 
     def get_user_id_by_email(self, email):
         user = self.get_user_by_email(email=email)
         return user["id"]
 
+    def get_users_by_email(self, emails, max_workers=None, return_exceptions=False):
+        """
+        Looks up several users at once (see utils.parallel_map)
+
+        Args:
+            emails (list): email addresses to look up
+            max_workers (int): maximum number of concurrent requests
+            return_exceptions (bool): if True, the exception raised by the lookup of
+                    an email (e.g. if no user has it) is returned in place of its user
+
+        Returns:
+            List of users, in the order of emails
+        """
+        return utils.parallel_map(
+            lambda email: self.get_user_by_email(email=email),
+            emails,
+            max_workers=max_workers,
+            return_exceptions=return_exceptions,
+        )
+
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def get_user_by_anon_project_specific_user_id(self, anon_project_specific_user_id):
-        return utils.aws_get(
+        return self.aws_get(
             "v1/user",
             self.base_url,
             params={"anon_project_specific_user_id": anon_project_specific_user_id},
@@ -54,7 +84,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.NO_CONTENT)
     def patch_user(self, user_id: str, jsonpatch: list):
-        return utils.aws_patch(
+        return self.aws_patch(
             f"v1/user/{user_id}",
             self.base_url,
             request_body=json.dumps(jsonpatch),
@@ -62,7 +92,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.CREATED)
     def post_user(self, user_dict: dict) -> dict:
-        return utils.aws_post(
+        return self.aws_post(
             f"v1/user",
             self.base_url,
             request_body=json.dumps(user_dict),
@@ -70,7 +100,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.NO_CONTENT)
     def patch_group_email_despatch(self, group_email_despatch_id: str, jsonpatch: list):
-        return utils.aws_patch(
+        return self.aws_patch(
             f"v1/groupemaildespatch/{group_email_despatch_id}",
             self.base_url,
             request_body=json.dumps(jsonpatch),
@@ -78,7 +108,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.OK)
     def update_group_email_despatch_send_start_date(self, group_email_despatch_id: str):
-        return utils.aws_post(
+        return self.aws_post(
             f"v1/updategroupemaildespatchstart/{group_email_despatch_id}/",
             self.base_url,
         )
@@ -87,14 +117,14 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     def update_group_email_despatch_send_complete_date(
         self, group_email_despatch_id: str
     ):
-        return utils.aws_post(
+        return self.aws_post(
             f"v1/updategroupemaildespatchcomplete/{group_email_despatch_id}/",
             self.base_url,
         )
 
     @tau.check_response(HTTPStatus.NO_CONTENT)
     def delete_group_email_despatch(self, group_email_despatch_id: str):
-        return utils.aws_delete(
+        return self.aws_delete(
             f"v1/groupemaildespatch/{group_email_despatch_id}", self.base_url
         )
 
@@ -107,14 +137,14 @@ class CoreApiClient(tau.ThiscoveryApiClient):
             A group email despatch
         """
 
-        return utils.aws_get(
+        return self.aws_get(
             f"v1/groupemaildespatch/{group_email_despatch_id}",
             self.base_url,
         )
 
     @tau.check_response(HTTPStatus.CREATED)
     def post_group_email_despatch(self, group_email_despatch_dict: dict) -> dict:
-        return utils.aws_post(
+        return self.aws_post(
             f"v1/groupemaildespatch",
             self.base_url,
             request_body=json.dumps(group_email_despatch_dict),
@@ -123,12 +153,12 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def get_projects(self):
-        return utils.aws_get("v1/project", self.base_url, params={})
+        return self.aws_get("v1/project", self.base_url, params={})
 
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def _get_userprojects(self, **params):
-        return utils.aws_get("v1/userproject", self.base_url, params=params)
+        return self.aws_get("v1/userproject", self.base_url, params=params)
 
     def get_userprojects(self, user_id):
         return self._get_userprojects(user_id=user_id)
@@ -139,14 +169,14 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def list_users_by_project(self, project_id):
-        return utils.aws_get(
+        return self.aws_get(
             "v1/list-project-users", self.base_url, params={"project_id": project_id}
         )
 
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def _list_user_tasks(self, query_parameter):
-        return utils.aws_get("v1/usertask", self.base_url, params=query_parameter)
+        return self.aws_get("v1/usertask", self.base_url, params=query_parameter)
 
     def list_user_tasks(self, query_parameter):
         """
@@ -178,14 +208,14 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.check_response(HTTPStatus.NO_CONTENT)
     def set_user_task_completed(self, user_task_id=None, anon_user_task_id=None):
         if user_task_id is not None:
-            return utils.aws_request(
+            return self.aws_request(
                 "PUT",
                 "v1/user-task-completed",
                 self.base_url,
                 params={"user_task_id": user_task_id},
             )
         elif anon_user_task_id is not None:
-            return utils.aws_request(
+            return self.aws_request(
                 "PUT",
                 "v1/user-task-completed",
                 self.base_url,
@@ -194,7 +224,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.CREATED)
     def create_user_task(self, user_task_data):
-        return utils.aws_request(
+        return self.aws_request(
             "POST", "v1/usertask", self.base_url, data=json.dumps(user_task_data)
         )
 
@@ -211,7 +241,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def _list_group_email_despatch_users(self, group_email_despatch_id):
-        return utils.aws_get(
+        return self.aws_get(
             "v1/list-group-email-despatch-users",
             self.base_url,
             params={"group_email_despatch": group_email_despatch_id},
@@ -233,7 +263,7 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def _list_group_email_despatch_users_with_a_user_email_despatch(self, group_email_despatch_id):
-        return utils.aws_get(
+        return self.aws_get(
             "v1/list-group-email-despatch-users-with-a-user-email-despatch",
             self.base_url,
             params={"group_email_despatch": group_email_despatch_id},
@@ -255,12 +285,82 @@ class CoreApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK)
     def list_user_lists(self):
-        return utils.aws_get("v1/userlist", self.base_url, params={})
+        return self.aws_get("v1/userlist", self.base_url, params={})
 
     @tau.check_response(HTTPStatus.CREATED)
     def create_user_email_despatch(self, user_email_despatch_data):
-        return utils.aws_post(
+        return self.aws_post(
             "v1/useremaildespatch",
             self.base_url,
             request_body=json.dumps(user_email_despatch_data),
         )
+
+
+class AsyncCoreApiClient(tau.AsyncThiscoveryApiClient, CoreApiClient):
+    """
+    asyncio version of CoreApiClient; methods return coroutines. Methods that
+    post-process API responses are overridden here to await them first
+    """
+
+    async def get_user_id_by_email(self, email):
+        user = await self.get_user_by_email(email=email)
+        return user["id"]
+
+    async def get_users_by_email(
+        self, emails, max_workers=None, return_exceptions=False
+    ):
+        return await utils.parallel_map_async(
+            lambda email: self.get_user_by_email(email=email),
+            emails,
+            max_concurrency=max_workers,
+            return_exceptions=return_exceptions,
+        )
+
+    async def get_userprojects(self, user_id):
+        return await self._get_userprojects(user_id=user_id)
+
+    async def get_userprojects_from_anon_user_task_id(self, anon_user_task_id):
+        return await self._get_userprojects(anon_user_task_id=anon_user_task_id)
+
+    async def list_user_tasks(self, query_parameter):
+        user_task_info = await self._list_user_tasks(query_parameter=query_parameter)
+        if isinstance(user_task_info, dict):
+            return [user_task_info]
+        else:  # user_task_info is list
+            return user_task_info
+
+    async def get_user_task_id_for_project(self, user_id, project_task_id):
+        result = await self.list_user_tasks(query_parameter={"user_id": user_id})
+        for user_task in result:
+            if user_task["project_task_id"] == project_task_id:
+                return user_task["user_task_id"]
+
+    async def get_user_task_from_anon_user_task_id(self, anon_user_task_id):
+        result = await self.list_user_tasks(
+            query_parameter={"anon_user_task_id": anon_user_task_id}
+        )
+        for user_task in result:
+            if user_task["anon_user_task_id"] == anon_user_task_id:
+                return user_task
+
+    async def get_project_from_project_task_id(self, project_task_id):
+        project_list = await self.get_projects()
+        for project in project_list:
+            for t in project["tasks"]:
+                if t["id"] == project_task_id:
+                    return project
+        raise utils.ObjectDoesNotExistError(
+            f"Project task {project_task_id} not found", details={}
+        )
+
+    async def list_group_email_despatch_users(self, group_email_despatch_id):
+        return await self._list_group_email_despatch_users(
+            group_email_despatch_id=group_email_despatch_id
+        )
+
+    async def list_group_email_despatch_users_with_a_user_email_despatch(
+        self, group_email_despatch_id
+    ):
+        return await self._list_group_email_despatch_users_with_a_user_email_despatch(
+            group_email_despatch_id=group_email_despatch_id
+        )
@@ -15,6 +15,7 @@
 #   A copy of the GNU Affero General Public License is available in the
 #   docs folder of this project.  It is also available www.gnu.org/licenses/
 #
+import functools
 import json
 import os
 from thiscovery_lib.utilities import (
@@ -37,6 +38,7 @@ def append_country_name(entity):
     entity["birth_country_name"] = get_country_name(birth_country_code)
 
 
+@functools.lru_cache(maxsize=None)
 def load_countries():
     country_list_filename = os.path.join(
         os.path.dirname(os.path.realpath(__file__)), "countries.json"
@@ -50,11 +52,17 @@ def load_countries():
 
 def get_country_name(country_code):
     try:
-        return countries.get(country_code)
+        return load_countries().get(country_code)
     except KeyError as err:
         errorjson = {"country_code": country_code}
         raise DetailedValueError("invalid country code", errorjson)
 
 
-countries = load_countries()
+def __getattr__(name):
+    # countries.json is parsed on first use rather than at import (PEP 562)
+    if name == "countries":
+        return load_countries()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # endregion
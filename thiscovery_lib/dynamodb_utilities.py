@@ -113,11 +113,13 @@ class Dynamodb(utils.BaseClient):
 
             self.logger.info(
                 "dynamodb put",
-                extra={
-                    "table_name": table_name,
-                    "item": item,
-                    "correlation_id": self.correlation_id,
-                },
+                extra=utils.LazyExtra(
+                    lambda: {
+                        "table_name": table_name,
+                        "item": item,
+                        "correlation_id": self.correlation_id,
+                    }
+                ),
             )
             if update_allowed:
                 result = table.put_item(Item=item)
@@ -170,7 +172,7 @@ class Dynamodb(utils.BaseClient):
             US 2951 proposes adding support for partial map updates to this function.
         """
         if correlation_id is None:
-            correlation_id = utils.new_correlation_id()
+            correlation_id = self.correlation_id or utils.new_correlation_id()
 
         table = self.get_table(table_name)
         key_json = {key_name: key}
@@ -199,13 +201,15 @@ class Dynamodb(utils.BaseClient):
 
         self.logger.info(
             "dynamodb update",
-            extra={
-                "table_name": table_name,
-                "key": json.dumps(key_json),
-                "update_expr": update_expr,
-                "values_expr": values_expr,
-                "correlation_id": correlation_id,
-            },
+            extra=utils.LazyExtra(
+                lambda: {
+                    "table_name": table_name,
+                    "key": json.dumps(key_json),
+                    "update_expr": update_expr,
+                    "values_expr": dict(values_expr),
+                    "correlation_id": correlation_id,
+                }
+            ),
         )
         values_expr.update(kwargs.pop("ExpressionAttributeValues", dict()))
         return table.update_item(
@@ -239,12 +243,14 @@ class Dynamodb(utils.BaseClient):
             filter_attr_values = [filter_attr_values]
         self.logger.info(
             "dynamodb scan",
-            extra={
-                "table_name": table_name,
-                "filter_attr_name": filter_attr_name,
-                "filter_attr_value": str(filter_attr_values),
-                "correlation_id": self.correlation_id,
-            },
+            extra=utils.LazyExtra(
+                lambda: {
+                    "table_name": table_name,
+                    "filter_attr_name": filter_attr_name,
+                    "filter_attr_value": str(filter_attr_values),
+                    "correlation_id": self.correlation_id,
+                }
+            ),
         )
         if filter_attr_name is None:
             response = table.scan()
@@ -307,18 +313,20 @@ class Dynamodb(utils.BaseClient):
 
         """
         if correlation_id is None:
-            correlation_id = utils.new_correlation_id()
+            correlation_id = self.correlation_id or utils.new_correlation_id()
         table = self.get_table(table_name)
         key_json = {key_name: key}
         if sort_key:
             key_json.update(sort_key)
         self.logger.info(
             "dynamodb get",
-            extra={
-                "table_name": table_name,
-                "key": json.dumps(key_json),
-                "correlation_id": correlation_id,
-            },
+            extra=utils.LazyExtra(
+                lambda: {
+                    "table_name": table_name,
+                    "key": json.dumps(key_json),
+                    "correlation_id": correlation_id,
+                }
+            ),
         )
         response = table.get_item(Key=key_json)
         if "Item" in response:
@@ -336,18 +344,20 @@ class Dynamodb(utils.BaseClient):
         sort_key=None,
     ):
         if correlation_id is None:
-            correlation_id = utils.new_correlation_id()
+            correlation_id = self.correlation_id or utils.new_correlation_id()
         table = self.get_table(table_name)
         key_json = {key_name: key}
         if sort_key:
             key_json.update(sort_key)
         self.logger.info(
             "dynamodb delete",
-            extra={
-                "table_name": table_name,
-                "key": json.dumps(key_json),
-                "correlation_id": correlation_id,
-            },
+            extra=utils.LazyExtra(
+                lambda: {
+                    "table_name": table_name,
+                    "key": json.dumps(key_json),
+                    "correlation_id": correlation_id,
+                }
+            ),
         )
         return table.delete_item(Key=key_json)
 
@@ -374,7 +384,7 @@ class Dynamodb(utils.BaseClient):
         sort_key_name=None,
     ):
         if correlation_id is None:
-            correlation_id = utils.new_correlation_id()
+            correlation_id = self.correlation_id or utils.new_correlation_id()
         if table_name_verbatim:
             table = self.client.Table(table_name)
         else:
@@ -408,7 +418,7 @@ class Dynamodb(utils.BaseClient):
         return table.wait_until_exists()
 
 
-class DdbBaseTable(metaclass=ABCMeta):
+class DdbBaseTable(utils.ContextCorrelationIdMixin, metaclass=ABCMeta):
     """
     Base abstract class representing a Ddb table
     """
@@ -17,7 +17,6 @@
 #
 import uuid
 import json
-import jsons
 from abc import ABC
 
 from thiscovery_lib.utilities import (
@@ -66,4 +65,6 @@ class EntityBase(ABC):
         return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
 
     def to_dict(self):
+        import jsons
+
         return jsons.dump(self, strip_class_variables=True)
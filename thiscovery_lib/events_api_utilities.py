@@ -19,7 +19,6 @@ import json
 from http import HTTPStatus
 
 import thiscovery_lib.thiscovery_api_utilities as tau
-import thiscovery_lib.utilities as utils
 
 
 class EventsApiClient(tau.ThiscoveryApiClient):
@@ -32,8 +31,14 @@ class EventsApiClient(tau.ThiscoveryApiClient):
 
     @tau.check_response(HTTPStatus.NO_CONTENT, HTTPStatus.METHOD_NOT_ALLOWED)
     def post_event(self, event):
-        return utils.aws_post(
+        return self.aws_post(
             endpoint_url="v1/event",
             base_url=self.base_url,
             request_body=json.dumps(event),
         )
+
+
+class AsyncEventsApiClient(tau.AsyncThiscoveryApiClient, EventsApiClient):
+    """
+    asyncio version of EventsApiClient; methods return coroutines
+    """
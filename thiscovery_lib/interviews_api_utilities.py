@@ -19,7 +19,6 @@ import json
 from http import HTTPStatus
 
 import thiscovery_lib.thiscovery_api_utilities as tau
-import thiscovery_lib.utilities as utils
 
 
 class InterviewsApiClient(tau.ThiscoveryApiClient):
@@ -44,7 +43,7 @@ class InterviewsApiClient(tau.ThiscoveryApiClient):
         self.logger.debug(
             "Calling interviews API appointments-by-type endpoint", extra={"body": body}
         )
-        return utils.aws_request(
+        return self.aws_request(
             method="GET",
             endpoint_url="v1/appointments-by-type",
             base_url=self.base_url,
@@ -63,9 +62,15 @@ class InterviewsApiClient(tau.ThiscoveryApiClient):
         self.logger.debug(
             "Calling interviews API set-interview-url endpoint", extra={"body": body}
         )
-        return utils.aws_request(
+        return self.aws_request(
             method="PUT",
             endpoint_url="v1/set-interview-url",
             base_url=self.base_url,
             data=json.dumps(body),
         )
+
+
+class AsyncInterviewsApiClient(tau.AsyncThiscoveryApiClient, InterviewsApiClient):
+    """
+    asyncio version of InterviewsApiClient; methods return coroutines
+    """
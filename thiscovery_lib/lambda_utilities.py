@@ -20,6 +20,29 @@ import json
 import thiscovery_lib.utilities as utils
 
 
+def _parse_log_record(line):
+    """
+    Returns:
+        The decoded log record if line is a record written by the thiscovery logger
+        without colour; None for any other line (e.g. print output or CloudWatch
+        embedded metric format documents)
+    """
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if (
+        isinstance(record, dict)
+        and "_aws" not in record
+        and "levelname" in record
+        and "message" in record
+    ):
+        return record
+    return None
+
+
 class Lambda(utils.BaseClient):
     def __init__(self, stack_name="thiscovery-core", correlation_id=None):
         super().__init__("lambda", correlation_id=correlation_id)
@@ -54,9 +77,14 @@ class Lambda(utils.BaseClient):
             response["LogResult"] = "None"
         else:
             log_result_list = log_result_str.split("\n")
-            log_result = [
-                json.loads(x.split(";1m")[1]) for x in log_result_list if ";1m" in x
-            ]
+            log_result = list()
+            for x in log_result_list:
+                if ";1m" in x:
+                    log_result.append(json.loads(x.split(";1m")[1]))
+                else:  # log lines written without colour
+                    record = _parse_log_record(x)
+                    if record is not None:
+                        log_result.append(record)
             response["LogResult"] = log_result
         try:
             response["Payload"] = json.loads(response["Payload"].read().decode("utf-8"))
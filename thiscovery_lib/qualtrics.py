@@ -17,16 +17,18 @@
 #
 from __future__ import annotations
 import datetime
-import requests
+import time
+from http import HTTPStatus
 import thiscovery_lib.utilities as utils
 import warnings
 
-from dateutil import parser
 
-
-class BaseClient:
+class BaseClient(utils.ContextCorrelationIdMixin):
     def __init__(self, qualtrics_account_name, api_token=None, correlation_id=None):
         self.base_url = f"https://{qualtrics_account_name}.eu.qualtrics.com/API"
+        # Qualtrics rate limits are per account (see utils.get_rate_limiter)
+        self.rate_limiter_key = f"qualtrics:{qualtrics_account_name}"
+        self.circuit_breaker_name = f"{qualtrics_account_name}.eu.qualtrics.com"
         if api_token is None:
             self.api_token = utils.get_secret("qualtrics-connection")[
                 qualtrics_account_name
@@ -37,8 +39,10 @@ class BaseClient:
         self.correlation_id = correlation_id
 
     def qualtrics_request(
-        self, method, endpoint_url, api_key=None, params=None, data=None
+        self, method, endpoint_url, api_key=None, params=None, data=None, timeout=None
     ):
+        import requests
+
         if api_key is None:
             api_key = self.api_token
 
@@ -57,12 +61,30 @@ class BaseClient:
                 "json": data,
             },
         )
-        response = requests.request(
-            method=method,
-            url=endpoint_url,
-            params=params,
-            headers=headers,
-            json=data,
+        utils.check_deadline(endpoint_url)
+        circuit_breaker = utils.get_circuit_breaker(self.circuit_breaker_name)
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        utils.rate_limit(self.rate_limiter_key)
+        timeout = utils.get_http_timeout(timeout, endpoint_url)
+        started_at = time.monotonic()
+        try:
+            response = requests.request(
+                method=method,
+                url=endpoint_url,
+                params=params,
+                headers=headers,
+                json=data,
+                timeout=timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            utils._record_circuit_breaker_outcome(circuit_breaker, failed=True)
+            raise
+        finally:
+            utils.record_outbound_call(time.monotonic() - started_at)
+        utils._record_circuit_breaker_outcome(
+            circuit_breaker,
+            failed=response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR,
         )
 
         if response.ok:
@@ -373,4 +395,6 @@ class MailingListsClient(BaseClient):
 
 
 def qualtrics2thiscovery_timestamp(qualtrics_datetime_string):
+    from dateutil import parser
+
     return str(parser.parse(qualtrics_datetime_string))
@@ -1,10 +1,7 @@
 import os
 from http import HTTPStatus
 
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Cc, Bcc, Category
-
-from thiscovery_lib.utilities import get_secret
+from thiscovery_lib.utilities import get_secret, rate_limit
 
 
 class EmailError(Exception):
@@ -20,6 +17,9 @@ class SendGridClient:
     variable to the name of the environment the email is being sent from.
     """
 
+    # see thiscovery_lib.utilities.get_rate_limiter
+    rate_limiter_key = "sendgrid"
+
     def __init__(self, sending_data, template_data, template_id):
         """
         args:
@@ -28,6 +28,9 @@ class SendGridClient:
                 the email template
             template_id (string): the id of the template to use for this email
         """
+        # the sendgrid SDK is only imported when an email is actually built
+        from sendgrid import SendGridAPIClient
+
         self.sendgrid_api_client = SendGridAPIClient(self._get_api_key())
         self.environment = os.environ.get("ENVIRONMENT_NAME")
         if self.environment is None:
@@ -40,6 +43,8 @@ class SendGridClient:
         Accepts all the same arguments as the __init__ method and uses them to
         build the email which will be sent.
         """
+        from sendgrid.helpers.mail import Mail, Cc, Bcc, Category
+
         mail = Mail()
         mail.add_to((sending_data["email"], sending_data["name"]))
 
@@ -69,6 +74,7 @@ class SendGridClient:
         return get_secret("sendgrid-api-key")
 
     def send_email(self):
+        rate_limit(self.rate_limiter_key)
         response = self.sendgrid_api_client.send(self.mail)
 
         if response.status_code != HTTPStatus.ACCEPTED:
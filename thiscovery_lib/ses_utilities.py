@@ -21,6 +21,8 @@ from botocore.exceptions import ClientError
 
 class SesClient(utils.BaseClient):
     CHARSET = "UTF-8"
+    # SES limits the number of recipients per second (see utils.get_rate_limiter)
+    rate_limiter_key = "ses"
 
     def __init__(self, profile_name=None):
         super().__init__("ses", profile_name=profile_name)
@@ -75,6 +77,9 @@ class SesClient(utils.BaseClient):
         Returns:
             None
         """
+        utils.rate_limit(
+            self.rate_limiter_key, tokens=self._count_recipients(destination)
+        )
         try:
             response = self.client.send_email(
                 Destination=destination, Message=message, Source=source
@@ -88,6 +93,9 @@ class SesClient(utils.BaseClient):
         """
         https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ses.html#SES.Client.send_raw_email
         """
+        utils.rate_limit(
+            self.rate_limiter_key, tokens=len(kwargs.get("Destinations", [])) or 1
+        )
         try:
             response = self.client.send_raw_email(**kwargs)
             status_code = response["ResponseMetadata"]["HTTPStatusCode"]
@@ -95,6 +103,14 @@ class SesClient(utils.BaseClient):
         except ClientError as e:
             self.logger.error(e)
 
+    @staticmethod
+    def _count_recipients(destination):
+        recipients = sum(
+            len(destination.get(k, []))
+            for k in ["ToAddresses", "CcAddresses", "BccAddresses"]
+        )
+        return max(recipients, 1)
+
     @staticmethod
     def dict_to_html_ul(input_dict):
         begin_list = "<ul>"
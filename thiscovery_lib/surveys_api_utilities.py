@@ -19,7 +19,6 @@ import json
 from http import HTTPStatus
 
 import thiscovery_lib.thiscovery_api_utilities as tau
-import thiscovery_lib.utilities as utils
 
 
 class SurveysApiClient(tau.ThiscoveryApiClient):
@@ -38,7 +37,7 @@ class SurveysApiClient(tau.ThiscoveryApiClient):
         self.logger.debug(
             "Calling surveys API put_response_api endpoint", extra={"body": body}
         )
-        return utils.aws_request(
+        return self.aws_request(
             method="PUT",
             endpoint_url="v1/response",
             base_url=self.base_url,
@@ -50,7 +49,7 @@ class SurveysApiClient(tau.ThiscoveryApiClient):
     def get_personal_link(
         self, survey_id, anon_project_specific_user_id, account="cambridge", **kwargs
     ):
-        return utils.aws_get(
+        return self.aws_get(
             endpoint_url="v1/personal-link",
             base_url=self.base_url,
             params={
@@ -65,10 +64,16 @@ class SurveysApiClient(tau.ThiscoveryApiClient):
     @tau.process_response
     @tau.check_response(HTTPStatus.OK, HTTPStatus.NOT_FOUND)
     def get_user_interview_tasks(self, anon_user_task_id):
-        return utils.aws_get(
+        return self.aws_get(
             endpoint_url="v1/user-interview-tasks",
             base_url=self.base_url,
             params={
                 "anon_user_task_id": anon_user_task_id,
             },
         )
+
+
+class AsyncSurveysApiClient(tau.AsyncThiscoveryApiClient, SurveysApiClient):
+    """
+    asyncio version of SurveysApiClient; methods return coroutines
+    """
@@ -16,13 +16,234 @@
 #   docs folder of this project.  It is also available www.gnu.org/licenses/
 #
 import functools
+import inspect
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
 from http import HTTPStatus
 
 import thiscovery_lib.utilities as utils
 
 
-class ThiscoveryApiClient:
+class SingleFlight:
+    """
+    Lets concurrent identical calls share a single execution: the first caller for a
+    given key runs the call and any caller arriving while it is in flight waits for,
+    and receives, the same result (or exception). Works across threads (do) and
+    across tasks of an event loop (do_async).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+        self._tasks = dict()
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def _join(self, registry, key, factory):
+        """
+        Returns the in-flight entry for key, creating it with factory if there is none,
+        and whether the caller created it
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            entry = registry.get(key)
+            if entry is not None:
+                self._stats["coalesced"] += 1
+                return entry, False
+            entry = registry[key] = factory()
+            return entry, True
+
+    def do(self, key, func):
+        call, leader = self._join(self._calls, key, self._Call)
+        if leader:
+            try:
+                call.result = func()
+            except Exception as err:
+                call.error = err
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, coroutine_function):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        key = (id(loop), key)
+        task, leader = self._join(
+            self._tasks, key, lambda: loop.create_task(coroutine_function())
+        )
+        if leader:
+            task.add_done_callback(functools.partial(self._forget_task, key))
+        # shield so that cancelling one caller does not cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"calls": 0, "coalesced": 0}
+
+
+API_SINGLE_FLIGHT = SingleFlight()
+
+
+def get_coalescing_stats():
+    """
+    Returns:
+        Dict of number of GET calls made by clients with coalesce_requests enabled
+        ("calls") and how many of those shared a request already in flight ("coalesced")
+    """
+    return API_SINGLE_FLIGHT.get_stats()
+
+
+def reset_coalescing_stats():
+    API_SINGLE_FLIGHT.reset_stats()
+
+
+def _request_key(method, endpoint_url, base_url, kwargs):
+    return method, base_url, endpoint_url, utils.freeze(kwargs)
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of successful GET responses of thiscovery API endpoints.
+    Fresh entries are served without calling the API; expired entries that carry an
+    ETag are revalidated with a conditional request (If-None-Match), so that an
+    unchanged payload is not downloaded again.
+    """
+
+    DEFAULT_MAX_ENTRIES = 256
+
+    class _Entry:
+        def __init__(self, response, etag, expires_at):
+            self.response = response
+            self.etag = etag
+            self.expires_at = expires_at
+
+    def __init__(self, max_entries=None):
+        if max_entries is None:
+            max_entries = int(
+                os.environ.get(
+                    "THISCOVERY_API_CACHE_MAX_ENTRIES", self.DEFAULT_MAX_ENTRIES
+                )
+            )
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def lookup(self, key):
+        """
+        Returns:
+            Tuple (response, etag): a copy of the cached response if it is still
+            fresh (otherwise None) and the ETag to revalidate an expired entry with
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None, None
+            self._entries.move_to_end(key)
+            if time.monotonic() < entry.expires_at:
+                self._stats["hits"] += 1
+                return dict(entry.response), None
+            self._stats["misses"] += 1
+            return None, entry.etag
+
+    def store(self, key, response, ttl):
+        """
+        Caches a response obtained with include_headers=True
+
+        Returns:
+            The response to hand to the caller, without headers; for a 304 (Not
+            Modified) response, the revalidated cached response, or None if that
+            entry has since been evicted and the request must be repeated
+        """
+        headers = response.pop("headers", dict())
+        with self._lock:
+            if response["statusCode"] == HTTPStatus.NOT_MODIFIED:
+                entry = self._entries.get(key)
+                if entry is None:
+                    return None
+                entry.expires_at = time.monotonic() + ttl
+                self._stats["revalidated"] += 1
+                return dict(entry.response)
+            if response["statusCode"] == HTTPStatus.OK:
+                self._entries[key] = self._Entry(
+                    response=dict(response),
+                    etag=headers.get("etag"),
+                    expires_at=time.monotonic() + ttl,
+                )
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return response
+
+    def invalidate(self, base_url=None):
+        """
+        Discards all entries, or only those of the API at base_url
+        """
+        with self._lock:
+            if base_url is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[1] == base_url]:
+                    del self._entries[key]
+
+    def get_stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "evictions": 0}
+
+
+API_RESPONSE_CACHE = ResponseCache()
+
+
+def get_response_cache_stats():
+    return API_RESPONSE_CACHE.get_stats()
+
+
+def clear_response_cache():
+    API_RESPONSE_CACHE.invalidate()
+
+
+class ThiscoveryApiClient(utils.ContextCorrelationIdMixin):
+    # if True, concurrent identical GET requests issued by clients of this class share
+    # a single HTTP request (see SingleFlight); set on a subclass or on an instance
+    coalesce_requests = False
+    # seconds for which GET responses of each endpoint (e.g. {"v1/project": 300}) are
+    # served from API_RESPONSE_CACHE; endpoints not listed here are never cached. Empty
+    # by default; set on a subclass or on an instance to opt in, bearing in mind that
+    # writes made by other processes are not seen until cached responses expire
+    cache_ttls = dict()
+    # set to False on an instance to bypass the response cache
+    use_response_cache = True
+
     def __init__(self, correlation_id=None, env_override=None, api_prefix=""):
         self.correlation_id = correlation_id
         self.logger = utils.get_logger()
@@ -37,6 +258,171 @@ class ThiscoveryApiClient:
         else:
             self.base_url = f"https://{env_name}-{api_prefix}api.thiscovery.org/"
 
+    def aws_request(self, method, endpoint_url, base_url=None, **kwargs):
+        """
+        Single entry point for all calls made by client methods, so that subclasses
+        (e.g. AsyncThiscoveryApiClient) can change how requests are sent while
+        reusing the same endpoint definitions
+        """
+        base_url = base_url or self.base_url
+        ttl = self._cache_ttl(method, endpoint_url)
+        if ttl is None:
+            if method != "GET":
+                API_RESPONSE_CACHE.invalidate(base_url)
+            return self._send(method, endpoint_url, base_url, kwargs)
+
+        key = _request_key(method, endpoint_url, base_url, kwargs)
+        response, etag = API_RESPONSE_CACHE.lookup(key)
+        if response is not None:
+            return response
+        kwargs["include_headers"] = True
+        if etag is not None:
+            response = API_RESPONSE_CACHE.store(
+                key,
+                self._send(
+                    method,
+                    endpoint_url,
+                    base_url,
+                    {**kwargs, "extra_headers": {"If-None-Match": etag}},
+                ),
+                ttl,
+            )
+            if response is not None:
+                return response
+        return API_RESPONSE_CACHE.store(
+            key, self._send(method, endpoint_url, base_url, kwargs), ttl
+        )
+
+    def _cache_ttl(self, method, endpoint_url):
+        if method == "GET" and self.use_response_cache:
+            return self.cache_ttls.get(endpoint_url)
+
+    def _send(self, method, endpoint_url, base_url, kwargs):
+        if self.coalesce_requests and method == "GET":
+            response = API_SINGLE_FLIGHT.do(
+                _request_key(method, endpoint_url, base_url, kwargs),
+                lambda: utils.aws_request(method, endpoint_url, base_url, **kwargs),
+            )
+            # each caller gets its own dict, so decorators can't affect each other
+            return dict(response)
+        return utils.aws_request(
+            method=method,
+            endpoint_url=endpoint_url,
+            base_url=base_url,
+            **kwargs,
+        )
+
+    def aws_get(self, endpoint_url, base_url=None, params=None, **kwargs):
+        return self.aws_request("GET", endpoint_url, base_url, params=params, **kwargs)
+
+    def aws_post(
+        self, endpoint_url, base_url=None, params=None, request_body=None, **kwargs
+    ):
+        return self.aws_request(
+            "POST", endpoint_url, base_url, params=params, data=request_body, **kwargs
+        )
+
+    def aws_patch(self, endpoint_url, base_url=None, request_body=None, **kwargs):
+        return self.aws_request(
+            "PATCH", endpoint_url, base_url, data=request_body, **kwargs
+        )
+
+    def aws_delete(self, endpoint_url, base_url=None, **kwargs):
+        return self.aws_request("DELETE", endpoint_url, base_url, **kwargs)
+
+
+class AsyncThiscoveryApiClient:
+    """
+    Mixin turning a ThiscoveryApiClient subclass into an asyncio client. Methods
+    that call the API return coroutines, so many calls can be kept in flight using
+    asyncio.gather. All requests share an aiohttp session whose connector holds at
+    most max_connections open connections. E.g.:
+
+        async with AsyncCoreApiClient(max_connections=200) as client:
+            users = await asyncio.gather(
+                *[client.get_user_by_email(e) for e in emails]
+            )
+
+    Requires aiohttp (pip install thiscovery-lib[async]).
+    """
+
+    def __init__(self, *args, max_connections=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections
+        self._http_session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def get_http_session(self):
+        if self._http_session is None or self._http_session.closed:
+            try:
+                import aiohttp
+            except ImportError as err:
+                raise ImportError(
+                    "aiohttp is required by async thiscovery API clients; "
+                    "install it with pip install thiscovery-lib[async]"
+                ) from err
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return self._http_session
+
+    async def close(self):
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+
+    async def aws_request(self, method, endpoint_url, base_url=None, **kwargs):
+        base_url = base_url or self.base_url
+        ttl = self._cache_ttl(method, endpoint_url)
+        if ttl is None:
+            if method != "GET":
+                API_RESPONSE_CACHE.invalidate(base_url)
+            return await self._send(method, endpoint_url, base_url, kwargs)
+
+        key = _request_key(method, endpoint_url, base_url, kwargs)
+        response, etag = API_RESPONSE_CACHE.lookup(key)
+        if response is not None:
+            return response
+        kwargs["include_headers"] = True
+        if etag is not None:
+            response = API_RESPONSE_CACHE.store(
+                key,
+                await self._send(
+                    method,
+                    endpoint_url,
+                    base_url,
+                    {**kwargs, "extra_headers": {"If-None-Match": etag}},
+                ),
+                ttl,
+            )
+            if response is not None:
+                return response
+        return API_RESPONSE_CACHE.store(
+            key, await self._send(method, endpoint_url, base_url, kwargs), ttl
+        )
+
+    async def _send(self, method, endpoint_url, base_url, kwargs):
+        def send():
+            return utils.async_aws_request(
+                self.get_http_session(),
+                method=method,
+                endpoint_url=endpoint_url,
+                base_url=base_url,
+                **kwargs,
+            )
+
+        if self.coalesce_requests and method == "GET":
+            response = await API_SINGLE_FLIGHT.do_async(
+                _request_key(method, endpoint_url, base_url, kwargs), send
+            )
+            return dict(response)
+        return await send()
+
 
 def check_response(*expected_status_codes):
     """
@@ -52,15 +438,20 @@ def check_response(*expected_status_codes):
     """
 
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            response = func(*args, **kwargs)
+        def check(response):
             assert response["statusCode"] in expected_status_codes, (
                 f"API call initiated by {func.__module__}.{func.__name__} "
                 f"returned error: {response}"
             )
             return response
 
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            response = func(*args, **kwargs)
+            if inspect.isawaitable(response):
+                return _then(response, check)
+            return check(response)
+
         return wrapper
 
     return decorator
@@ -75,9 +466,22 @@ def process_response(func):
         The json-decoded body of the response of the decorated method
     """
 
+    def decode(response):
+        return json.loads(response["body"])
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         response = func(*args, **kwargs)
-        return json.loads(response["body"])
+        if inspect.isawaitable(response):
+            return _then(response, decode)
+        return decode(response)
 
     return wrapper
+
+
+async def _then(awaitable, callback):
+    """
+    Applies callback to the result of awaitable; lets check_response and
+    process_response decorate methods of both sync and async clients
+    """
+    return callback(await awaitable)
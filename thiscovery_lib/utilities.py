@@ -15,27 +15,34 @@
 #   A copy of the GNU Affero General Public License is available in the
 #   docs folder of this project.  It is also available www.gnu.org/licenses/
 #
-import boto3
+import bisect
+import collections.abc
+import concurrent.futures
+import contextvars
+import copy
 import datetime
+import decimal
 import functools
 import json
 import logging
 import os
+import random
 import re
-import requests
-import simplejson
 import sys
+import threading
+import time
 import uuid
 import traceback
-import validators
 import warnings
 
-from botocore.exceptions import ClientError
-from dateutil import parser, tz
 from http import HTTPStatus
-from pythonjsonlogger import jsonlogger
 from timeit import default_timer as timer
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlsplit
+
+# Third-party dependencies (boto3, botocore, requests, simplejson, validators,
+# dateutil and pythonjsonlogger) are imported in the functions that use them,
+# so that importing this module does not add them to the cold start of every
+# lambda that only needs part of it
 
 
 FUNCTION_RESULT_STR = "Function result"
@@ -94,12 +101,16 @@ class DetailedValueError(ValueError):
         self.details = details
 
     def __str__(self):
+        import simplejson
+
         try:
             return f"{self.message}: {simplejson.dumps(self.details)}"
         except:
             return f"DetailedValueError failed to decode error details; here is the error message: {self.message}"
 
     def as_response_body(self):
+        import simplejson
+
         try:
             return json.dumps({"message": self.message, **self.details})
         except TypeError:
@@ -138,6 +149,19 @@ class DetailedIntegrityError(DetailedValueError):
     pass
 
 
+class CircuitOpenError(DetailedValueError):
+    """
+    Raised instead of calling a dependency whose circuit breaker is open
+    """
+
+
+class DeadlineExceededError(DetailedValueError):
+    """
+    Raised instead of making a call once the deadline of the current context (e.g.
+    the lambda invocation) has passed
+    """
+
+
 def error_as_response_body(error_msg, correlation_id):
     return json.dumps({"error": error_msg, "correlation_id": str(correlation_id)})
 
@@ -213,6 +237,8 @@ def running_on_aws():
 
 
 def now_with_tz():
+    from dateutil import tz
+
     return datetime.datetime.now(tz.tzlocal())
 
 
@@ -247,6 +273,131 @@ def obfuscate_data(input, item_key_path):
         pass
 
 
+class RedactionPlan:
+    """
+    Set of key paths whose values are masked, compiled once into a tree so that all
+    of them are redacted in a single traversal of the data. E.g.:
+
+        plan = RedactionPlan(["body.email", "body.participants.*.name", "headers.*"])
+        redacted_event = plan.apply(event, copy=True)
+
+    Paths are dotted strings or sequences of keys (for keys containing dots). The key
+    "*" matches every key of a dictionary and every item of a list or tuple. Paths
+    that do not exist in the data are ignored.
+    """
+
+    MASK = "*****"
+    WILDCARD = "*"
+    # tree node marking the end of a path, i.e. a value to mask
+    _MASKED = True
+
+    def __init__(self, paths):
+        self.paths = tuple(
+            tuple(p.split(".")) if isinstance(p, str) else tuple(p) for p in paths
+        )
+        tree = dict()
+        for path in self.paths:
+            self._add_path(tree, path)
+        self._tree = self._merge_wildcards(tree)
+
+    @classmethod
+    def _add_path(cls, tree, path):
+        node = tree
+        for key in path[:-1]:
+            child = node.get(key)
+            if child is cls._MASKED:
+                # a shorter path already masks this whole subtree
+                return
+            node = node.setdefault(key, dict())
+        node[path[-1]] = cls._MASKED
+
+    @classmethod
+    def _merge(cls, node, other):
+        if node is cls._MASKED or other is cls._MASKED:
+            return cls._MASKED
+        merged = dict(node)
+        for key, child in other.items():
+            merged[key] = cls._merge(merged[key], child) if key in merged else child
+        return merged
+
+    @classmethod
+    def _merge_wildcards(cls, node):
+        """
+        Folds the subtree of "*" into the subtrees of its sibling keys, so that
+        traversal only needs to look up one child per key
+        """
+        if node is cls._MASKED:
+            return node
+        node = {key: cls._merge_wildcards(child) for key, child in node.items()}
+        wildcard = node.get(cls.WILDCARD)
+        if wildcard is not None:
+            for key, child in node.items():
+                if key != cls.WILDCARD:
+                    node[key] = cls._merge(child, wildcard)
+        return node
+
+    def apply(self, data, copy=False):
+        """
+        Args:
+            data: dictionary, list or tuple to redact
+            copy (bool): if True, data is not modified; dictionaries and lists on the
+                    path to redacted values are copied instead (other values are
+                    shared with data)
+
+        Returns:
+            The redacted data (data itself if copy is False and data is mutable)
+        """
+        if not self._tree:
+            return data
+        return self._redact(data, self._tree, copy)
+
+    def _redact(self, value, node, copy):
+        if isinstance(value, dict):
+            if self.WILDCARD in node:
+                keys = list(value)
+            else:
+                keys = [k for k in node if k in value]
+            wildcard = node.get(self.WILDCARD)
+            redacted = value
+            for key in keys:
+                child = node.get(key, wildcard)
+                old = value[key]
+                new = (
+                    self.MASK
+                    if child is self._MASKED
+                    else self._redact(old, child, copy)
+                )
+                if new is not old:
+                    if copy and redacted is value:
+                        redacted = dict(value)
+                    redacted[key] = new
+            return redacted
+        if isinstance(value, (list, tuple)):
+            child = node.get(self.WILDCARD)
+            if child is None:
+                return value
+            redacted = value
+            for index, old in enumerate(value):
+                new = (
+                    self.MASK
+                    if child is self._MASKED
+                    else self._redact(old, child, copy)
+                )
+                if new is not old:
+                    if redacted is value and (copy or isinstance(value, tuple)):
+                        redacted = list(value)
+                    redacted[index] = new
+            if isinstance(value, tuple) and redacted is not value:
+                redacted = tuple(redacted)
+            return redacted
+        return value
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_redaction_plan(paths):
+    return RedactionPlan(paths)
+
+
 # endregion
 
 
@@ -267,9 +418,35 @@ def validate_int(s):
         raise DetailedValueError("invalid integer", errorjson)
 
 
+# Fast paths for the common, canonical forms of validated values. Values they do not
+# match are checked by the original (slower) validation, so they never change which
+# values are accepted.
+_UUID4_PATTERN = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}",
+    re.IGNORECASE,
+)
+_ISO_DATETIME_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}"
+    # offset minutes are checked here, as fromisoformat accepts e.g. +01:60
+    r"(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}(?::?[0-5]\d)?)?)?"
+)
+_URL_PATTERN = re.compile(
+    r"https?://"
+    r"(?P<host>(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63})"
+    r"(?::[1-9][0-9]{0,3})?"
+    r"(?:/[a-z0-9._~%!$&'()*+,;=:@/-]*)?"
+    # name=value query fields, as validators.url parses queries strictly
+    r"(?:\?[a-z0-9._~%!$'()*+,:@/?-]+=[a-z0-9._~%!$'()*+,=:@/?-]*"
+    r"(?:&[a-z0-9._~%!$'()*+,:@/?-]+=[a-z0-9._~%!$'()*+,=:@/?-]*)*)?"
+    r"(?:#[a-z0-9._~%!$&'()*+,;=:@/?-]*)?",
+    re.IGNORECASE,
+)
+
+
 def validate_uuid(s):
+    if isinstance(s, str) and _UUID4_PATTERN.fullmatch(s):
+        return s
     try:
-        uuid.UUID(s, version=4)
         if uuid.UUID(s).version != 4:
             errorjson = {"uuid": s}
             raise DetailedValueError("uuid is not version 4", errorjson)
@@ -280,6 +457,16 @@ def validate_uuid(s):
 
 
 def validate_utc_datetime(s):
+    if isinstance(s, str) and _ISO_DATETIME_PATTERN.fullmatch(s):
+        try:
+            datetime.datetime.fromisoformat(s)
+            return s
+        except ValueError:
+            # e.g. "+01" offsets, not supported by fromisoformat before python 3.11
+            pass
+
+    from dateutil import parser
+
     try:
         # date format should be like '2018-06-12 16:16:56.087895+01'
         parser.isoparse(s)
@@ -289,7 +476,18 @@ def validate_utc_datetime(s):
         raise DetailedValueError("invalid utc format datetime", errorjson)
 
 
+# maximum length of a hostname (labels are limited to 63 characters by _URL_PATTERN)
+_MAX_HOSTNAME_LENGTH = 253
+
+
 def validate_url(s):
+    if isinstance(s, str):
+        match = _URL_PATTERN.fullmatch(s)
+        if match and len(match.group("host")) <= _MAX_HOSTNAME_LENGTH:
+            return s
+
+    import validators
+
     if validators.url(s):
         return s
     else:
@@ -305,508 +503,3456 @@ def validate_boolean(s):
         raise DetailedValueError("invalid boolean", errorjson)
 
 
-# endregion
-
-
-# region boto3
-# The default Boto3 session; autoloaded when needed.
-DEFAULT_SESSION = None
+def validate_values(values, validator):
+    """
+    Validates a list of values (e.g. a column of an import), reporting all invalid
+    values at once rather than stopping at the first one
 
+    Args:
+        values (iterable): values to validate
+        validator: function that returns a valid value and raises DetailedValueError
+                otherwise (e.g. validate_uuid)
 
-def setup_default_session(profile_name):
+    Returns:
+        List of the values returned by validator
     """
-    Set up a default boto3 session, which sets profile_name and region_name if running locally
-    """
-    global DEFAULT_SESSION
-    if running_on_aws():
-        DEFAULT_SESSION = boto3.Session()
-    else:
-        DEFAULT_SESSION = boto3.Session(
-            profile_name=profile_name, region_name=DEFAULT_AWS_REGION
+    results = list()
+    errors = list()
+    for index, value in enumerate(values):
+        try:
+            results.append(validator(value))
+        except DetailedValueError as err:
+            errors.append({"index": index, "message": err.message, **err.details})
+    if errors:
+        raise DetailedValueError(
+            f"{len(errors)} invalid values", {"invalid_values": errors}
         )
+    return results
 
 
-def _get_default_session(profile_name):
-    """
-    Get the default session, creating one if needed.
+def validate_records(records, validators):
     """
-    if DEFAULT_SESSION is None:
-        setup_default_session(profile_name)
-    elif DEFAULT_SESSION.profile_name != profile_name:
-        setup_default_session(profile_name)
-    return DEFAULT_SESSION
-
-
-class BaseClient:
-    def __init__(
-        self,
-        service_name,
-        profile_name=None,
-        client_type="low-level",
-        correlation_id=None,
-        **kwargs,
-    ):
-        """
-        Args:
-            service_name (str): AWS service name (e.g. dynamodb, lambda, etc)
-            profile_name (str): Profile in ~/.aws/credentials
-            client_type (str): 'low-level' to create a boto3 low-level service client; or 'resource' to create a boto3 resource service client.
-        """
-        if (profile_name is None) and not running_on_aws():
-            profile_name = namespace2profile(get_aws_namespace())
-        session = _get_default_session(profile_name)
-        self.aws_namespace = kwargs.pop("aws_namespace", None)
-        if client_type == "low-level":
-            self.client = session.client(service_name, **kwargs)
-        elif client_type == "resource":
-            self.client = session.resource(service_name, **kwargs)
-        else:
-            raise NotImplementedError(
-                f"client_type can only be 'low-level' or 'resource', not {client_type}"
-            )
-        self.logger = get_logger()
-        self.correlation_id = correlation_id
-
-    def get_namespace(self):
-        if self.aws_namespace is None:
-            self.aws_namespace = get_aws_namespace()[1:-1]
-        return self.aws_namespace
+    Validates fields of a list of dictionaries (e.g. the rows of an import),
+    reporting all invalid fields at once rather than stopping at the first one
 
+    Args:
+        records (iterable): dictionaries to validate
+        validators (dict): validator of each field (e.g. {"id": validate_uuid});
+                records missing a field are not checked for that field
 
-class SsmClient(BaseClient):
-    def __init__(self):
-        warnings.warn(
-            "This class is deprecated; use thiscovery-lib.ssm_utilities.SsmClient instead",
-            DeprecationWarning,
+    Returns:
+        List of copies of records, with validated fields set to the values returned
+        by their validator
+    """
+    results = list()
+    errors = list()
+    for index, record in enumerate(records):
+        result = dict(record)
+        for field, validator in validators.items():
+            if field not in result:
+                continue
+            try:
+                result[field] = validator(result[field])
+            except DetailedValueError as err:
+                errors.append(
+                    {
+                        "index": index,
+                        "field": field,
+                        "message": err.message,
+                        **err.details,
+                    }
+                )
+        results.append(result)
+    if errors:
+        raise DetailedValueError(
+            f"{len(errors)} invalid values", {"invalid_values": errors}
         )
-        super().__init__("ssm")
-
-    def _prefix_name(self, name, prefix):
-        if prefix is None:
-            prefix = f"/{super().get_namespace()}/"
-        return prefix + name
+    return results
 
-    def get_parameter(self, name, prefix=None):
-        """
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.get_parameter
-        """
-        parameter_name = self._prefix_name(name, prefix)
-        self.logger.debug(f"Getting SSM parameter {parameter_name}")
-        response = self.client.get_parameter(
-            Name=parameter_name,
-        )
-        assert (
-            response["ResponseMetadata"]["HTTPStatusCode"] == 200
-        ), f"call to boto3.client.get_parameter failed with response: {response}"
-        return response["Parameter"]["Value"]
 
-    def put_parameter(self, name, value, prefix=None):
-        """
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.put_parameter
-        """
-        parameter_name = self._prefix_name(name, prefix)
-        self.logger.debug(
-            f"Adding or updating SSM parameter {parameter_name} with value {value}"
-        )
-        response = self.client.put_parameter(
-            Name=parameter_name,
-            Value=value,
-            Type="String",
-            Overwrite=True,
-        )
-        assert (
-            response["ResponseMetadata"]["HTTPStatusCode"] == 200
-        ), f"call to boto3.client.put_parameter failed with response: {response}"
-        return response
+# endregion
 
 
-class SecretsManager(BaseClient):
-    def __init__(self, profile_name=None):
-        super().__init__("secretsmanager", profile_name=profile_name)
+# region Correlation id
+# correlation id of the lambda invocation (or other unit of work) being processed by
+# the current thread or asyncio task; set by lambda_wrapper
+_CORRELATION_ID = contextvars.ContextVar("thiscovery_correlation_id", default=None)
 
-    def _prefix_name(self, name, prefix):
-        if prefix is None:
-            prefix = f"/{super().get_namespace()}/"
-        return prefix + name
 
-    def _create_secret(self, secret_id, value):
-        """
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.create_secret
-        """
-        return self.client.create_secret(
-            Name=secret_id,
-            SecretString=value,
-        )
+def new_correlation_id():
+    return uuid.uuid4()
 
-    def _update_secret(self, secret_id, value):
-        """
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.update_secret
-        """
-        return self.client.update_secret(
-            SecretId=secret_id,
-            SecretString=value,
-        )
 
-    def get_secret_value(self, secret_id):
-        """
-        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.get_secret_value
-        """
-        return self.client.get_secret_value(
-            SecretId=secret_id,
-        )
+def get_current_correlation_id():
+    """
+    Returns:
+        The correlation id set for the current context, or None
+    """
+    return _CORRELATION_ID.get()
 
-    def create_or_update_secret(self, name, value, prefix=None):
-        """
-        Creates or updates a secret in AWS Secrets Manager.
 
-        Args:
-            name (str): the secret name, excluding an environment prefix
-            value (json or dict): key/value pairs in either dict or JSON string format
-            prefix (str): if None, environment name will be used as prefix; use an empty string in calls where no prefix is required
+def set_correlation_id(correlation_id):
+    """
+    Sets the correlation id of the current context, which is then used by the
+    thiscovery logger and by clients created without an explicit correlation_id
 
-        """
-        secret_id = self._prefix_name(name, prefix)
-        if isinstance(value, dict):
-            value = json.dumps(value)
-        self.logger.debug(f"Adding or updating Secret {secret_id} with value {value}")
-        try:
-            response = self._update_secret(secret_id, value)
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Call to boto3.client.update_secret failed with response: {response}"
-        except Exception as exception:
-            error_message = exception.args[0]
-            self.logger.debug(error_message)
-            response = self._create_secret(secret_id, value)
-            assert (
-                response["ResponseMetadata"]["HTTPStatusCode"] == 200
-            ), f"Call to boto3.client.create_secret failed with response: {response}"
-            self.logger.info(f"Added new secret {secret_id} with value {value}")
-        return response
+    Returns:
+        A token that can be passed to reset_correlation_id to restore the previous value
+    """
+    if correlation_id is not None:
+        correlation_id = str(correlation_id)
+    return _CORRELATION_ID.set(correlation_id)
 
 
-# endregion
+def reset_correlation_id(token):
+    _CORRELATION_ID.reset(token)
 
 
-# region Logging
-class _AnsiColorizer(object):
+class correlation_id_context:
     """
-    A colorizer is an object that loosely wraps around a stream, allowing
-    callers to write text to the stream in a particular color.
+    Context manager setting the correlation id of the current context for the
+    duration of a with block. E.g.:
 
-    Colorizer classes must implement C{supported()} and C{write(text, color)}.
+        with utils.correlation_id_context(event["correlation_id"]):
+            process(event)
     """
 
-    _colors = dict(
-        black=30, red=31, green=32, yellow=33, blue=34, magenta=35, cyan=36, white=37
-    )
+    def __init__(self, correlation_id):
+        self.correlation_id = correlation_id
+        self._token = None
 
-    def __init__(self, stream):
-        self.stream = stream
+    def __enter__(self):
+        self._token = set_correlation_id(self.correlation_id)
+        return get_current_correlation_id()
 
-    @classmethod
-    def supported(cls, stream=sys.stdout):
-        """
-        A class method that returns True if the current platform supports
-        coloring terminal output using this method. Returns False otherwise.
-        """
-        if not stream.isatty():
-            return False  # auto color only on TTYs
-        try:
-            import curses
-        except ImportError:
-            return False
-        else:
-            try:
-                try:
-                    return curses.tigetnum("colors") > 2
-                except curses.error:
-                    curses.setupterm()
-                    return curses.tigetnum("colors") > 2
-            except:
-                raise
-                # guess false in case of error
-                return False
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        reset_correlation_id(self._token)
 
-    def write(self, text, color):
-        """
-        Write the given text to the stream in the given color.
 
-        @param text: Text to be written to the stream.
+class ContextCorrelationIdMixin:
+    """
+    Gives classes a correlation_id attribute that, unless set to something other
+    than None, returns the correlation id of the current context
+    """
 
-        @param color: A string label for a color. e.g. 'red', 'white'.
-        """
-        color = self._colors[color]
-        self.stream.write("\x1b[%s;1m%s\x1b[0m" % (color, text))
+    _correlation_id = None
 
+    @property
+    def correlation_id(self):
+        if self._correlation_id is None:
+            return _CORRELATION_ID.get()
+        return self._correlation_id
 
-class ColorHandler(logging.StreamHandler):
-    def __init__(self, stream=sys.stderr):
-        super(ColorHandler, self).__init__(_AnsiColorizer(stream))
+    @correlation_id.setter
+    def correlation_id(self, value):
+        self._correlation_id = value
 
-    def emit(self, record):
-        msg_colors = {
-            logging.DEBUG: "green",
-            logging.INFO: "blue",
-            logging.WARNING: "yellow",
-            logging.ERROR: "red",
-        }
 
-        color = msg_colors.get(record.levelno, "blue")
-        self.stream.write(self.format(record) + "\n", color)
+class CorrelationIdFilter(logging.Filter):
+    """
+    Adds the correlation id of the current context to log records that do not
+    already have one. get_logger installs it on the thiscovery logger, so it runs in
+    the thread that made the logging call, even in queue mode.
+    """
 
+    def filter(self, record):
+        if getattr(record, "correlation_id", None) is None:
+            correlation_id = _CORRELATION_ID.get()
+            if correlation_id is not None:
+                record.correlation_id = correlation_id
+        return True
 
-logger = None
+
+class ContextThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that runs each task in a copy of the context of the thread
+    that submitted it, so that the correlation id (and any other context variables)
+    set by the caller are visible to the task. Tasks scheduled with asyncio already
+    inherit the context of the caller.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def get_correlation_id(event):
+    try:
+        http_header = event["headers"]
+        correlation_id = http_header["Correlation_Id"]
+    except (
+        KeyError,
+        TypeError,
+    ):  # KeyError if no correlation_id in headers, TypeError if no headers
+        correlation_id = new_correlation_id()
+    return str(correlation_id)
+
+
+# endregion
+
+
+# region deadlines
+# time.monotonic() value by which the work of the current thread or asyncio task must
+# be done; set by lambda_wrapper from the remaining time of the invocation
+_DEADLINE = contextvars.ContextVar("thiscovery_deadline", default=None)
+# set to "false" to stop lambda_wrapper from setting a deadline
+LAMBDA_DEADLINE_ENV_VAR = "THISCOVERY_LAMBDA_DEADLINE"
+# seconds before the lambda timeout at which the deadline is set, so that the handler
+# still has time to log and return an error
+LAMBDA_DEADLINE_MARGIN_ENV_VAR = "THISCOVERY_LAMBDA_DEADLINE_MARGIN"
+DEFAULT_LAMBDA_DEADLINE_MARGIN = 1.0
+
+
+def get_remaining_time():
+    """
+    Returns:
+        Seconds left before the deadline of the current context (negative if it has
+        passed), or None if there is no deadline
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def set_deadline(seconds):
+    """
+    Sets the deadline of the current context to seconds from now, unless an earlier
+    deadline is already set. HTTP requests made by this library shrink their timeouts
+    to fit in the time left and, like boto3 calls, raise DeadlineExceededError
+    instead of starting once it has passed.
+
+    Returns:
+        A token that can be passed to reset_deadline to restore the previous deadline
+    """
+    deadline = time.monotonic() + seconds
+    current = _DEADLINE.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _DEADLINE.set(deadline)
+
+
+def reset_deadline(token):
+    _DEADLINE.reset(token)
+
+
+class deadline_context:
+    """
+    Context manager setting a deadline (see set_deadline) for the duration of a with
+    block. E.g.:
+
+        with utils.deadline_context(10):
+            client.get_user_by_email(email)
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._token = None
+
+    def __enter__(self):
+        self._token = set_deadline(self.seconds)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        reset_deadline(self._token)
+
+
+def check_deadline(operation=None):
+    """
+    Raises:
+        DeadlineExceededError: if the deadline of the current context has passed
+    """
+    remaining = get_remaining_time()
+    if (remaining is not None) and (remaining <= 0):
+        raise DeadlineExceededError(
+            "Deadline exceeded",
+            {"operation": operation, "exceeded_by_seconds": -remaining},
+        )
+
+
+def _get_lambda_deadline_seconds(context):
+    """
+    Returns:
+        Seconds from now to the deadline of a lambda invocation, or None if
+        LAMBDA_DEADLINE_ENV_VAR is false or context is not a lambda context
+    """
+    if os.environ.get(LAMBDA_DEADLINE_ENV_VAR, "true").lower() != "true":
+        return None
+    get_remaining_time_in_millis = getattr(
+        context, "get_remaining_time_in_millis", None
+    )
+    if get_remaining_time_in_millis is None:
+        return None
+    margin = os.environ.get(LAMBDA_DEADLINE_MARGIN_ENV_VAR)
+    try:
+        margin = DEFAULT_LAMBDA_DEADLINE_MARGIN if margin is None else float(margin)
+    except ValueError:
+        raise DetailedValueError(
+            f"Invalid value of environment variable {LAMBDA_DEADLINE_MARGIN_ENV_VAR}",
+            {LAMBDA_DEADLINE_MARGIN_ENV_VAR: margin},
+        )
+    return get_remaining_time_in_millis() / 1000 - margin
+
+
+def _on_aws_call_check_deadline(model=None, **kwargs):
+    check_deadline(None if model is None else model.name)
+
+
+# endregion
+
+
+# region parallel map
+PARALLEL_MAX_WORKERS_ENV_VAR = "THISCOVERY_PARALLEL_MAX_WORKERS"
+DEFAULT_PARALLEL_MAX_WORKERS = 10
+
+_PARALLEL_MAP_STATS_LOCK = threading.Lock()
+_PARALLEL_MAP_STATS = {
+    "calls": 0,
+    "items": 0,
+    "completed": 0,
+    "failed": 0,
+    "cancelled": 0,
+}
+
+
+def _get_parallel_max_workers(max_workers):
+    if max_workers is not None:
+        return max_workers
+    value = os.environ.get(PARALLEL_MAX_WORKERS_ENV_VAR)
+    if value is None:
+        return DEFAULT_PARALLEL_MAX_WORKERS
+    try:
+        return int(value)
+    except ValueError:
+        raise DetailedValueError(
+            f"Invalid value of environment variable {PARALLEL_MAX_WORKERS_ENV_VAR}",
+            {PARALLEL_MAX_WORKERS_ENV_VAR: value},
+        )
+
+
+def _parallel_map_wait_seconds(ends_at):
+    """
+    Returns:
+        Seconds until the earliest of ends_at and the deadline of the current
+        context, or None if there is neither
+    """
+    waits = [get_remaining_time()]
+    if ends_at is not None:
+        waits.append(ends_at - time.monotonic())
+    waits = [w for w in waits if w is not None]
+    return min(waits) if waits else None
+
+
+def _record_parallel_map_stats(items, completed, failed, cancelled):
+    with _PARALLEL_MAP_STATS_LOCK:
+        _PARALLEL_MAP_STATS["calls"] += 1
+        _PARALLEL_MAP_STATS["items"] += items
+        _PARALLEL_MAP_STATS["completed"] += completed
+        _PARALLEL_MAP_STATS["failed"] += failed
+        _PARALLEL_MAP_STATS["cancelled"] += cancelled
+
+
+def get_parallel_map_stats():
+    """
+    Returns:
+        Dict with the number of parallel_map and parallel_map_async calls and of the
+        items they processed, completed, failed and cancelled (on deadline)
+    """
+    with _PARALLEL_MAP_STATS_LOCK:
+        return dict(_PARALLEL_MAP_STATS)
+
+
+def reset_parallel_map_stats():
+    with _PARALLEL_MAP_STATS_LOCK:
+        for k in _PARALLEL_MAP_STATS:
+            _PARALLEL_MAP_STATS[k] = 0
+
+
+class _ParallelMapProgress:
+    """
+    Collects the outcome of each item of a parallel_map call
+    """
+
+    def __init__(self, items, return_exceptions, progress_callback):
+        self.results = [None] * len(items)
+        self.completion_order = list()
+        self.return_exceptions = return_exceptions
+        self.progress_callback = progress_callback
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def add(self, index, result=None, error=None):
+        if error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+            result = error
+        self.results[index] = result
+        self.completion_order.append(index)
+        if self.progress_callback is not None:
+            self.progress_callback(len(self.completion_order), len(self.results))
+
+    def cancel(self, indexes):
+        self.cancelled = len(indexes)
+        if not indexes:
+            return
+        error = DeadlineExceededError(
+            "parallel_map deadline exceeded",
+            {"items": len(self.results), "unfinished": len(indexes)},
+        )
+        if not self.return_exceptions:
+            raise error
+        for index in sorted(indexes):
+            self.results[index] = error
+            self.completion_order.append(index)
+
+    def record_stats(self):
+        _record_parallel_map_stats(
+            len(self.results), self.completed, self.failed, self.cancelled
+        )
+
+    def get_results(self, ordered):
+        if ordered:
+            return self.results
+        return [self.results[i] for i in self.completion_order]
+
+
+def parallel_map(
+    func,
+    items,
+    max_workers=None,
+    ordered=True,
+    return_exceptions=False,
+    timeout=None,
+    progress_callback=None,
+):
+    """
+    Calls func on each item in a pool of threads. The threads run in a copy of the
+    caller's context (see ContextThreadPoolExecutor), so they log with its
+    correlation id and share its deadline. E.g.:
+
+        users = utils.parallel_map(client.get_user_by_email, emails, max_workers=20)
+
+    Args:
+        func: function taking a single item
+        items (iterable): items to process
+        max_workers (int): maximum number of items processed at once; defaults to
+                THISCOVERY_PARALLEL_MAX_WORKERS or 10
+        ordered (bool): if True, results are in the order of items; if False, in the
+                order in which they completed
+        return_exceptions (bool): if True, exceptions raised by func are returned in
+                place of results; if False, the first one is raised and items not
+                started yet are cancelled
+        timeout (float): seconds; items not finished by then, or by the deadline of
+                the current context (see set_deadline), are cancelled
+        progress_callback: called on the calling thread with (items done, total
+                items) every time an item completes
+
+    Returns:
+        List of results
+
+    Raises:
+        DeadlineExceededError: if items were cancelled and return_exceptions is
+                False; with return_exceptions, it is returned for each of them
+    """
+    items = list(items)
+    if not items:
+        return list()
+    max_workers = _get_parallel_max_workers(max_workers)
+    ends_at = None if timeout is None else time.monotonic() + timeout
+    progress = _ParallelMapProgress(items, return_exceptions, progress_callback)
+    executor = ContextThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    try:
+        futures = {executor.submit(func, item): i for i, item in enumerate(items)}
+        pending = set(futures)
+        while pending:
+            wait_seconds = _parallel_map_wait_seconds(ends_at)
+            if (wait_seconds is not None) and (wait_seconds <= 0):
+                break
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=wait_seconds,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    progress.add(futures[future], result=future.result())
+                except Exception as err:
+                    progress.add(futures[future], error=err)
+                    if not return_exceptions:
+                        for f in pending:
+                            f.cancel()
+                        raise
+        for future in pending:
+            future.cancel()
+        progress.cancel([futures[f] for f in pending])
+    finally:
+        # threads still running cancelled items are not waited for
+        executor.shutdown(wait=False)
+        progress.record_stats()
+    return progress.get_results(ordered)
+
+
+async def parallel_map_async(
+    coroutine_function,
+    items,
+    max_concurrency=None,
+    ordered=True,
+    return_exceptions=False,
+    timeout=None,
+    progress_callback=None,
+):
+    """
+    asyncio equivalent of parallel_map: awaits coroutine_function(item) for each
+    item, with at most max_concurrency of them in progress at once. E.g.:
+
+        async with AsyncCoreApiClient() as client:
+            users = await utils.parallel_map_async(client.get_user_by_email, emails)
+
+    Args:
+        max_concurrency (int): defaults to THISCOVERY_PARALLEL_MAX_WORKERS or 10
+        other args: see parallel_map
+
+    Returns:
+        List of results
+    """
+    import asyncio
+
+    items = list(items)
+    if not items:
+        return list()
+    semaphore = asyncio.Semaphore(_get_parallel_max_workers(max_concurrency))
+    ends_at = None if timeout is None else time.monotonic() + timeout
+    progress = _ParallelMapProgress(items, return_exceptions, progress_callback)
+
+    async def run(item):
+        async with semaphore:
+            return await coroutine_function(item)
+
+    tasks = {asyncio.ensure_future(run(item)): i for i, item in enumerate(items)}
+    pending = set(tasks)
+    try:
+        while pending:
+            wait_seconds = _parallel_map_wait_seconds(ends_at)
+            if (wait_seconds is not None) and (wait_seconds <= 0):
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=wait_seconds, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                try:
+                    progress.add(tasks[task], result=task.result())
+                except Exception as err:
+                    progress.add(tasks[task], error=err)
+                    if not return_exceptions:
+                        raise
+        progress.cancel([tasks[t] for t in pending])
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        progress.record_stats()
+    return progress.get_results(ordered)
+
+
+# endregion
+
+
+# region boto3
+# boto3 sessions are not thread-safe, so each thread keeps its own sessions, one per
+# profile. Sessions are autoloaded when needed; incrementing _SESSIONS_GENERATION
+# makes every thread discard its sessions the next time it asks for one.
+_SESSIONS = threading.local()
+_SESSIONS_GENERATION = 0
+
+
+def _create_session(profile_name):
+    """
+    Creates a boto3 session, which sets profile_name and region_name if running locally
+    """
+    import boto3
+
+    if running_on_aws():
+        return boto3.Session()
+    return boto3.Session(profile_name=profile_name, region_name=DEFAULT_AWS_REGION)
+
+
+def _get_thread_sessions():
+    if getattr(_SESSIONS, "generation", None) != _SESSIONS_GENERATION:
+        _SESSIONS.generation = _SESSIONS_GENERATION
+        _SESSIONS.by_profile = dict()
+    return _SESSIONS.by_profile
+
+
+def get_session(profile_name=None):
+    """
+    Returns the calling thread's boto3 session for profile_name, creating one if needed.
+    Sessions are reused by all subsequent calls from the same thread, so threads never
+    share (or replace) each other's sessions.
+    """
+    sessions = _get_thread_sessions()
+    try:
+        return sessions[profile_name]
+    except KeyError:
+        session = sessions[profile_name] = _create_session(profile_name)
+        return session
+
+
+def setup_default_session(profile_name):
+    """
+    Replaces the calling thread's boto3 session for profile_name with a new one
+    """
+    session = _get_thread_sessions()[profile_name] = _create_session(profile_name)
+    return session
+
+
+def reset_sessions():
+    """
+    Discards the boto3 sessions of all threads; new sessions are created on demand
+    """
+    global _SESSIONS_GENERATION
+    _SESSIONS_GENERATION += 1
+
+
+# Performance profile applied to every boto3 client built through BaseClient.
+# Options are the botocore Config arguments listed in BOTO_CONFIG_ENV_VARS, except
+# that retries are set with the flat retry_mode and max_attempts options. A value of
+# None leaves the botocore default in place.
+DEFAULT_BOTO_CONFIG = {
+    "max_pool_connections": 50,
+    "tcp_keepalive": True,
+    "connect_timeout": None,
+    "read_timeout": None,
+    "retry_mode": None,
+    "max_attempts": None,
+}
+
+BOTO_CONFIG_ENV_VARS = {
+    "max_pool_connections": ("THISCOVERY_BOTO_MAX_POOL_CONNECTIONS", int),
+    "tcp_keepalive": ("THISCOVERY_BOTO_TCP_KEEPALIVE", lambda x: x.lower() == "true"),
+    "connect_timeout": ("THISCOVERY_BOTO_CONNECT_TIMEOUT", float),
+    "read_timeout": ("THISCOVERY_BOTO_READ_TIMEOUT", float),
+    "retry_mode": ("THISCOVERY_BOTO_RETRY_MODE", str),
+    "max_attempts": ("THISCOVERY_BOTO_MAX_ATTEMPTS", int),
+}
+
+# JSON object mapping AWS service names to option overrides for that service only;
+# e.g. '{"dynamodb": {"max_pool_connections": 100, "retry_mode": "adaptive"}}'
+BOTO_SERVICE_CONFIG_ENV_VAR = "THISCOVERY_BOTO_SERVICE_CONFIG"
+
+# Overrides set in code via set_boto_config; the None key holds library-wide overrides
+_BOTO_CONFIG_OVERRIDES = dict()
+
+
+def _check_boto_config_options(options):
+    unknown = set(options) - set(DEFAULT_BOTO_CONFIG)
+    if unknown:
+        raise DetailedValueError(
+            "Unsupported boto config options",
+            {"unsupported": sorted(unknown), "supported": sorted(DEFAULT_BOTO_CONFIG)},
+        )
+
+
+def set_boto_config(service_name=None, **options):
+    """
+    Overrides the performance profile of boto3 clients created from now on.
+    Clients already created are not affected.
+
+    Args:
+        service_name (str): AWS service name (e.g. dynamodb); if None, options apply to all services
+        **options: any of the keys of DEFAULT_BOTO_CONFIG
+    """
+    _check_boto_config_options(options)
+    _BOTO_CONFIG_OVERRIDES.setdefault(service_name, dict()).update(options)
+
+
+def reset_boto_config():
+    """
+    Discards all overrides set with set_boto_config
+    """
+    _BOTO_CONFIG_OVERRIDES.clear()
+
+
+def get_boto_config_options(service_name):
+    """
+    Resolves the performance profile for service_name. In increasing order of precedence:
+    DEFAULT_BOTO_CONFIG, BOTO_CONFIG_ENV_VARS, service entry in BOTO_SERVICE_CONFIG_ENV_VAR,
+    library-wide set_boto_config overrides and service set_boto_config overrides.
+
+    Returns:
+        Dict of options
+    """
+    options = dict(DEFAULT_BOTO_CONFIG)
+    for option, (env_var_name, cast) in BOTO_CONFIG_ENV_VARS.items():
+        value = os.environ.get(env_var_name)
+        if value is not None:
+            try:
+                options[option] = cast(value)
+            except ValueError:
+                raise DetailedValueError(
+                    f"Invalid value of environment variable {env_var_name}",
+                    {env_var_name: value},
+                )
+    service_config_json = os.environ.get(BOTO_SERVICE_CONFIG_ENV_VAR)
+    if service_config_json:
+        service_options = json.loads(service_config_json).get(service_name, dict())
+        _check_boto_config_options(service_options)
+        options.update(service_options)
+    options.update(_BOTO_CONFIG_OVERRIDES.get(None, dict()))
+    options.update(_BOTO_CONFIG_OVERRIDES.get(service_name, dict()))
+    return options
+
+
+def _boto_config_from_options(options):
+    from botocore.config import Config
+
+    options = dict(options)
+    retries = dict()
+    retry_mode = options.pop("retry_mode")
+    max_attempts = options.pop("max_attempts")
+    if retry_mode is not None:
+        retries["mode"] = retry_mode
+    if max_attempts is not None:
+        retries["max_attempts"] = max_attempts
+    if retries:
+        options["retries"] = retries
+    return Config(**{k: v for k, v in options.items() if v is not None})
+
+
+def get_boto_config(service_name):
+    """
+    Returns:
+        botocore Config object implementing the performance profile of service_name
+    """
+    return _boto_config_from_options(get_boto_config_options(service_name))
+
+
+# Process-wide cache of boto3 clients and resources, so that constructing a
+# BaseClient subclass repeatedly (e.g. once per lambda invocation) reuses the
+# underlying botocore client instead of reloading service models and endpoints.
+# Per-thread resources of threads that have finished are discarded on the next
+# cache miss; if the cache is still full, the oldest entry is evicted.
+_CLIENT_CACHE = dict()
+_CLIENT_CACHE_LOCK = threading.Lock()
+_CLIENT_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+CLIENT_CACHE_MAX_SIZE = 256
+
+
+def freeze(value):
+    """
+    Converts value into a hashable equivalent for use in cache keys (e.g. of boto3
+    clients or API responses).
+    botocore Config instances are keyed by the options they were created with.
+    Other objects without value equality are keyed by identity, so they can only
+    ever match themselves.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    user_provided_options = getattr(value, "_user_provided_options", None)
+    if isinstance(user_provided_options, dict):
+        return type(value), freeze(user_provided_options)
+    return value
+
+
+def _create_client(session, service_name, client_type, config_options, **kwargs):
+    """
+    Creates a boto3 client or resource configured with config_options. A botocore
+    Config passed in kwargs takes precedence over config_options.
+    """
+    config = _boto_config_from_options(config_options)
+    user_config = kwargs.pop("config", None)
+    if user_config is not None:
+        config = config.merge(user_config)
+    if client_type == "low-level":
+        client = session.client(service_name, config=config, **kwargs)
+        _register_aws_call_hooks(client)
+        return client
+    resource = session.resource(service_name, config=config, **kwargs)
+    _register_aws_call_hooks(resource.meta.client)
+    return resource
+
+
+def _get_session_region_name():
+    """
+    Returns the region of sessions created by get_session, without creating one.
+    On AWS, this is the region boto3 reads from the environment; None means that it
+    will be read from the AWS config file instead, which does not change while the
+    process runs.
+    """
+    if running_on_aws():
+        return os.environ.get("AWS_DEFAULT_REGION")
+    return DEFAULT_AWS_REGION
+
+
+def _get_cached_client(
+    service_name, profile_name, client_type, config_options, **kwargs
+):
+    """
+    Returns a boto3 client or resource, creating and caching it if needed. The
+    calling thread's session is only looked up (or created) on a cache miss.
+
+    Low-level clients are thread-safe and shared by all threads. boto3 resources
+    are not thread-safe, so they are cached per thread.
+    """
+    region_name = kwargs.get("region_name", _get_session_region_name())
+    thread = threading.current_thread() if client_type == "resource" else None
+    key = (
+        service_name,
+        profile_name,
+        region_name,
+        client_type,
+        thread,
+        freeze(config_options),
+        freeze(kwargs),
+    )
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(key)
+        if client is not None:
+            _CLIENT_CACHE_STATS["hits"] += 1
+            return client
+        _CLIENT_CACHE_STATS["misses"] += 1
+    # clients are created outside the lock, so that threads building different
+    # clients do not wait for each other; if two threads race to build the same
+    # client, the first one cached wins
+    client = _create_client(
+        get_session(profile_name),
+        service_name,
+        client_type,
+        config_options,
+        **kwargs,
+    )
+    with _CLIENT_CACHE_LOCK:
+        cached_client = _CLIENT_CACHE.get(key)
+        if cached_client is not None:
+            return cached_client
+        _evict_cached_clients()
+        _CLIENT_CACHE[key] = client
+    return client
+
+
+def _evict_cached_clients():
+    """
+    Makes room for a new cache entry. Must be called with _CLIENT_CACHE_LOCK held.
+    """
+    for key in [k for k in _CLIENT_CACHE if k[4] is not None and not k[4].is_alive()]:
+        del _CLIENT_CACHE[key]
+        _CLIENT_CACHE_STATS["evictions"] += 1
+    while len(_CLIENT_CACHE) >= CLIENT_CACHE_MAX_SIZE:
+        del _CLIENT_CACHE[next(iter(_CLIENT_CACHE))]
+        _CLIENT_CACHE_STATS["evictions"] += 1
+
+
+def clear_client_cache(service_name=None):
+    """
+    Discards cached boto3 clients and resources, so that the next BaseClient
+    constructed for the affected services creates a new one (e.g. after
+    credentials have been rotated).
+
+    Args:
+        service_name (str): only discard clients of this AWS service; if None, discard all
+    """
+    with _CLIENT_CACHE_LOCK:
+        if service_name is None:
+            _CLIENT_CACHE.clear()
+        else:
+            for key in [k for k in _CLIENT_CACHE if k[0] == service_name]:
+                del _CLIENT_CACHE[key]
+
+
+def get_client_cache_stats():
+    """
+    Returns:
+        Dict of client cache hits, misses, evictions and current size
+    """
+    with _CLIENT_CACHE_LOCK:
+        return {**_CLIENT_CACHE_STATS, "size": len(_CLIENT_CACHE)}
+
+
+def reset_client_cache_stats():
+    with _CLIENT_CACHE_LOCK:
+        for stat in _CLIENT_CACHE_STATS:
+            _CLIENT_CACHE_STATS[stat] = 0
+
+
+class BaseClient(ContextCorrelationIdMixin):
+    def __init__(
+        self,
+        service_name,
+        profile_name=None,
+        client_type="low-level",
+        correlation_id=None,
+        **kwargs,
+    ):
+        """
+        Args:
+            service_name (str): AWS service name (e.g. dynamodb, lambda, etc)
+            profile_name (str): Profile in ~/.aws/credentials
+            client_type (str): 'low-level' to create a boto3 low-level service client; or 'resource' to create a boto3 resource service client.
+            **kwargs:
+                aws_namespace (str): overrides the namespace returned by get_namespace
+                use_client_cache (bool): if False, always create a new boto3 client instead of
+                        reusing a cached one; defaults to True
+                config (botocore.config.Config): merged on top of the performance profile
+                        returned by get_boto_config
+                Any other kwargs are passed on to boto3 session.client or session.resource
+        """
+        if client_type not in ["low-level", "resource"]:
+            raise NotImplementedError(
+                f"client_type can only be 'low-level' or 'resource', not {client_type}"
+            )
+        if (profile_name is None) and not running_on_aws():
+            profile_name = namespace2profile(get_aws_namespace())
+        self.aws_namespace = kwargs.pop("aws_namespace", None)
+        use_client_cache = kwargs.pop("use_client_cache", True)
+        config_options = get_boto_config_options(service_name)
+        if use_client_cache:
+            self.client = _get_cached_client(
+                service_name,
+                profile_name,
+                client_type,
+                config_options,
+                **kwargs,
+            )
+        else:
+            self.client = _create_client(
+                get_session(profile_name),
+                service_name,
+                client_type,
+                config_options,
+                **kwargs,
+            )
+        self.logger = get_logger()
+        self.correlation_id = correlation_id
+
+    def get_namespace(self):
+        if self.aws_namespace is None:
+            self.aws_namespace = get_aws_namespace()[1:-1]
+        return self.aws_namespace
+
+
+class SsmClient(BaseClient):
+    def __init__(self):
+        warnings.warn(
+            "This class is deprecated; use thiscovery-lib.ssm_utilities.SsmClient instead",
+            DeprecationWarning,
+        )
+        super().__init__("ssm")
+
+    def _prefix_name(self, name, prefix):
+        if prefix is None:
+            prefix = f"/{super().get_namespace()}/"
+        return prefix + name
+
+    def get_parameter(self, name, prefix=None):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.get_parameter
+        """
+        parameter_name = self._prefix_name(name, prefix)
+        self.logger.debug(f"Getting SSM parameter {parameter_name}")
+        response = self.client.get_parameter(
+            Name=parameter_name,
+        )
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"call to boto3.client.get_parameter failed with response: {response}"
+        return response["Parameter"]["Value"]
+
+    def put_parameter(self, name, value, prefix=None):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ssm.html#SSM.Client.put_parameter
+        """
+        parameter_name = self._prefix_name(name, prefix)
+        self.logger.debug(
+            f"Adding or updating SSM parameter {parameter_name} with value {value}"
+        )
+        response = self.client.put_parameter(
+            Name=parameter_name,
+            Value=value,
+            Type="String",
+            Overwrite=True,
+        )
+        assert (
+            response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        ), f"call to boto3.client.put_parameter failed with response: {response}"
+        return response
+
+
+class SecretsManager(BaseClient):
+    BATCH_SIZE = 20
+
+    def __init__(self, profile_name=None):
+        super().__init__("secretsmanager", profile_name=profile_name)
+
+    def _prefix_name(self, name, prefix):
+        if prefix is None:
+            prefix = f"/{super().get_namespace()}/"
+        return prefix + name
+
+    def _create_secret(self, secret_id, value):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.create_secret
+        """
+        return self.client.create_secret(
+            Name=secret_id,
+            SecretString=value,
+        )
+
+    def _update_secret(self, secret_id, value):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.update_secret
+        """
+        return self.client.update_secret(
+            SecretId=secret_id,
+            SecretString=value,
+        )
+
+    def get_secret_value(self, secret_id):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.get_secret_value
+        """
+        return self.client.get_secret_value(
+            SecretId=secret_id,
+        )
+
+    def batch_get_secret_value(self, secret_ids):
+        """
+        https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/secretsmanager.html#SecretsManager.Client.batch_get_secret_value
+
+        Retrieves many secrets using as few calls as possible (the API accepts up to
+        20 secret ids per call and may paginate results)
+
+        Args:
+            secret_ids (list): full names or ARNs of the secrets to retrieve
+
+        Returns:
+            Tuple of (SecretValues entries, Errors entries) of all responses
+        """
+        secret_values = list()
+        errors = list()
+        for i in range(0, len(secret_ids), self.BATCH_SIZE):
+            kwargs = {"SecretIdList": secret_ids[i : i + self.BATCH_SIZE]}
+            while True:
+                response = self.client.batch_get_secret_value(**kwargs)
+                secret_values += response.get("SecretValues", list())
+                errors += response.get("Errors", list())
+                next_token = response.get("NextToken")
+                if not next_token:
+                    break
+                kwargs["NextToken"] = next_token
+        return secret_values, errors
+
+    def create_or_update_secret(self, name, value, prefix=None):
+        """
+        Creates or updates a secret in AWS Secrets Manager.
+
+        Args:
+            name (str): the secret name, excluding an environment prefix
+            value (json or dict): key/value pairs in either dict or JSON string format
+            prefix (str): if None, environment name will be used as prefix; use an empty string in calls where no prefix is required
+
+        """
+        if prefix is None:
+            prefix = f"/{super().get_namespace()}/"
+        secret_id = self._prefix_name(name, prefix)
+        if isinstance(value, dict):
+            value = json.dumps(value)
+        self.logger.debug(f"Adding or updating Secret {secret_id} with value {value}")
+        try:
+            response = self._update_secret(secret_id, value)
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Call to boto3.client.update_secret failed with response: {response}"
+        except Exception as exception:
+            error_message = exception.args[0]
+            self.logger.debug(error_message)
+            response = self._create_secret(secret_id, value)
+            assert (
+                response["ResponseMetadata"]["HTTPStatusCode"] == 200
+            ), f"Call to boto3.client.create_secret failed with response: {response}"
+            self.logger.info(f"Added new secret {secret_id} with value {value}")
+        SECRETS_CACHE.invalidate((prefix, name))
+        return response
+
+
+# endregion
+
+
+# region Logging
+class _AnsiColorizer(object):
+    """
+    A colorizer is an object that loosely wraps around a stream, allowing
+    callers to write text to the stream in a particular color.
+
+    Colorizer classes must implement C{supported()} and C{write(text, color)}.
+    """
+
+    _colors = dict(
+        black=30, red=31, green=32, yellow=33, blue=34, magenta=35, cyan=36, white=37
+    )
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    @classmethod
+    def supported(cls, stream=sys.stdout):
+        """
+        A class method that returns True if the current platform supports
+        coloring terminal output using this method. Returns False otherwise.
+        """
+        if not stream.isatty():
+            return False  # auto color only on TTYs
+        try:
+            import curses
+        except ImportError:
+            return False
+        else:
+            try:
+                try:
+                    return curses.tigetnum("colors") > 2
+                except curses.error:
+                    curses.setupterm()
+                    return curses.tigetnum("colors") > 2
+            except:
+                raise
+                # guess false in case of error
+                return False
+
+    def write(self, text, color):
+        """
+        Write the given text to the stream in the given color.
+
+        @param text: Text to be written to the stream.
+
+        @param color: A string label for a color. e.g. 'red', 'white'.
+        """
+        color = self._colors[color]
+        self.stream.write("\x1b[%s;1m%s\x1b[0m" % (color, text))
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ColorHandler(logging.StreamHandler):
+    def __init__(self, stream=sys.stderr, colorize=True):
+        """
+        Args:
+            stream: stream to write to
+            colorize: True, False or "auto" (only colorize if stream is a terminal)
+        """
+        super(ColorHandler, self).__init__(_AnsiColorizer(stream))
+        if colorize == "auto":
+            try:
+                colorize = _AnsiColorizer.supported(stream)
+            except Exception:
+                colorize = False
+        self.colorize = colorize
+
+    def emit(self, record):
+        try:
+            if not self.colorize:
+                self.stream.stream.write(self.format(record) + "\n")
+                return
+
+            msg_colors = {
+                logging.DEBUG: "green",
+                logging.INFO: "blue",
+                logging.WARNING: "yellow",
+                logging.ERROR: "red",
+            }
+
+            color = msg_colors.get(record.levelno, "blue")
+            self.stream.write(self.format(record) + "\n", color)
+        except Exception:
+            self.handleError(record)
+
+
+def _json_log_default(obj):
+    """
+    Serializes objects that neither orjson nor json support natively, mostly as
+    jsonlogger.JsonFormatter would
+    """
+    if isinstance(obj, decimal.Decimal):
+        if obj == obj.to_integral_value():
+            return int(obj)
+        return float(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, BaseException):
+        return f"{obj.__class__.__name__}: {obj}"
+    if isinstance(obj, type):
+        return obj.__name__
+    try:
+        return str(obj)
+    except Exception:
+        return repr(obj)
+
+
+class FastJsonFormatter(logging.Formatter):
+    """
+    Drop-in replacement for the jsonlogger.JsonFormatter used by get_logger, which
+    outputs the same fields but serializes them with orjson if it is installed (and
+    the json module otherwise). Decimal values are logged as numbers.
+    """
+
+    FIELDS = ("asctime", "module", "funcName", "lineno", "name", "levelname")
+    # attributes of every LogRecord, which are not logged as extras
+    RESERVED_ATTRS = frozenset(
+        logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+    ) | {"message", "asctime"}
+    default_msec_format = "%s.%03d"
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import orjson
+        except ImportError:
+            self._dumps_fast = None
+        else:
+
+            def dumps_fast(log_data):
+                return orjson.dumps(
+                    log_data,
+                    default=_json_log_default,
+                    option=orjson.OPT_NON_STR_KEYS,
+                ).decode("utf-8")
+
+            self._dumps_fast = dumps_fast
+        self._time_cache = (None, None)
+
+    def formatTime(self, record, datefmt=None):
+        # all records logged within the same second share the expensive strftime call
+        second = int(record.created)
+        cached_second, cached_time = self._time_cache
+        if second != cached_second:
+            cached_time = time.strftime(
+                self.default_time_format, self.converter(record.created)
+            )
+            self._time_cache = (second, cached_time)
+        return self.default_msec_format % (cached_time, record.msecs)
+
+    def format(self, record):
+        log_data = {
+            "asctime": self.formatTime(record),
+            "module": record.module,
+            "funcName": record.funcName,
+            "lineno": record.lineno,
+            "name": record.name,
+            "levelname": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            log_data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exc_info"] = record.exc_text
+        if record.stack_info:
+            log_data["stack_info"] = self.formatStack(record.stack_info)
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED_ATTRS and not key.startswith("_"):
+                log_data[key] = value
+        return self.serialize(log_data)
+
+    def serialize(self, log_data):
+        if self._dumps_fast is not None:
+            try:
+                return self._dumps_fast(log_data)
+            except TypeError:
+                # e.g. integers over 64 bits or circular references; let json decide
+                pass
+        return json.dumps(log_data, default=_json_log_default)
+
+
+class LazyExtra(collections.abc.Mapping):
+    """
+    Mapping to pass as the extra argument of logging calls whose fields are expensive
+    to compute. factory is only called (once) if the record is actually emitted, i.e.
+    not if the log level is disabled. E.g.:
+
+        logger.info(
+            "dynamodb get", extra=utils.LazyExtra(lambda: {"key": json.dumps(key)})
+        )
+    """
+
+    __slots__ = ("_factory", "_extra")
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._extra = None
+
+    def _resolve(self):
+        if self._extra is None:
+            self._extra = self._factory()
+        return self._extra
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+
+logger = None
+LOG_LEVEL_ENV_VAR = "THISCOVERY_LOG_LEVEL"
+# set to "queue" to format and write log records in a background thread
+LOG_MODE_ENV_VAR = "THISCOVERY_LOG_MODE"
+# set to "fast" to use FastJsonFormatter
+LOG_FORMATTER_ENV_VAR = "THISCOVERY_LOG_FORMATTER"
+# "always", "never" or "auto"; defaults to "auto" for the fast formatter and to
+# "always" otherwise
+LOG_COLOR_ENV_VAR = "THISCOVERY_LOG_COLOR"
+_log_listener = None
+
+
+def _create_log_handler():
+    if os.environ.get(LOG_FORMATTER_ENV_VAR) == "fast":
+        formatter = FastJsonFormatter()
+        default_color = "auto"
+    else:
+        from pythonjsonlogger import jsonlogger
+
+        formatter = jsonlogger.JsonFormatter(
+            "%(asctime)s %(module)s %(funcName)s %(lineno)d %(name)-2s %(levelname)-8s %(message)s"
+        )
+        formatter.default_msec_format = "%s.%03d"
+        default_color = "always"
+
+    color = os.environ.get(LOG_COLOR_ENV_VAR, default_color)
+    try:
+        colorize = {"always": True, "never": False, "auto": "auto"}[color]
+    except KeyError:
+        raise DetailedValueError(
+            f"Invalid value of environment variable {LOG_COLOR_ENV_VAR}",
+            {LOG_COLOR_ENV_VAR: color},
+        )
+
+    log_handler = ColorHandler(colorize=colorize)
+    log_handler.setLevel(logging.DEBUG)
+    log_handler.setFormatter(formatter)
+    return log_handler
 
 
 def get_logger():
     global logger
     if logger is None:
+        log_level = os.environ.get(LOG_LEVEL_ENV_VAR, "DEBUG").upper()
+        if not isinstance(logging.getLevelName(log_level), int):
+            raise DetailedValueError(
+                f"Invalid value of environment variable {LOG_LEVEL_ENV_VAR}",
+                {LOG_LEVEL_ENV_VAR: log_level},
+            )
+        log_handler = _create_log_handler()
+        if os.environ.get(LOG_MODE_ENV_VAR) == "queue":
+            log_handler = _start_log_listener([log_handler])
+
         logger = logging.getLogger("thiscovery")
-        formatter = jsonlogger.JsonFormatter(
-            "%(asctime)s %(module)s %(funcName)s %(lineno)d %(name)-2s %(levelname)-8s %(message)s"
+        logger.addHandler(log_handler)
+        logger.addFilter(CorrelationIdFilter())
+        logger.setLevel(log_level)
+        logger.propagate = False
+    return logger
+
+
+def _snapshot_log_value(value, memo):
+    """
+    Copies the dicts, lists, tuples and sets in value, recursively; other objects
+    are not copied. memo maps the ids of containers already copied to their copies,
+    so that shared and self-referencing containers are copied once.
+    """
+    if not isinstance(value, (dict, list, tuple, set, frozenset)):
+        return value
+    try:
+        return memo[id(value)]
+    except KeyError:
+        pass
+    if isinstance(value, dict):
+        snapshot = memo[id(value)] = dict()
+        # list() copies the items in one call, before any other thread can add or
+        # remove keys
+        for k, v in list(value.items()):
+            snapshot[k] = _snapshot_log_value(v, memo)
+        return snapshot
+    if isinstance(value, list):
+        snapshot = memo[id(value)] = list()
+        snapshot.extend(_snapshot_log_value(v, memo) for v in list(value))
+        return snapshot
+    return type(value)(_snapshot_log_value(v, memo) for v in list(value))
+
+
+def _start_log_listener(handlers):
+    """
+    Starts a background thread that passes queued log records on to handlers
+
+    Returns:
+        The handler that feeds the queue
+    """
+    global _log_listener
+    import atexit
+    import logging.handlers
+    import queue
+
+    class DeferredFormattingQueueHandler(logging.handlers.QueueHandler):
+        """
+        Unlike QueueHandler, leaves formatting (including of exc_info) to the
+        listener thread. Only the message is rendered here, so that later changes
+        to its args are not reflected in the log. Containers passed in extra are
+        copied, so that the listener never iterates over a dict or list that the
+        caller is changing.
+        """
+
+        def prepare(self, record):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            for name, value in record.__dict__.items():
+                if name not in FastJsonFormatter.RESERVED_ATTRS:
+                    record.__dict__[name] = _snapshot_log_value(value, dict())
+            return record
+
+    class SafeQueueListener(logging.handlers.QueueListener):
+        """
+        Keeps the listener thread running (and flush_logs returning) if a handler
+        fails to handle a record
+        """
+
+        def handle(self, record):
+            try:
+                super().handle(record)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+
+    log_queue = queue.Queue(-1)
+    _log_listener = SafeQueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.unregister(disable_queue_logging)
+    atexit.register(disable_queue_logging)
+    queue_handler = DeferredFormattingQueueHandler(log_queue)
+    queue_handler.setLevel(logging.DEBUG)
+    return queue_handler
+
+
+def enable_queue_logging():
+    """
+    Switches the thiscovery logger to queue mode: log calls only enqueue records,
+    which are formatted and written by a background thread. Call flush_logs to wait
+    until all records logged so far have been written. Setting the environment
+    variable THISCOVERY_LOG_MODE to "queue" enables this mode from the start.
+    """
+    thiscovery_logger = get_logger()
+    if _log_listener is None:
+        handlers = list(thiscovery_logger.handlers)
+        for handler in handlers:
+            thiscovery_logger.removeHandler(handler)
+        thiscovery_logger.addHandler(_start_log_listener(handlers))
+
+
+def disable_queue_logging():
+    """
+    Writes any queued log records, stops the background thread and goes back to
+    writing records on the caller's thread
+    """
+    global _log_listener
+    listener = _log_listener
+    if listener is None:
+        return
+    _log_listener = None
+    listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+
+
+# maximum number of seconds flush_logs waits for queued log records to be written
+FLUSH_LOGS_TIMEOUT = 5
+
+
+def flush_logs(timeout=None):
+    """
+    Blocks until all log records emitted so far have been written, for at most
+    timeout seconds (FLUSH_LOGS_TIMEOUT by default)
+
+    Returns:
+        False if queued records were still waiting to be written when the wait ended;
+        True otherwise
+    """
+    if timeout is None:
+        timeout = FLUSH_LOGS_TIMEOUT
+    listener = _log_listener
+    if listener is not None:
+        log_queue = listener.queue
+        with log_queue.all_tasks_done:
+            flushed = log_queue.all_tasks_done.wait_for(
+                lambda: not log_queue.unfinished_tasks, timeout
+            )
+        if not flushed:
+            return False
+        handlers = listener.handlers
+    elif logger is not None:
+        handlers = logger.handlers
+    else:
+        return True
+    for handler in handlers:
+        handler.flush()
+    return True
+
+
+# endregion
+
+
+# region Secrets processing
+DEFAULT_AWS_REGION = "eu-west-1"
+
+
+def get_aws_region():
+    try:
+        region = os.environ["AWS_REGION"]
+    except KeyError:
+        region = DEFAULT_AWS_REGION
+    return region
+
+
+def get_aws_namespace():
+    try:
+        secrets_namespace = os.environ["SECRETS_NAMESPACE"]
+    except KeyError:
+        raise DetailedValueError(
+            "SECRETS_NAMESPACE environment variable not defined", {}
+        )
+
+    if running_unit_tests():
+        try:
+            secrets_namespace = os.environ["UNIT_TEST_NAMESPACE"]
+        except KeyError:
+            raise DetailedValueError(
+                "UNIT_TEST_NAMESPACE environment variable not defined", {}
+            )
+
+    return secrets_namespace
+
+
+def get_environment_name():
+    namespace = get_aws_namespace()
+    # strip leading and trailing '/' chars
+    return namespace[1:-1]
+
+
+def _resolve_secret_namespace(namespace_override):
+    """
+    Returns:
+        Tuple of namespace to prepend to secret names and, if running locally with a
+        namespace_override, the profile to use
+    """
+    profile = None
+    if namespace_override is None:
+        namespace = get_aws_namespace()
+    else:
+        namespace = namespace_override
+        if not running_on_aws():
+            try:
+                profile_map_json = os.environ["THISCOVERY_PROFILE_MAP"]
+            except KeyError:
+                raise DetailedValueError(
+                    "Environment variable THISCOVERY_PROFILE_MAP not set", details={}
+                )
+            profile_map = json.loads(profile_map_json)
+            profile_key = namespace2name(namespace_override)
+            try:
+                profile = profile_map[profile_key]
+            except KeyError:
+                raise DetailedValueError(
+                    f"Environment variable THISCOVERY_PROFILE_MAP does not include key {profile_key}",
+                    details={"profile_map": profile_map},
+                )
+    return namespace, profile
+
+
+def _fetch_secret(secret_name, profile):
+    from botocore.exceptions import ClientError
+
+    logger = get_logger()
+    logger.info("get_aws_secret: " + secret_name)
+
+    secret = None
+    client = SecretsManager(profile_name=profile)
+
+    try:
+        get_secret_value_response = client.get_secret_value(secret_name)
+        # logger.info('get_aws_secret:secret retrieved')
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            logger.error("The requested secret " + secret_name + " was not found")
+        elif e.response["Error"]["Code"] == "InvalidRequestException":
+            logger.error("The request was invalid due to:" + str(e))
+        elif e.response["Error"]["Code"] == "InvalidParameterException":
+            logger.error("The request had invalid params:" + str(e))
+        else:
+            logger.error("An unexpected exception occurred:" + str(e), exc_info=True)
+        raise
+    except:
+        logger.error(sys.exc_info()[0])
+    else:
+        # logger.info('get_aws_secret:secret about to decode')
+        # Decrypted secret using the associated KMS CMK
+        # Depending on whether the secret was a string or binary, one of these fields will be populated
+        if "SecretString" in get_secret_value_response:
+            secret = get_secret_value_response["SecretString"]
+        else:
+            binary_secret_data = get_secret_value_response["SecretBinary"]
+        # logger.info('get_aws_secret:secret decoded')
+        # logger.info('secret:' + secret)
+
+        secret = json.loads(secret)
+    finally:
+        return secret
+
+
+def _copy_secret(value):
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+class SecretsCache:
+    """
+    In-process cache of secret values, keyed by (namespace, secret name).
+
+    Values younger than ttl seconds are served from the cache. Values older than ttl,
+    but younger than ttl + stale_ttl, are also served from the cache while a background
+    thread fetches a fresh value (stale-while-revalidate). Older values are fetched
+    synchronously, by one thread per key. Failed fetches (None) are never cached.
+    Dict and list values are copied on the way in and out, so callers cannot change
+    the cached value.
+
+    Default ttl and stale_ttl are read from the THISCOVERY_SECRETS_CACHE_TTL and
+    THISCOVERY_SECRETS_CACHE_STALE_TTL environment variables; a ttl of 0 disables caching.
+    """
+
+    DEFAULT_TTL = 300
+    DEFAULT_STALE_TTL = 600
+
+    def __init__(self, ttl=None, stale_ttl=None):
+        if ttl is None:
+            ttl = float(
+                os.environ.get("THISCOVERY_SECRETS_CACHE_TTL", self.DEFAULT_TTL)
+            )
+        if stale_ttl is None:
+            stale_ttl = float(
+                os.environ.get(
+                    "THISCOVERY_SECRETS_CACHE_STALE_TTL", self.DEFAULT_STALE_TTL
+                )
+            )
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = dict()  # key: (value, monotonic time fetched)
+        self._lock = threading.Lock()
+        # key: [lock, number of threads holding or waiting for it]
+        self._key_locks = dict()
+        self._refreshing = set()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    def get(self, key, fetch):
+        """
+        Args:
+            key (tuple): (namespace, secret name)
+            fetch (callable): fetches the current value of the secret; returns None on failure
+
+        Returns:
+            Secret value, or None if it is not cached and could not be fetched
+        """
+        if self.ttl <= 0:
+            return fetch()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                age = time.monotonic() - fetched_at
+                if age < self.ttl:
+                    self._stats["hits"] += 1
+                    return _copy_secret(value)
+                if age < self.ttl + self.stale_ttl:
+                    self._stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=contextvars.copy_context().run,
+                            args=(self._refresh, key, fetch),
+                            daemon=True,
+                        ).start()
+                    return _copy_secret(value)
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = [threading.Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                with self._lock:
+                    # another thread may have fetched the value while we waited
+                    entry = self._entries.get(key)
+                    if (entry is not None) and (time.monotonic() - entry[1] < self.ttl):
+                        self._stats["hits"] += 1
+                        return _copy_secret(entry[0])
+                    self._stats["misses"] += 1
+                value = fetch()
+                if value is not None:
+                    self.put(key, value)
+                return value
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+
+    def lookup(self, key):
+        """
+        Returns:
+            Tuple (True, value) if key has a cached value younger than ttl;
+            otherwise (False, None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None) and (time.monotonic() - entry[1] < self.ttl):
+                self._stats["hits"] += 1
+                return True, _copy_secret(entry[0])
+            self._stats["misses"] += 1
+            return False, None
+
+    def _refresh(self, key, fetch):
+        try:
+            value = fetch()
+        except Exception:
+            value = None
+        with self._lock:
+            self._refreshing.discard(key)
+            if value is None:
+                self._stats["refresh_failures"] += 1
+            else:
+                self._stats["refreshes"] += 1
+                self._entries[key] = (value, time.monotonic())
+
+    def put(self, key, value):
+        value = _copy_secret(value)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, key=None):
+        """
+        Args:
+            key (tuple): (namespace, secret name) to discard; if None, discard all cached secrets
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self._stats:
+                self._stats[k] = 0
+
+
+SECRETS_CACHE = SecretsCache()
+
+
+def get_secret(secret_name, namespace_override=None, use_cache=True):
+    """
+    Retrieves and json-decodes a secret from AWS Secrets Manager. Values are cached
+    in-process by SECRETS_CACHE, so repeated calls do not hit Secrets Manager.
+
+    Args:
+        secret_name (str): the secret name, excluding the namespace prefix
+        namespace_override (str): namespace to use instead of the current one (e.g. /prod/)
+        use_cache (bool): if False, bypass SECRETS_CACHE and fetch the secret from Secrets
+                Manager; the cache is then updated with the fetched value
+
+    Returns:
+        Decoded secret or None if it could not be retrieved. Callers get their own
+        copy, so modifying it does not affect the cache
+    """
+    namespace, profile = _resolve_secret_namespace(namespace_override)
+    # need to prepend secret name with namespace...
+    secret_id = secret_name
+    if namespace is not None:
+        secret_id = namespace + secret_name
+
+    fetch = functools.partial(_fetch_secret, secret_id, profile)
+    if use_cache:
+        return SECRETS_CACHE.get((namespace, secret_name), fetch)
+    secret = fetch()
+    if secret is not None:
+        SECRETS_CACHE.put((namespace, secret_name), secret)
+    return secret
+
+
+def get_secrets(
+    secret_names, namespace_override=None, use_cache=True, raise_on_error=False
+):
+    """
+    Retrieves many secrets at once. Secrets not found in SECRETS_CACHE are fetched
+    with a single BatchGetSecretValue request (paginated if needed) and added to the
+    cache. If the batch request itself fails (e.g. the caller lacks the
+    secretsmanager:BatchGetSecretValue permission), secrets are fetched one by one.
+
+    Args:
+        secret_names (list): secret names, excluding the namespace prefix
+        namespace_override (str): namespace to use instead of the current one (e.g. /prod/)
+        use_cache (bool): if False, fetch all secrets from Secrets Manager
+        raise_on_error (bool): if True, raise a DetailedValueError listing every secret
+                that could not be retrieved
+
+    Returns:
+        Dict mapping secret names to decoded secrets (None for secrets that could not
+        be retrieved, including when Secrets Manager cannot be reached; the errors
+        are logged)
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    logger = get_logger()
+    namespace, profile = _resolve_secret_namespace(namespace_override)
+    prefix = namespace or ""
+    secrets = dict()
+    to_fetch = list()
+    for name in secret_names:
+        found, value = (
+            SECRETS_CACHE.lookup((namespace, name)) if use_cache else (False, None)
+        )
+        if found:
+            secrets[name] = value
+        else:
+            to_fetch.append(name)
+    if not to_fetch:
+        return secrets
+
+    errors = dict()
+    logger.info("get_aws_secrets", extra={"secret_names": to_fetch})
+    try:
+        secret_values, batch_errors = SecretsManager(
+            profile_name=profile
+        ).batch_get_secret_value([prefix + name for name in to_fetch])
+    except (AttributeError, ClientError) as err:
+        # AttributeError: botocore predates BatchGetSecretValue
+        logger.warning(
+            "BatchGetSecretValue failed; fetching secrets one by one",
+            extra={"error": repr(err)},
+        )
+        for name in to_fetch:
+            secrets[name] = _fetch_secret(prefix + name, profile)
+    except BotoCoreError as err:
+        # e.g. EndpointConnectionError; fetching secrets one by one would fail too
+        for name in to_fetch:
+            errors[name] = {"error_code": type(err).__name__, "message": str(err)}
+    else:
+        for secret_value in secret_values:
+            name = secret_value["Name"][len(prefix) :]
+            try:
+                secrets[name] = json.loads(secret_value["SecretString"])
+            except (KeyError, ValueError) as err:
+                errors[name] = {"error_code": type(err).__name__, "message": str(err)}
+        for batch_error in batch_errors:
+            name = batch_error["SecretId"][len(prefix) :]
+            errors[name] = {
+                "error_code": batch_error.get("ErrorCode"),
+                "message": batch_error.get("Message"),
+            }
+
+    for name in to_fetch:
+        value = secrets.setdefault(name, None)
+        if value is None:
+            errors.setdefault(name, {"error_code": "NotRetrieved", "message": None})
+            logger.error(
+                "The requested secret " + prefix + name + " could not be retrieved",
+                extra={"error": errors[name]},
+            )
+        else:
+            SECRETS_CACHE.put((namespace, name), value)
+
+    if errors and raise_on_error:
+        raise DetailedValueError("Failed to retrieve secrets", {"errors": errors})
+    return secrets
+
+
+def invalidate_secret_cache(secret_name=None, namespace_override=None):
+    """
+    Discards cached secret values, so that the next get_secret call fetches them again
+
+    Args:
+        secret_name (str): the secret to discard; if None, all cached secrets are discarded
+        namespace_override (str): namespace of secret_name, if not the current one
+    """
+    if secret_name is None:
+        return SECRETS_CACHE.invalidate()
+    namespace = namespace_override
+    if namespace is None:
+        namespace = get_aws_namespace()
+    SECRETS_CACHE.invalidate((namespace, secret_name))
+
+
+def get_secrets_cache_stats():
+    """
+    Returns:
+        Dict of secrets cache hits, stale_hits, misses, background refreshes,
+        refresh_failures and current size
+    """
+    return SECRETS_CACHE.get_stats()
+
+
+# endregion
+
+
+# region metrics
+# set to "true" to emit invocation metrics (which CloudWatch bills as custom metrics)
+METRICS_ENV_VAR = "THISCOVERY_METRICS"
+METRICS_NAMESPACE_ENV_VAR = "THISCOVERY_METRICS_NAMESPACE"
+DEFAULT_METRICS_NAMESPACE = "Thiscovery"
+_cold_start = True
+# outbound calls (thiscovery API and Qualtrics requests, and AWS API calls) of the
+# current invocation
+_OUTBOUND_CALLS = {"count": 0, "latency": 0.0}
+_OUTBOUND_CALLS_LOCK = threading.Lock()
+
+
+def metrics_enabled():
+    return os.environ.get(METRICS_ENV_VAR, "false").lower() == "true"
+
+
+def record_outbound_call(latency):
+    """
+    Counts an outbound call towards the metrics of the current lambda invocation
+
+    Args:
+        latency (float): duration of the call in seconds
+    """
+    with _OUTBOUND_CALLS_LOCK:
+        _OUTBOUND_CALLS["count"] += 1
+        _OUTBOUND_CALLS["latency"] += latency
+
+
+def _reset_outbound_calls():
+    with _OUTBOUND_CALLS_LOCK:
+        outbound_calls = dict(_OUTBOUND_CALLS)
+        _OUTBOUND_CALLS.update(count=0, latency=0.0)
+    return outbound_calls
+
+
+# upper bounds (in milliseconds) of the buckets of AWS call latency histograms
+AWS_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# error codes that AWS services use to signal throttling
+AWS_THROTTLING_ERROR_CODES = frozenset(
+    [
+        "BandwidthLimitExceeded",
+        "LimitExceededException",
+        "PriorRequestNotComplete",
+        "ProvisionedThroughputExceededException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "RequestThrottledException",
+        "SlowDown",
+        "ThrottledException",
+        "Throttling",
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "TransactionInProgressException",
+    ]
+)
+
+
+class AwsCallStats:
+    """
+    Per (service, operation) statistics of AWS API calls made by BaseClient clients:
+    number of calls, errors, retries and throttling errors, and a latency histogram
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = dict()
+
+    def _get_operation_stats(self, service_name, operation_name):
+        key = (service_name, operation_name)
+        try:
+            return self._stats[key]
+        except KeyError:
+            return self._stats.setdefault(
+                key,
+                {
+                    "calls": 0,
+                    "errors": 0,
+                    "retries": 0,
+                    "throttles": 0,
+                    "latency_ms_sum": 0.0,
+                    "latency_ms_max": 0.0,
+                    "latency_ms_buckets": [0] * (len(AWS_LATENCY_BUCKETS_MS) + 1),
+                },
+            )
+
+    def record_call(self, service_name, operation_name, latency_ms, error, retries):
+        bucket = bisect.bisect_left(AWS_LATENCY_BUCKETS_MS, latency_ms)
+        with self._lock:
+            stats = self._get_operation_stats(service_name, operation_name)
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += retries
+            stats["latency_ms_sum"] += latency_ms
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+            stats["latency_ms_buckets"][bucket] += 1
+
+    def record_throttle(self, service_name, operation_name):
+        with self._lock:
+            self._get_operation_stats(service_name, operation_name)["throttles"] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            Dict mapping "service.operation" to the statistics of that operation; the
+            latency histogram maps the upper bound of each bucket (e.g. "<=50") to
+            the number of calls in it
+        """
+        labels = [f"<={b}" for b in AWS_LATENCY_BUCKETS_MS] + [
+            f">{AWS_LATENCY_BUCKETS_MS[-1]}"
+        ]
+        with self._lock:
+            return {
+                f"{service_name}.{operation_name}": {
+                    **{k: v for k, v in stats.items() if k != "latency_ms_buckets"},
+                    "latency_ms_histogram": dict(
+                        zip(labels, stats["latency_ms_buckets"])
+                    ),
+                }
+                for (service_name, operation_name), stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats = dict()
+
+
+AWS_CALL_STATS = AwsCallStats()
+
+
+def get_aws_call_stats():
+    return AWS_CALL_STATS.snapshot()
+
+
+def reset_aws_call_stats():
+    AWS_CALL_STATS.reset()
+
+
+def _on_aws_before_call(context, model, **kwargs):
+    context["thiscovery_started_at"] = time.monotonic()
+    # after-call-error handlers are not passed the operation model
+    context["thiscovery_operation"] = (model.service_model.service_name, model.name)
+
+
+def _on_aws_after_call(context, http_response=None, parsed=None, **kwargs):
+    started_at = context.pop("thiscovery_started_at", None)
+    if started_at is None:
+        return
+    latency = time.monotonic() - started_at
+    service_name, operation_name = context.pop("thiscovery_operation")
+    record_outbound_call(latency)
+    if parsed is None:  # after-call-error, i.e. an exception was raised
+        error, retries = True, 0
+    else:
+        error = http_response.status_code >= HTTPStatus.BAD_REQUEST
+        retries = parsed.get("ResponseMetadata", dict()).get("RetryAttempts", 0)
+    AWS_CALL_STATS.record_call(
+        service_name, operation_name, latency * 1000, error, retries
+    )
+
+
+def _on_aws_needs_retry(operation, response=None, **kwargs):
+    # must return None, otherwise botocore would take the value as a retry delay
+    if response is None:
+        return
+    http_response, parsed = response
+    error_code = parsed.get("Error", dict()).get("Code")
+    if (
+        error_code in AWS_THROTTLING_ERROR_CODES
+        or http_response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    ):
+        AWS_CALL_STATS.record_throttle(
+            operation.service_model.service_name, operation.name
+        )
+
+
+def _register_aws_call_hooks(client):
+    """
+    Registers botocore event handlers that measure every API call made by client and
+    stop calls from starting after the deadline (see set_deadline)
+    """
+    events = client.meta.events
+    # unlike before-call, before-parameter-build reaches every handler, even if one
+    # of them (e.g. a botocore Stubber) short-circuits the call
+    events.register("before-parameter-build", _on_aws_before_call)
+    events.register("after-call", _on_aws_after_call)
+    events.register("after-call-error", _on_aws_after_call)
+    events.register("needs-retry", _on_aws_needs_retry)
+    # before-send is emitted for every attempt, including retries, but not for calls
+    # short-circuited at before-call
+    events.register("before-parameter-build", _on_aws_call_check_deadline)
+    events.register("before-send", _on_aws_call_check_deadline)
+
+
+def _peak_rss_megabytes():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, kilobytes on Linux
+        return peak_rss / 1024 / 1024
+    return peak_rss / 1024
+
+
+def emit_invocation_metrics(
+    module_name, function_name, duration, cold_start, error_class, correlation_id
+):
+    """
+    Prints the metrics of a lambda invocation to stdout in CloudWatch Embedded Metric
+    Format (EMF), so that CloudWatch extracts them from the lambda logs
+
+    Args:
+        module_name (str): module of the lambda handler (Module dimension)
+        function_name (str): name of the lambda handler (Function dimension)
+        duration (float): duration of the invocation in seconds
+        cold_start (bool): whether this was the first invocation in this container
+        error_class (str): name of the exception raised or HTTP status code returned
+                by a failed invocation; None if it succeeded
+        correlation_id: correlation id of the invocation
+    """
+    outbound_calls = _reset_outbound_calls()
+    metrics = {
+        "Duration": (duration * 1000, "Milliseconds"),
+        "ColdStart": (int(cold_start), "Count"),
+        "OutboundCalls": (outbound_calls["count"], "Count"),
+        "OutboundLatency": (outbound_calls["latency"] * 1000, "Milliseconds"),
+        "Errors": (int(error_class is not None), "Count"),
+    }
+    peak_rss = _peak_rss_megabytes()
+    if peak_rss is not None:
+        metrics["PeakRSS"] = (peak_rss, "Megabytes")
+    open_circuits = sorted(
+        name
+        for name, state in get_circuit_breaker_states().items()
+        if state["state"] != CircuitBreaker.CLOSED
+    )
+    metrics["OpenCircuits"] = (len(open_circuits), "Count")
+
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": os.environ.get(
+                        METRICS_NAMESPACE_ENV_VAR, DEFAULT_METRICS_NAMESPACE
+                    ),
+                    "Dimensions": [["Module", "Function"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        },
+        "Module": module_name,
+        "Function": function_name,
+        **{name: value for name, (value, _) in metrics.items()},
+        "ErrorClass": error_class,
+        "OpenCircuitNames": open_circuits,
+        "correlation_id": str(correlation_id),
+    }
+    sys.stdout.write(json.dumps(document) + "\n")
+    sys.stdout.flush()
+
+
+# endregion
+
+
+# region decorators
+def api_error_handler(func):
+    """
+    Error handler decorator for thiscovery API endpoints.
+    Ensures an AWS lambda function will complete successfully
+    and return a response.
+
+    Use with lambda_wrapper as the outer decorator. E.g.:
+        @lambda_wrapper
+        @api_error_handler
+        def decorated_function():
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        correlation_id = args[0]["correlation_id"]
+        try:
+            return func(*args, **kwargs)
+        except DeliberateError as err:
+            error_message = err.args[0]
+            return {
+                "statusCode": HTTPStatus.METHOD_NOT_ALLOWED,
+                "body": error_as_response_body(error_message, correlation_id),
+            }
+        except DuplicateInsertError as err:
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.CONFLICT, logger, correlation_id
+            )
+        except ObjectDoesNotExistError as err:
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.NOT_FOUND, logger, correlation_id
+            )
+        except DeadlineExceededError as err:
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.GATEWAY_TIMEOUT, logger, correlation_id
+            )
+        except CircuitOpenError as err:
+            # a dependency is unavailable; not the caller's fault
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.SERVICE_UNAVAILABLE, logger, correlation_id
+            )
+        except (
+            PatchAttributeNotRecognisedError,
+            PatchOperationNotSupportedError,
+            PatchInvalidJsonError,
+            DetailedIntegrityError,
+            DetailedValueError,
+        ) as err:
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.BAD_REQUEST, logger, correlation_id
+            )
+        except Exception as err:
+            return log_exception_and_return_edited_api_response(
+                err, HTTPStatus.INTERNAL_SERVER_ERROR, logger, correlation_id
+            )
+
+    return wrapper
+
+
+# lambda_wrapper options and the environment variables that set their defaults
+LAMBDA_LOG_ENV_VARS = {
+    "sample_rate": ("THISCOVERY_LOG_SAMPLE_RATE", float),
+    "log_only_on_error": (
+        "THISCOVERY_LOG_ONLY_ON_ERROR",
+        lambda x: x.lower() == "true",
+    ),
+    "max_field_bytes": ("THISCOVERY_LOG_MAX_FIELD_BYTES", int),
+    "max_list_length": ("THISCOVERY_LOG_MAX_LIST_LENGTH", int),
+    "log_aws_call_stats": (
+        "THISCOVERY_LOG_AWS_CALL_STATS",
+        lambda x: x.lower() == "true",
+    ),
+    # comma-separated key paths (see RedactionPlan), e.g. "body.email,headers.*"
+    "redact_paths": (
+        "THISCOVERY_LOG_REDACT_PATHS",
+        lambda x: tuple(p.strip() for p in x.split(",") if p.strip()),
+    ),
+}
+DEFAULT_LAMBDA_LOG_OPTIONS = {
+    "sample_rate": 1,
+    "log_only_on_error": False,
+    "max_field_bytes": None,
+    "max_list_length": None,
+    "log_aws_call_stats": False,
+    "redact_paths": (),
+}
+
+
+def _get_lambda_log_options(**options):
+    """
+    Resolves lambda_wrapper options: options passed to the decorator take precedence
+    over LAMBDA_LOG_ENV_VARS, which take precedence over DEFAULT_LAMBDA_LOG_OPTIONS
+    """
+    resolved = dict(DEFAULT_LAMBDA_LOG_OPTIONS)
+    for option, (env_var_name, cast) in LAMBDA_LOG_ENV_VARS.items():
+        if options.get(option) is not None:
+            resolved[option] = options[option]
+            continue
+        value = os.environ.get(env_var_name)
+        if value is not None:
+            try:
+                resolved[option] = cast(value)
+            except ValueError:
+                raise DetailedValueError(
+                    f"Invalid value of environment variable {env_var_name}",
+                    {env_var_name: value},
+                )
+    return resolved
+
+
+def truncate_for_log(value, max_field_bytes=None, max_list_length=None):
+    """
+    Makes a potentially large value cheaper to log
+
+    Args:
+        value: value to truncate; it is not modified
+        max_field_bytes (int): if the JSON representation of value is longer than
+                this, value is replaced by a truncated string of that representation
+        max_list_length (int): lists and tuples nested anywhere in value are cut down
+                to this many items, followed by a note of how many were dropped
+
+    Returns:
+        The truncated value
+    """
+    if max_list_length is not None:
+        value = _truncate_lists(value, max_list_length)
+    if max_field_bytes is not None:
+        try:
+            serialized = json.dumps(value, default=str)
+        except (TypeError, ValueError):
+            serialized = str(value)
+        encoded = serialized.encode("utf-8")
+        if len(encoded) > max_field_bytes:
+            value = (
+                encoded[:max_field_bytes].decode("utf-8", errors="ignore")
+                + f"... [truncated; {len(encoded)} bytes in total]"
+            )
+    return value
+
+
+def _truncate_lists(value, max_list_length):
+    if isinstance(value, dict):
+        return {k: _truncate_lists(v, max_list_length) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        truncated = [
+            _truncate_lists(v, max_list_length) for v in value[:max_list_length]
+        ]
+        if len(value) > max_list_length:
+            truncated.append(f"... [{len(value) - max_list_length} more items]")
+        return truncated
+    return value
+
+
+def _is_error_result(result):
+    try:
+        return int(result["statusCode"]) >= HTTPStatus.BAD_REQUEST
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _emit_lambda_metrics(func, duration, error_class, correlation_id):
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    if not metrics_enabled():
+        return
+    try:
+        emit_invocation_metrics(
+            module_name=func.__module__,
+            function_name=func.__name__,
+            duration=duration,
+            cold_start=cold_start,
+            error_class=error_class,
+            correlation_id=correlation_id,
+        )
+    except Exception as err:
+        # metrics must never make an invocation fail
+        get_logger().warning(
+            "Failed to emit invocation metrics", extra={"error": repr(err)}
         )
-        formatter.default_msec_format = "%s.%03d"
 
-        log_handler = ColorHandler()
-        log_handler.setLevel(logging.DEBUG)
-        log_handler.setFormatter(formatter)
 
-        logger.addHandler(log_handler)
-        logger.setLevel(logging.DEBUG)
-        logger.propagate = False
-    return logger
+def lambda_wrapper(
+    func=None,
+    *,
+    sample_rate=None,
+    log_only_on_error=None,
+    max_field_bytes=None,
+    max_list_length=None,
+    log_aws_call_stats=None,
+    redact_paths=None,
+):
+    """
+    Decorator for thiscovery AWS lambdas. Logs the input and
+    output of the decorated lambda.
+
+    Use as @lambda_wrapper or, to limit how much is logged, with arguments. E.g.:
+        @lambda_wrapper(sample_rate=0.1, max_list_length=20)
+        def decorated_function(event, context):
+
+    Invocations that raise an exception or return a statusCode of 400 or above are
+    always logged in full. A record with the correlation id of the invocation is
+    logged even if its input and output are not.
+
+    The correlation id of the invocation is set as the current correlation id (see
+    set_correlation_id) while the decorated function runs, so it is added to all its
+    log records and used by clients created without an explicit correlation_id.
+
+    Unless THISCOVERY_LAMBDA_DEADLINE is false, the deadline of the invocation (see
+    set_deadline) is set THISCOVERY_LAMBDA_DEADLINE_MARGIN seconds (default 1)
+    before the lambda times out, according to the lambda context.
+
+    If metrics_enabled(), the metrics of each invocation are also printed in
+    CloudWatch Embedded Metric Format (see emit_invocation_metrics).
+
+    Args:
+        sample_rate (float): fraction of (successful) invocations whose input and
+                output are logged; default THISCOVERY_LOG_SAMPLE_RATE or 1
+        log_only_on_error (bool): if True, only log the input and output of failed
+                invocations; default THISCOVERY_LOG_ONLY_ON_ERROR or False
+        max_field_bytes (int): see truncate_for_log; default THISCOVERY_LOG_MAX_FIELD_BYTES
+        max_list_length (int): see truncate_for_log; default THISCOVERY_LOG_MAX_LIST_LENGTH
+        log_aws_call_stats (bool): if True, log the statistics of the AWS API calls
+                made during each invocation (see get_aws_call_stats); default
+                THISCOVERY_LOG_AWS_CALL_STATS or False
+        redact_paths (list): key paths (see RedactionPlan) masked in the logged
+                event, result and arguments; the values passed to and returned by
+                the decorated function are not modified; default
+                THISCOVERY_LOG_REDACT_PATHS or none
+    """
+    if func is None:
+        return functools.partial(
+            lambda_wrapper,
+            sample_rate=sample_rate,
+            log_only_on_error=log_only_on_error,
+            max_field_bytes=max_field_bytes,
+            max_list_length=max_list_length,
+            log_aws_call_stats=log_aws_call_stats,
+            redact_paths=redact_paths,
+        )
+
+    @functools.wraps(func)
+    def thiscovery_lambda_wrapper(*args, **kwargs):
+        logger = get_logger()
+        options = _get_lambda_log_options(
+            sample_rate=sample_rate,
+            log_only_on_error=log_only_on_error,
+            max_field_bytes=max_field_bytes,
+            max_list_length=max_list_length,
+            log_aws_call_stats=log_aws_call_stats,
+            redact_paths=redact_paths,
+        )
+        redaction_plan = _compile_redaction_plan(tuple(options["redact_paths"]))
+
+        def truncate(value):
+            return truncate_for_log(
+                value, options["max_field_bytes"], options["max_list_length"]
+            )
+
+        def redact(value):
+            return redaction_plan.apply(value, copy=True)
+
+        # check if the lambda event dict includes a correlation id; if it does not, add one and pass it to the wrapped lambda
+        # also add a logger to the event dict
+        event = args[0]
+        correlation_id = get_correlation_id(event)
+        event["correlation_id"] = correlation_id
+        event["logger"] = logger
+        updated_args = (event, *args[1:])
+
+        def log_input(include_event=True):
+            logger.info(
+                "Input event",
+                extra=LazyExtra(
+                    lambda: {
+                        "decorated func module": func.__module__,
+                        "decorated func name": func.__name__,
+                        **({"event": truncate(redact(event))} if include_event else {}),
+                        "correlation_id": correlation_id,
+                    }
+                ),
+            )
+
+        def log_result(result):
+            logger.info(
+                FUNCTION_RESULT_STR,
+                extra=LazyExtra(
+                    lambda: {
+                        "decorated func module": func.__module__,
+                        "decorated func name": func.__name__,
+                        "result": truncate(redact(result)),
+                        "func args": truncate(tuple(redact(a) for a in args)),
+                        "func kwargs": truncate(redact(kwargs)),
+                        "correlation_id": correlation_id,
+                    }
+                ),
+            )
+
+        log_in_full = (
+            not options["log_only_on_error"]
+            and random.random() < options["sample_rate"]
+        )
+        log_input(include_event=log_in_full)
+        started_at = timer()
+        _reset_outbound_calls()
+        if options["log_aws_call_stats"]:
+            reset_aws_call_stats()
+        deadline_seconds = _get_lambda_deadline_seconds(
+            args[1] if len(args) > 1 else kwargs.get("context")
+        )
+        # make the correlation id available to clients and log records of this invocation
+        correlation_id_token = set_correlation_id(correlation_id)
+        deadline_token = (
+            None if deadline_seconds is None else set_deadline(deadline_seconds)
+        )
+        error_class = None
+        try:
+            result = func(*updated_args, **kwargs)
+        except Exception as err:
+            error_class = type(err).__name__
+            if not log_in_full:
+                log_input()
+            raise
+        else:
+            if _is_error_result(result):
+                error_class = f"HTTP{int(result['statusCode'])}"
+            if log_in_full:
+                log_result(result)
+            elif error_class is not None:
+                log_input()
+                log_result(result)
+            return result
+        finally:
+            _emit_lambda_metrics(
+                func, timer() - started_at, error_class, correlation_id
+            )
+            if options["log_aws_call_stats"]:
+                logger.info(
+                    "AWS call stats",
+                    extra={
+                        "aws_call_stats": get_aws_call_stats(),
+                        "correlation_id": correlation_id,
+                    },
+                )
+            # in queue mode, make sure this invocation's logs are written before
+            # lambda freezes the container
+            flush_logs()
+            reset_correlation_id(correlation_id_token)
+            if deadline_token is not None:
+                reset_deadline(deadline_token)
+
+    return thiscovery_lambda_wrapper
 
 
 # endregion
 
 
-# region Correlation id
+# region rate limiting
+class TokenBucket:
+    """
+    Token bucket rate limiter, safe to share between threads and asyncio tasks.
+    Tokens are added at rate per second, up to burst. Callers that find the bucket
+    empty reserve their tokens anyway and wait until they would have been added, so
+    waiters are served in order and the long-run rate never exceeds rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+            rate (float): tokens (e.g. requests) per second
+            burst (float): size of the bucket, i.e. how many tokens can be taken at
+                    once after a quiet period; defaults to max(rate, 1)
+        """
+        if rate <= 0:
+            raise DetailedValueError("rate must be positive", {"rate": rate})
+        self.rate = rate
+        self.burst = max(rate, 1) if burst is None else burst
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {
+            "acquired": 0,
+            "rejected": 0,
+            "waited": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
 
+    def _reserve(self, tokens, max_wait=None):
+        """
+        Takes tokens from the bucket, unless the caller would have to wait longer than
+        max_wait seconds for them
 
-def new_correlation_id():
-    return uuid.uuid4()
+        Returns:
+            Seconds the caller must wait before using them, or None if no tokens were
+            taken
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if (max_wait is not None) and (wait > max_wait):
+                self._stats["rejected"] += 1
+                return None
+            self._tokens -= tokens
+            self._stats["acquired"] += 1
+            if wait > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds_total"] += wait
+                self._stats["wait_seconds_max"] = max(
+                    self._stats["wait_seconds_max"], wait
+                )
+            return wait
 
+    def acquire(self, tokens=1, max_wait=None):
+        """
+        Blocks until tokens are available
 
-def get_correlation_id(event):
+        Args:
+            tokens (float): number of tokens to take
+            max_wait (float): if tokens would not be available within this many
+                    seconds, return None straight away without taking them
+
+        Returns:
+            Seconds waited, or None if tokens were not taken
+        """
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1, max_wait=None):
+        """
+        asyncio equivalent of acquire
+        """
+        import asyncio
+
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def get_stats(self):
+        with self._lock:
+            return {"rate": self.rate, "burst": self.burst, **self._stats}
+
+
+# JSON object mapping limiter keys to a rate (per second) or to {"rate": ..., "burst":
+# ...}, e.g. {"ses": 14, "qualtrics": {"rate": 5, "burst": 10}}. A key without an
+# account or host (e.g. "qualtrics") sets the limit of each of its keys with one
+# (e.g. "qualtrics:cambridge"), which get a bucket each.
+RATE_LIMITS_ENV_VAR = "THISCOVERY_RATE_LIMITS"
+
+_RATE_LIMITERS = dict()
+_RATE_LIMITERS_LOCK = threading.Lock()
+# Limits set in code via set_rate_limit, which take precedence over RATE_LIMITS_ENV_VAR
+_RATE_LIMIT_OVERRIDES = dict()
+_rate_limits_json = None
+
+
+def _get_rate_limit(key):
+    """
+    Returns:
+        (rate, burst) configured for key, or None if it is not rate limited
+    """
+    limits = json.loads(_rate_limits_json) if _rate_limits_json else dict()
+    limits.update(_RATE_LIMIT_OVERRIDES)
+    limit = limits.get(key, limits.get(key.split(":", 1)[0]))
+    if limit is None:
+        return None
+    if isinstance(limit, dict):
+        return limit["rate"], limit.get("burst")
+    return limit, None
+
+
+def get_rate_limiter(key):
+    """
+    Returns the TokenBucket shared by all clients calling the integration identified
+    by key, e.g. "ses", "sendgrid", "qualtrics:<account>" or "thiscovery-api:<host>"
+
+    Returns:
+        TokenBucket, or None if no rate limit is configured for key
+    """
+    global _rate_limits_json
+    rate_limits_json = os.environ.get(RATE_LIMITS_ENV_VAR)
+    if not (rate_limits_json or _RATE_LIMIT_OVERRIDES or _RATE_LIMITERS):
+        return None
+    with _RATE_LIMITERS_LOCK:
+        if rate_limits_json != _rate_limits_json:
+            # configuration changed; start again with new buckets
+            _rate_limits_json = rate_limits_json
+            _RATE_LIMITERS.clear()
+        try:
+            return _RATE_LIMITERS[key]
+        except KeyError:
+            pass
+        try:
+            limit = _get_rate_limit(key)
+            limiter = None if limit is None else TokenBucket(*limit)
+        except (ValueError, KeyError, TypeError):
+            raise DetailedValueError(
+                f"Invalid value of environment variable {RATE_LIMITS_ENV_VAR}",
+                {RATE_LIMITS_ENV_VAR: rate_limits_json},
+            )
+        _RATE_LIMITERS[key] = limiter
+        return limiter
+
+
+def set_rate_limit(key, rate, burst=None):
+    """
+    Overrides the rate limit of key (see get_rate_limiter) set in THISCOVERY_RATE_LIMITS.
+    Replaces the bucket of key and, if key has no account or host, of all its
+    accounts or hosts.
+
+    Args:
+        key (str): e.g. "ses" or "qualtrics:cambridge"
+        rate (float): requests per second; None to remove the override
+        burst (float): see TokenBucket
+    """
+    with _RATE_LIMITERS_LOCK:
+        if rate is None:
+            _RATE_LIMIT_OVERRIDES.pop(key, None)
+        else:
+            _RATE_LIMIT_OVERRIDES[key] = {"rate": rate, "burst": burst}
+        for k in list(_RATE_LIMITERS):
+            if k == key or k.split(":", 1)[0] == key:
+                del _RATE_LIMITERS[k]
+
+
+def reset_rate_limiters():
+    """
+    Discards all overrides set with set_rate_limit and all buckets
+    """
+    with _RATE_LIMITERS_LOCK:
+        _RATE_LIMIT_OVERRIDES.clear()
+        _RATE_LIMITERS.clear()
+
+
+def _check_rate_limit_wait(key, wait, max_wait):
+    if wait is None:
+        raise DeadlineExceededError(
+            "Deadline exceeded",
+            {"operation": f"rate limit {key}", "remaining_seconds": max_wait},
+        )
+    return wait
+
+
+def rate_limit(key, tokens=1):
+    """
+    Blocks until the rate limiter of key (if any) allows tokens more requests
+
+    Returns:
+        Seconds waited
+
+    Raises:
+        DeadlineExceededError: if tokens would not be available before the deadline of
+                the current context (see set_deadline); no tokens are taken
+    """
+    limiter = get_rate_limiter(key)
+    if limiter is None:
+        return 0.0
+    max_wait = get_remaining_time()
+    return _check_rate_limit_wait(key, limiter.acquire(tokens, max_wait), max_wait)
+
+
+async def rate_limit_async(key, tokens=1):
+    """
+    asyncio equivalent of rate_limit
+    """
+    limiter = get_rate_limiter(key)
+    if limiter is None:
+        return 0.0
+    max_wait = get_remaining_time()
+    return _check_rate_limit_wait(
+        key, await limiter.acquire_async(tokens, max_wait), max_wait
+    )
+
+
+def get_rate_limiter_stats():
+    """
+    Returns:
+        Dict mapping the key of each rate limiter in use to its rate, burst, number of
+        acquisitions, how many of them had to wait and the total and maximum wait
+        in seconds
+    """
+    with _RATE_LIMITERS_LOCK:
+        limiters = dict(_RATE_LIMITERS)
+    return {k: v.get_stats() for k, v in limiters.items() if v is not None}
+
+
+# endregion
+
+
+# region circuit breakers
+CIRCUIT_BREAKER_ENV_VARS = {
+    "enabled": ("THISCOVERY_CIRCUIT_BREAKER", lambda x: x.lower() == "true"),
+    "failure_rate_threshold": ("THISCOVERY_CIRCUIT_FAILURE_RATE", float),
+    "minimum_calls": ("THISCOVERY_CIRCUIT_MIN_CALLS", int),
+    "window_seconds": ("THISCOVERY_CIRCUIT_WINDOW_SECONDS", float),
+    "open_seconds": ("THISCOVERY_CIRCUIT_OPEN_SECONDS", float),
+}
+DEFAULT_CIRCUIT_BREAKER_OPTIONS = {
+    "enabled": True,
+    "failure_rate_threshold": 0.5,
+    "minimum_calls": 20,
+    "window_seconds": 60,
+    "open_seconds": 30,
+}
+
+
+def _get_circuit_breaker_options():
+    options = dict(DEFAULT_CIRCUIT_BREAKER_OPTIONS)
+    for option, (env_var_name, cast) in CIRCUIT_BREAKER_ENV_VARS.items():
+        value = os.environ.get(env_var_name)
+        if value is not None:
+            try:
+                options[option] = cast(value)
+            except ValueError:
+                raise DetailedValueError(
+                    f"Invalid value of environment variable {env_var_name}",
+                    {env_var_name: value},
+                )
+    return options
+
+
+class CircuitBreaker:
+    """
+    Sheds calls to a failing dependency. The breaker is closed (calls go through)
+    until, within the last window_seconds, at least minimum_calls calls were made and
+    at least failure_rate_threshold of them failed. It then opens: calls fail
+    immediately with CircuitOpenError for open_seconds. After that, it is half-open: a
+    single trial call is let through, which closes the breaker if it succeeds and
+    opens it again if it fails.
+
+    Callers call before_call before each call and record_success or record_failure
+    after it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name,
+        failure_rate_threshold=None,
+        minimum_calls=None,
+        window_seconds=None,
+        open_seconds=None,
+    ):
+        """
+        Args:
+            name (str): name of the dependency (e.g. a host), used in errors and logs
+            failure_rate_threshold (float): fraction of failed calls that opens the
+                    breaker; defaults to THISCOVERY_CIRCUIT_FAILURE_RATE or 0.5
+            minimum_calls (int): calls in the window below which the breaker stays
+                    closed; defaults to THISCOVERY_CIRCUIT_MIN_CALLS or 20
+            window_seconds (float): defaults to THISCOVERY_CIRCUIT_WINDOW_SECONDS or 60
+            open_seconds (float): defaults to THISCOVERY_CIRCUIT_OPEN_SECONDS or 30
+        """
+        options = _get_circuit_breaker_options()
+        self.name = name
+        self.failure_rate_threshold = (
+            options["failure_rate_threshold"]
+            if failure_rate_threshold is None
+            else failure_rate_threshold
+        )
+        self.minimum_calls = (
+            options["minimum_calls"] if minimum_calls is None else minimum_calls
+        )
+        self.window_seconds = (
+            options["window_seconds"] if window_seconds is None else window_seconds
+        )
+        self.open_seconds = (
+            options["open_seconds"] if open_seconds is None else open_seconds
+        )
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._trial_started_at = None
+        # [second, calls, failures] of each second in the window with any calls
+        self._buckets = collections.deque()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def _reject(self, now):
+        self._stats["rejected"] += 1
+        raise CircuitOpenError(
+            f"Calls to {self.name} are suspended after repeated failures",
+            {
+                "circuit": self.name,
+                "state": self._state,
+                "retry_in_seconds": max(
+                    0.0, (self._opened_at or now) + self.open_seconds - now
+                ),
+            },
+        )
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: if the call must not be made
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    self._reject(now)
+                self._state = self.HALF_OPEN
+                self._trial_started_at = None
+            # half-open; a trial call that never recorded its outcome (e.g. it raised
+            # an unexpected exception) is given up on after open_seconds
+            if (self._trial_started_at is not None) and (
+                now - self._trial_started_at < self.open_seconds
+            ):
+                self._reject(now)
+            self._trial_started_at = now
+
+    def _window_totals(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            self._buckets.popleft()
+        calls = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        return calls, failures
+
+    def _record(self, now, failed):
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        self._buckets[-1][1] += 1
+        self._buckets[-1][2] += int(failed)
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        self._stats["opened"] += 1
+        get_logger().warning(
+            "Circuit breaker opened",
+            extra={"circuit": self.name, "open_seconds": self.open_seconds},
+        )
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._buckets.clear()
+                get_logger().info(
+                    "Circuit breaker closed", extra={"circuit": self.name}
+                )
+            elif self._state == self.CLOSED:
+                self._record(now, failed=False)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+            elif self._state == self.CLOSED:
+                self._record(now, failed=True)
+                calls, failures = self._window_totals(now)
+                if (calls >= self.minimum_calls) and (
+                    failures >= self.failure_rate_threshold * calls
+                ):
+                    self._open(now)
+
+    def get_state(self):
+        """
+        Returns:
+            Dict with the state of the breaker, the calls and failures in the current
+            window, and how many times it opened and rejected calls
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._state
+            if state == self.OPEN and now - self._opened_at >= self.open_seconds:
+                state = self.HALF_OPEN
+            calls, failures = self._window_totals(now)
+            return {"state": state, "calls": calls, "failures": failures, **self._stats}
+
+
+_CIRCUIT_BREAKERS = dict()
+_CIRCUIT_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """
+    Returns the CircuitBreaker shared by all calls to the dependency identified by
+    name (the host, for HTTP integrations)
+
+    Returns:
+        CircuitBreaker, or None if THISCOVERY_CIRCUIT_BREAKER is false
+    """
     try:
-        http_header = event["headers"]
-        correlation_id = http_header["Correlation_Id"]
-    except (
-        KeyError,
-        TypeError,
-    ):  # KeyError if no correlation_id in headers, TypeError if no headers
-        correlation_id = new_correlation_id()
-    return str(correlation_id)
+        return _CIRCUIT_BREAKERS[name]
+    except KeyError:
+        pass
+    if not _get_circuit_breaker_options()["enabled"]:
+        return None
+    with _CIRCUIT_BREAKERS_LOCK:
+        return _CIRCUIT_BREAKERS.setdefault(name, CircuitBreaker(name))
+
+
+def _record_circuit_breaker_outcome(circuit_breaker, failed):
+    if circuit_breaker is None:
+        return
+    if failed:
+        circuit_breaker.record_failure()
+    else:
+        circuit_breaker.record_success()
+
+
+def get_circuit_breaker_states():
+    """
+    Returns:
+        Dict mapping the name of each circuit breaker in use to its get_state()
+    """
+    with _CIRCUIT_BREAKERS_LOCK:
+        breakers = dict(_CIRCUIT_BREAKERS)
+    return {k: v.get_state() for k, v in breakers.items()}
+
+
+def reset_circuit_breakers():
+    """
+    Discards all circuit breakers, closing them
+    """
+    with _CIRCUIT_BREAKERS_LOCK:
+        _CIRCUIT_BREAKERS.clear()
+
+
+# endregion
+
+
+# region aws api requests
+# Shared requests sessions, one per base url, so that connections to the thiscovery
+# APIs are kept alive and reused by subsequent calls (including in warm lambda
+# invocations). Each session keeps up to THISCOVERY_HTTP_POOL_SIZE connections.
+DEFAULT_HTTP_POOL_SIZE = 20
+_HTTP_SESSIONS = dict()
+_HTTP_SESSIONS_LOCK = threading.Lock()
+
+# (connect, read) timeouts in seconds of HTTP requests made by this library, unless
+# a timeout is passed to them
+DEFAULT_HTTP_TIMEOUT = (5, 30)
+HTTP_TIMEOUT_ENV_VARS = (
+    "THISCOVERY_HTTP_CONNECT_TIMEOUT",
+    "THISCOVERY_HTTP_READ_TIMEOUT",
+)
+
+
+def get_http_timeout(timeout=None, operation=None):
+    """
+    Resolves the timeouts of an HTTP request, shrunk to fit in the time left before
+    the deadline of the current context (see set_deadline)
+
+    Args:
+        timeout (float or tuple): seconds, or (connect, read) seconds; defaults to
+                THISCOVERY_HTTP_CONNECT_TIMEOUT and THISCOVERY_HTTP_READ_TIMEOUT or
+                DEFAULT_HTTP_TIMEOUT
+        operation (str): described in DeadlineExceededError
+
+    Returns:
+        (connect, read) timeouts in seconds
+
+    Raises:
+        DeadlineExceededError: if the deadline has passed
+    """
+    if timeout is None:
+        timeout = list(DEFAULT_HTTP_TIMEOUT)
+        for index, env_var_name in enumerate(HTTP_TIMEOUT_ENV_VARS):
+            value = os.environ.get(env_var_name)
+            if value is not None:
+                try:
+                    timeout[index] = float(value)
+                except ValueError:
+                    raise DetailedValueError(
+                        f"Invalid value of environment variable {env_var_name}",
+                        {env_var_name: value},
+                    )
+    elif not isinstance(timeout, (tuple, list)):
+        timeout = (timeout, timeout)
+    connect_timeout, read_timeout = timeout
+    remaining = get_remaining_time()
+    if remaining is not None:
+        check_deadline(operation)
+        connect_timeout = min(connect_timeout, remaining)
+        read_timeout = min(read_timeout, remaining)
+    return connect_timeout, read_timeout
+
+
+def get_http_session(base_url):
+    """
+    Returns the shared requests session for base_url, creating it if needed.
+    Sessions are safe to use from multiple threads.
+    """
+    try:
+        return _HTTP_SESSIONS[base_url]
+    except KeyError:
+        pass
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _HTTP_SESSIONS_LOCK:
+        if base_url not in _HTTP_SESSIONS:
+            pool_size = int(
+                os.environ.get("THISCOVERY_HTTP_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE)
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _HTTP_SESSIONS[base_url] = session
+        return _HTTP_SESSIONS[base_url]
 
 
-# endregion
+def close_http_sessions():
+    """
+    Closes all shared requests sessions and their pooled connections
+    """
+    with _HTTP_SESSIONS_LOCK:
+        for session in _HTTP_SESSIONS.values():
+            session.close()
+        _HTTP_SESSIONS.clear()
 
 
-# region Secrets processing
-DEFAULT_AWS_REGION = "eu-west-1"
+def get_http_connection_stats():
+    """
+    Returns:
+        Dict mapping each base url with a shared session to the number of requests
+        sent, connections opened (each one a TCP and TLS handshake) and requests that
+        reused an already open connection
+    """
+    stats = dict()
+    with _HTTP_SESSIONS_LOCK:
+        sessions = dict(_HTTP_SESSIONS)
+    for base_url, session in sessions.items():
+        requests_sent = 0
+        connections_opened = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections_opened += pool.num_connections
+        stats[base_url] = {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "connections_reused": max(requests_sent - connections_opened, 0),
+        }
+    return stats
 
 
-def get_aws_region():
-    try:
-        region = os.environ["AWS_REGION"]
-    except KeyError:
-        region = DEFAULT_AWS_REGION
-    return region
+class HttpRetryPolicy:
+    """
+    Retry policy applied by aws_request to transient failures: responses with a status
+    code in retry_statuses, connection errors and timeouts.
+
+    Only idempotent methods are retried by default; pass retry_non_idempotent=True
+    (or retry=True to aws_request) to also retry e.g. POST. Delays grow exponentially
+    with full jitter, except that a Retry-After header sent by the server is honoured.
+    No retry is attempted if it would take the whole call over max_total_seconds, or
+    past the deadline of the current context (see set_deadline).
+    """
 
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+    RETRY_STATUSES = (
+        HTTPStatus.TOO_MANY_REQUESTS,
+        HTTPStatus.BAD_GATEWAY,
+        HTTPStatus.SERVICE_UNAVAILABLE,
+        HTTPStatus.GATEWAY_TIMEOUT,
+    )
 
-def get_aws_namespace():
-    try:
-        secrets_namespace = os.environ["SECRETS_NAMESPACE"]
-    except KeyError:
-        raise DetailedValueError(
-            "SECRETS_NAMESPACE environment variable not defined", {}
+    def __init__(
+        self,
+        max_attempts=None,
+        backoff_base=0.2,
+        backoff_max=5,
+        max_total_seconds=None,
+        retry_statuses=None,
+        retry_non_idempotent=False,
+    ):
+        """
+        Args:
+            max_attempts (int): including the first attempt; defaults to
+                    THISCOVERY_HTTP_MAX_ATTEMPTS environment variable or 3. Use 1 to disable retries
+            backoff_base (float): seconds; upper bound of the first delay
+            backoff_max (float): seconds; upper bound of any computed delay
+            max_total_seconds (float): bound on the total time spent on a call, including
+                    retries; defaults to THISCOVERY_HTTP_RETRY_MAX_SECONDS environment variable or 20
+            retry_statuses (iterable): status codes to retry
+            retry_non_idempotent (bool): if True, retry all methods
+        """
+        if max_attempts is None:
+            max_attempts = int(os.environ.get("THISCOVERY_HTTP_MAX_ATTEMPTS", 3))
+        if max_total_seconds is None:
+            max_total_seconds = float(
+                os.environ.get("THISCOVERY_HTTP_RETRY_MAX_SECONDS", 20)
+            )
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_total_seconds = max_total_seconds
+        self.retry_statuses = set(retry_statuses or self.RETRY_STATUSES)
+        self.retry_non_idempotent = retry_non_idempotent
+
+    def allows_method(self, method):
+        return self.retry_non_idempotent or method.upper() in self.IDEMPOTENT_METHODS
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Args:
+            attempt (int): number of the attempt that has just failed (1 for the first)
+            retry_after (str): value of the Retry-After header of the failed response, if any
+
+        Returns:
+            Seconds to wait before the next attempt
+        """
+        retry_after_seconds = self.parse_retry_after(retry_after)
+        if retry_after_seconds is not None:
+            return retry_after_seconds
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
         )
 
-    if running_unit_tests():
+    def can_retry(self, attempt, started_at, delay):
+        """
+        Args:
+            attempt (int): number of the attempt that has just failed
+            started_at (float): time.monotonic() value when the call started
+            delay (float): seconds to wait before the next attempt
+        """
+        elapsed = time.monotonic() - started_at
+        remaining = get_remaining_time()
+        return (
+            (attempt < self.max_attempts)
+            and (elapsed + delay <= self.max_total_seconds)
+            and ((remaining is None) or (delay < remaining))
+        )
+
+    @staticmethod
+    def parse_retry_after(retry_after):
+        """
+        Returns:
+            Seconds to wait according to a Retry-After header (delay-seconds or
+            HTTP-date format), or None if the header is missing or invalid
+        """
+        if not retry_after:
+            return None
         try:
-            secrets_namespace = os.environ["UNIT_TEST_NAMESPACE"]
-        except KeyError:
-            raise DetailedValueError(
-                "UNIT_TEST_NAMESPACE environment variable not defined", {}
-            )
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        from email.utils import parsedate_to_datetime
 
-    return secrets_namespace
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(
+            (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds(), 0
+        )
 
 
-def get_environment_name():
-    namespace = get_aws_namespace()
-    # strip leading and trailing '/' chars
-    return namespace[1:-1]
+# Policy used by aws_request unless a retry_policy is passed to it; can be replaced
+DEFAULT_HTTP_RETRY_POLICY = HttpRetryPolicy()
 
+_HTTP_RETRY_STATS_LOCK = threading.Lock()
+_HTTP_RETRY_STATS = {
+    "attempts": 0,
+    "retries": 0,
+    "retried_statuses": dict(),
+    "retried_errors": dict(),
+    "exhausted": 0,
+}
 
-def get_secret(secret_name, namespace_override=None):
-    logger = get_logger()
-    # need to prepend secret name with namespace...
-    profile = None
-    if namespace_override is None:
-        namespace = get_aws_namespace()
-    else:
-        namespace = namespace_override
-        if not running_on_aws():
-            try:
-                profile_map_json = os.environ["THISCOVERY_PROFILE_MAP"]
-            except KeyError:
-                raise DetailedValueError(
-                    "Environment variable THISCOVERY_PROFILE_MAP not set", details={}
-                )
-            profile_map = json.loads(profile_map_json)
-            profile_key = namespace2name(namespace_override)
-            try:
-                profile = profile_map[profile_key]
-            except KeyError:
-                raise DetailedValueError(
-                    f"Environment variable THISCOVERY_PROFILE_MAP does not include key {profile_key}",
-                    details={"profile_map": profile_map},
-                )
 
-    if namespace is not None:
-        secret_name = namespace + secret_name
+def _record_http_retry_stat(name, key=None):
+    with _HTTP_RETRY_STATS_LOCK:
+        if key is None:
+            _HTTP_RETRY_STATS[name] += 1
+        else:
+            counts = _HTTP_RETRY_STATS[name]
+            counts[key] = counts.get(key, 0) + 1
 
-    logger.info("get_aws_secret: " + secret_name)
 
-    secret = None
-    client = SecretsManager(profile_name=profile)
+def get_http_retry_stats():
+    """
+    Returns:
+        Dict of aws_request attempts, retries, retries by status code and by error
+        class, and calls that failed after exhausting their retry policy
+    """
+    with _HTTP_RETRY_STATS_LOCK:
+        return {
+            k: dict(v) if isinstance(v, dict) else v
+            for k, v in _HTTP_RETRY_STATS.items()
+        }
 
-    try:
-        get_secret_value_response = client.get_secret_value(secret_name)
-        # logger.info('get_aws_secret:secret retrieved')
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            logger.error("The requested secret " + secret_name + " was not found")
-        elif e.response["Error"]["Code"] == "InvalidRequestException":
-            logger.error("The request was invalid due to:" + str(e))
-        elif e.response["Error"]["Code"] == "InvalidParameterException":
-            logger.error("The request had invalid params:" + str(e))
-        else:
-            logger.error("An unexpected exception occurred:" + str(e), exc_info=True)
-        raise
-    except:
-        logger.error(sys.exc_info()[0])
-    else:
-        # logger.info('get_aws_secret:secret about to decode')
-        # Decrypted secret using the associated KMS CMK
-        # Depending on whether the secret was a string or binary, one of these fields will be populated
-        if "SecretString" in get_secret_value_response:
-            secret = get_secret_value_response["SecretString"]
-        else:
-            binary_secret_data = get_secret_value_response["SecretBinary"]
-        # logger.info('get_aws_secret:secret decoded')
-        # logger.info('secret:' + secret)
 
-        secret = json.loads(secret)
-    finally:
-        return secret
+def reset_http_retry_stats():
+    with _HTTP_RETRY_STATS_LOCK:
+        for k, v in _HTTP_RETRY_STATS.items():
+            _HTTP_RETRY_STATS[k] = dict() if isinstance(v, dict) else 0
 
 
-# endregion
+def _response_dict(status_code, body, headers, include_headers):
+    response = {"statusCode": status_code, "body": body}
+    if include_headers:
+        response["headers"] = {k.lower(): v for k, v in headers.items()}
+    return response
 
 
-# region decorators
-def api_error_handler(func):
+def aws_request(
+    method,
+    endpoint_url,
+    base_url,
+    params=None,
+    data=None,
+    aws_api_key=None,
+    retry_policy=None,
+    retry=None,
+    extra_headers=None,
+    include_headers=False,
+    timeout=None,
+):
     """
-    Error handler decorator for thiscovery API endpoints.
-    Ensures an AWS lambda function will complete successfully
-    and return a response.
-
-    Use with lambda_wrapper as the outer decorator. E.g.:
-        @lambda_wrapper
-        @api_error_handler
-        def decorated_function():
+    Calls a thiscovery API endpoint, retrying transient failures according to retry_policy
+
+    Args:
+        method (str): HTTP method
+        endpoint_url (str): e.g. v1/user
+        base_url (str): e.g. https://staging-api.thiscovery.org/
+        params (dict): query parameters
+        data (str): request body
+        aws_api_key (str): defaults to the key stored in the aws-connection secret
+        retry_policy (HttpRetryPolicy): defaults to DEFAULT_HTTP_RETRY_POLICY
+        retry (bool): if True, retry even if method is not idempotent; if False, never retry
+        extra_headers (dict): headers to send in addition to Content-Type and x-api-key
+        include_headers (bool): if True, also return the response headers, with
+                lowercase names, under the key "headers"
+        timeout (float or tuple): seconds, or (connect, read) seconds, for each
+                attempt; see get_http_timeout
+
+    Returns:
+        Dict containing the statusCode and body of the response
     """
+    import requests
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        correlation_id = args[0]["correlation_id"]
+    full_url = base_url + endpoint_url
+    headers = {"Content-Type": "application/json"}
+
+    if aws_api_key is None:
+        headers["x-api-key"] = get_secret("aws-connection")["aws-api-key"]
+    else:
+        headers["x-api-key"] = aws_api_key
+    if extra_headers:
+        headers.update(extra_headers)
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_HTTP_RETRY_POLICY
+    if retry is None:
+        retry = retry_policy.allows_method(method)
+
+    host = urlsplit(base_url).netloc
+    rate_limiter_key = f"thiscovery-api:{host}"
+    circuit_breaker = get_circuit_breaker(host)
+    started_at = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        check_deadline(full_url)
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        _record_http_retry_stat("attempts")
+        rate_limit(rate_limiter_key)
+        # only now, as waiting for the rate limiter uses up time left
+        attempt_timeout = get_http_timeout(timeout, full_url)
+        attempt_started_at = time.monotonic()
         try:
-            return func(*args, **kwargs)
-        except DeliberateError as err:
-            error_message = err.args[0]
-            return {
-                "statusCode": HTTPStatus.METHOD_NOT_ALLOWED,
-                "body": error_as_response_body(error_message, correlation_id),
-            }
-        except DuplicateInsertError as err:
-            return log_exception_and_return_edited_api_response(
-                err, HTTPStatus.CONFLICT, logger, correlation_id
-            )
-        except ObjectDoesNotExistError as err:
-            return log_exception_and_return_edited_api_response(
-                err, HTTPStatus.NOT_FOUND, logger, correlation_id
+            response = get_http_session(base_url).request(
+                method=method,
+                url=full_url,
+                params=params,
+                headers=headers,
+                data=data,
+                timeout=attempt_timeout,
             )
-        except (
-            PatchAttributeNotRecognisedError,
-            PatchOperationNotSupportedError,
-            PatchInvalidJsonError,
-            DetailedIntegrityError,
-            DetailedValueError,
-        ) as err:
-            return log_exception_and_return_edited_api_response(
-                err, HTTPStatus.BAD_REQUEST, logger, correlation_id
+        except (requests.ConnectionError, requests.Timeout) as err:
+            record_outbound_call(time.monotonic() - attempt_started_at)
+            _record_circuit_breaker_outcome(circuit_breaker, failed=True)
+            retry_reason = type(err).__name__
+            delay = retry_policy.get_delay(attempt)
+            if not (retry and retry_policy.can_retry(attempt, started_at, delay)):
+                if retry:
+                    _record_http_retry_stat("exhausted")
+                raise
+            _record_http_retry_stat("retried_errors", retry_reason)
+        else:
+            record_outbound_call(time.monotonic() - attempt_started_at)
+            _record_circuit_breaker_outcome(
+                circuit_breaker,
+                failed=response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR,
             )
-        except Exception as err:
-            return log_exception_and_return_edited_api_response(
-                err, HTTPStatus.INTERNAL_SERVER_ERROR, logger, correlation_id
+            if not (retry and response.status_code in retry_policy.retry_statuses):
+                return _response_dict(
+                    response.status_code,
+                    response.text,
+                    response.headers,
+                    include_headers,
+                )
+            retry_reason = response.status_code
+            delay = retry_policy.get_delay(
+                attempt, retry_after=response.headers.get("Retry-After")
             )
+            if not retry_policy.can_retry(attempt, started_at, delay):
+                _record_http_retry_stat("exhausted")
+                return _response_dict(
+                    response.status_code,
+                    response.text,
+                    response.headers,
+                    include_headers,
+                )
+            _record_http_retry_stat("retried_statuses", response.status_code)
 
-    return wrapper
-
-
-def lambda_wrapper(func):
-    """
-    Decorator for thiscovery AWS lambdas. Logs the input and
-    output of the decorated lambda.
-    """
-
-    @functools.wraps(func)
-    def thiscovery_lambda_wrapper(*args, **kwargs):
-        logger = get_logger()
-
-        # check if the lambda event dict includes a correlation id; if it does not, add one and pass it to the wrapped lambda
-        # also add a logger to the event dict
-        event = args[0]
-        correlation_id = get_correlation_id(event)
-        event["correlation_id"] = correlation_id
-        event["logger"] = logger
-        updated_args = (event, *args[1:])
-        logger.info(
-            "Input event",
-            extra={
-                "decorated func module": func.__module__,
-                "decorated func name": func.__name__,
-                "event": event,
-                "correlation_id": correlation_id,
-            },
-        )
-        result = func(*updated_args, **kwargs)
-        logger.info(
-            FUNCTION_RESULT_STR,
+        _record_http_retry_stat("retries")
+        get_logger().warning(
+            "Retrying thiscovery API call",
             extra={
-                "decorated func module": func.__module__,
-                "decorated func name": func.__name__,
-                "result": result,
-                "func args": args,
-                "func kwargs": kwargs,
-                "correlation_id": correlation_id,
+                "method": method,
+                "url": full_url,
+                "attempt": attempt,
+                "reason": retry_reason,
+                "delay": delay,
             },
         )
-        return result
-
-    return thiscovery_lambda_wrapper
-
+        time.sleep(delay)
+
+
+async def async_aws_request(
+    http_session,
+    method,
+    endpoint_url,
+    base_url,
+    params=None,
+    data=None,
+    aws_api_key=None,
+    retry_policy=None,
+    retry=None,
+    extra_headers=None,
+    include_headers=False,
+    timeout=None,
+):
+    """
+    asyncio equivalent of aws_request, sending the request through http_session
 
-# endregion
+    Args:
+        http_session (aiohttp.ClientSession): session whose connector bounds the
+                number of connections in use
+        other args: see aws_request
 
+    Returns:
+        Dict containing the statusCode and body of the response
+    """
+    import asyncio
+    import aiohttp
 
-# region aws api requests
-def aws_request(
-    method, endpoint_url, base_url, params=None, data=None, aws_api_key=None
-):
     full_url = base_url + endpoint_url
     headers = {"Content-Type": "application/json"}
 
@@ -814,44 +3960,218 @@ def aws_request(
         headers["x-api-key"] = get_secret("aws-connection")["aws-api-key"]
     else:
         headers["x-api-key"] = aws_api_key
+    if extra_headers:
+        headers.update(extra_headers)
+
+    if params:
+        # unlike requests, aiohttp does not drop parameters whose value is None
+        params = {k: v for k, v in params.items() if v is not None}
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_HTTP_RETRY_POLICY
+    if retry is None:
+        retry = retry_policy.allows_method(method)
+
+    host = urlsplit(base_url).netloc
+    rate_limiter_key = f"thiscovery-api:{host}"
+    circuit_breaker = get_circuit_breaker(host)
+    started_at = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        check_deadline(full_url)
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        _record_http_retry_stat("attempts")
+        await rate_limit_async(rate_limiter_key)
+        # only now, as waiting for the rate limiter uses up time left
+        connect_timeout, read_timeout = get_http_timeout(timeout, full_url)
+        attempt_started_at = time.monotonic()
+        try:
+            async with http_session.request(
+                method,
+                full_url,
+                params=params,
+                headers=headers,
+                data=data,
+                timeout=aiohttp.ClientTimeout(
+                    total=get_remaining_time(),
+                    sock_connect=connect_timeout,
+                    sock_read=read_timeout,
+                ),
+            ) as response:
+                status_code = response.status
+                body = await response.text()
+                response_headers = response.headers
+                retry_after = response_headers.get("Retry-After")
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+            record_outbound_call(time.monotonic() - attempt_started_at)
+            _record_circuit_breaker_outcome(circuit_breaker, failed=True)
+            retry_reason = type(err).__name__
+            delay = retry_policy.get_delay(attempt)
+            if not (retry and retry_policy.can_retry(attempt, started_at, delay)):
+                if retry:
+                    _record_http_retry_stat("exhausted")
+                raise
+            _record_http_retry_stat("retried_errors", retry_reason)
+        else:
+            record_outbound_call(time.monotonic() - attempt_started_at)
+            _record_circuit_breaker_outcome(
+                circuit_breaker,
+                failed=status_code >= HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+            if not (retry and status_code in retry_policy.retry_statuses):
+                return _response_dict(
+                    status_code, body, response_headers, include_headers
+                )
+            retry_reason = status_code
+            delay = retry_policy.get_delay(attempt, retry_after=retry_after)
+            if not retry_policy.can_retry(attempt, started_at, delay):
+                _record_http_retry_stat("exhausted")
+                return _response_dict(
+                    status_code, body, response_headers, include_headers
+                )
+            _record_http_retry_stat("retried_statuses", status_code)
 
-    try:
-        response = requests.request(
-            method=method,
-            url=full_url,
-            params=params,
-            headers=headers,
-            data=data,
-        )
-        return {"statusCode": response.status_code, "body": response.text}
-    except Exception as err:
-        raise err
+        _record_http_retry_stat("retries")
+        get_logger().warning(
+            "Retrying thiscovery API call",
+            extra={
+                "method": method,
+                "url": full_url,
+                "attempt": attempt,
+                "reason": retry_reason,
+                "delay": delay,
+            },
+        )
+        await asyncio.sleep(delay)
 
 
-def aws_get(endpoint_url, base_url, params=None):
+def aws_get(endpoint_url, base_url, params=None, **kwargs):
     return aws_request(
-        method="GET", endpoint_url=endpoint_url, base_url=base_url, params=params
+        method="GET",
+        endpoint_url=endpoint_url,
+        base_url=base_url,
+        params=params,
+        **kwargs,
     )
 
 
-def aws_post(endpoint_url, base_url, params=None, request_body=None):
+def aws_post(endpoint_url, base_url, params=None, request_body=None, **kwargs):
     return aws_request(
         method="POST",
         endpoint_url=endpoint_url,
         base_url=base_url,
         params=params,
         data=request_body,
+        **kwargs,
+    )
+
+
+def aws_patch(endpoint_url, base_url, request_body, **kwargs):
+    return aws_request(
+        method="PATCH",
+        endpoint_url=endpoint_url,
+        base_url=base_url,
+        data=request_body,
+        **kwargs,
     )
 
 
-def aws_patch(endpoint_url, base_url, request_body):
+def aws_delete(endpoint_url, base_url, **kwargs):
     return aws_request(
-        method="PATCH", endpoint_url=endpoint_url, base_url=base_url, data=request_body
+        method="DELETE", endpoint_url=endpoint_url, base_url=base_url, **kwargs
     )
 
 
-def aws_delete(endpoint_url, base_url):
-    return aws_request(method="DELETE", endpoint_url=endpoint_url, base_url=base_url)
+# endregion
+
+
+# region prewarm
+def prewarm(
+    clients=None, secrets=None, parameters=None, base_urls=None, countries=False
+):
+    """
+    Eagerly performs initialisation work that would otherwise slow down the first
+    request handled by a lambda. Call it at module scope of the lambda handler file,
+    so that the work happens during the INIT phase. E.g.:
+
+        PREWARMED = utils.prewarm(
+            clients=["events", {"service_name": "dynamodb", "client_type": "resource"}],
+            secrets=["aws-connection"],
+            base_urls=["https://staging-api.thiscovery.org/"],
+        )
+
+    Failed steps are logged and skipped, so that prewarming never prevents a lambda
+    from starting.
+
+    Args:
+        clients (list): AWS service names (e.g. "sns") or dicts of BaseClient kwargs;
+                the boto3 clients are built and stored in the client cache
+        secrets (list): secret names to resolve (in one batched call) with get_secrets
+        parameters (list): SSM parameter names to resolve with ssm_utilities.SsmClient
+        base_urls (list): base urls of HTTP APIs (e.g. thiscovery APIs) to open
+                keep-alive connections to
+        countries (bool): if True, load countries.json
+
+    Returns:
+        Dict containing the resolved "secrets" and "parameters", and the "timings" in
+        milliseconds of each step
+    """
+    logger = get_logger()
+    result = {"secrets": dict(), "parameters": dict(), "timings": dict()}
+
+    def run_step(step_name, step_function):
+        start_time = get_start_time()
+        try:
+            return step_function()
+        except Exception as err:
+            logger.warning(
+                f"Prewarm step {step_name} failed",
+                extra={"error": repr(err), "traceback": traceback.format_exc()},
+            )
+        finally:
+            result["timings"][step_name] = get_elapsed_ms(start_time)
+
+    def open_http_connection(base_url):
+        # any response will do; we only want the pooled connection
+        get_http_session(base_url).head(base_url, timeout=5)
+
+    def resolve_parameter(parameter_name):
+        from thiscovery_lib.ssm_utilities import SsmClient
+
+        return SsmClient().get_parameter(parameter_name)
+
+    def load_countries():
+        from thiscovery_lib.countries_utilities import load_countries
+
+        load_countries()
+
+    for client in clients or list():
+        if isinstance(client, str):
+            client = {"service_name": client}
+        step_name = f"client:{client['service_name']}"
+        run_step(step_name, functools.partial(BaseClient, **client))
+
+    if secrets:
+        result["secrets"] = (
+            run_step("secrets", functools.partial(get_secrets, secrets)) or dict()
+        )
+
+    for parameter_name in parameters or list():
+        result["parameters"][parameter_name] = run_step(
+            f"parameter:{parameter_name}",
+            functools.partial(resolve_parameter, parameter_name),
+        )
+
+    for base_url in base_urls or list():
+        run_step(f"http:{base_url}", functools.partial(open_http_connection, base_url))
+
+    if countries:
+        run_step("countries", load_countries)
+
+    logger.info("Prewarm completed", extra={"timings": result["timings"]})
+    return result
 
 
 # endregion